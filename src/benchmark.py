@@ -0,0 +1,461 @@
+import ROOT
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from kernels import load_kernels
+from skimming_utils import get_lumi_ranges, init_lumi_mask, declare_vetomap, \
+        init_vetomap_bitmap, validate_vetomap_bitmap, declare_jec, print_jec_cache_report
+
+def get_correction_info(args):
+    with open(args.correction_json) as f:
+        return json.load(f)[args.correction_key]
+
+def random_jets(args, n):
+    rng = np.random.default_rng(args.seed)
+    eta = rng.uniform(-5.0, 5.0, n).astype(np.float32)
+    phi = rng.uniform(-np.pi, np.pi, n).astype(np.float32)
+    return eta, phi
+
+def bench_lumi_mask(args):
+    """
+    Compare the nlohmann::json based golden JSON lookup used previously
+    against the compiled LumiMask on random (run, lumisection) pairs.
+    """
+    ROOT.gInterpreter.Declare(
+"""
+#ifndef LEGACY_JSONFILTER
+#define LEGACY_JSONFILTER
+
+#include <nlohmann/json.hpp>
+#include <fstream>
+#include <string>
+
+namespace legacy {
+nlohmann::json filter_json;
+
+void init_json(std::string jsonFile) {
+    std::ifstream f(jsonFile);
+    filter_json = nlohmann::json::parse(f);
+}
+
+bool isGoodLumi(int run, int lumi) {
+   for (auto& lumiRange : filter_json[std::to_string(run)]) {
+       if (lumi >= lumiRange[0] && lumi <= lumiRange[1]) {
+           return true;
+       }
+   }
+
+    return false;
+}
+}
+
+size_t count_legacy(const std::vector<unsigned int>& runs, const std::vector<unsigned int>& lumis) {
+    size_t n = 0;
+    for (size_t i = 0; i < runs.size(); i++) {
+        n += legacy::isGoodLumi(runs[i], lumis[i]);
+    }
+    return n;
+}
+#endif
+"""
+    )
+    load_kernels("kernels")
+    ROOT.gInterpreter.Declare(
+"""
+#ifndef BENCH_LUMIMASK
+#define BENCH_LUMIMASK
+size_t count_mask(const LumiMask& mask, const std::vector<unsigned int>& runs,
+                  const std::vector<unsigned int>& lumis) {
+    size_t n = 0;
+    for (size_t i = 0; i < runs.size(); i++) {
+        n += mask.accept(runs[i], lumis[i]);
+    }
+    return n;
+}
+#endif
+"""
+    )
+
+    start = time.time()
+    ROOT.legacy.init_json(args.golden_json)
+    legacy_init = time.time() - start
+
+    start = time.time()
+    mask = init_lumi_mask(ROOT.LumiMask(), get_lumi_ranges(args.golden_json))
+    mask_init = time.time() - start
+
+    # Sample runs around the certified ones so that both good and bad
+    # lumisections are looked up
+    with open(args.golden_json) as f:
+        golden = json.load(f)
+    good_runs = np.array(sorted(int(r) for r in golden), dtype=np.uint32)
+    max_lumi = max(r[1] for ranges in golden.values() for r in ranges)
+
+    rng = np.random.default_rng(args.seed)
+    runs = rng.choice(good_runs, args.n_lookups)
+    runs[rng.random(args.n_lookups) < 0.1] += 1
+    lumis = rng.integers(1, max_lumi + 1, args.n_lookups, dtype=np.uint32)
+    run_vec = ROOT.std.vector["unsigned int"](runs.tolist())
+    lumi_vec = ROOT.std.vector["unsigned int"](lumis.tolist())
+
+    # Warm up the JIT before timing
+    ROOT.count_legacy(run_vec, lumi_vec)
+    ROOT.count_mask(mask, run_vec, lumi_vec)
+
+    results = {}
+    start = time.time()
+    n_legacy = ROOT.count_legacy(run_vec, lumi_vec)
+    results["legacy"] = {"init_s": legacy_init, "lookup_s": time.time() - start}
+    start = time.time()
+    n_mask = ROOT.count_mask(mask, run_vec, lumi_vec)
+    results["lumi_mask"] = {"init_s": mask_init, "lookup_s": time.time() - start}
+
+    if n_legacy != n_mask:
+        raise RuntimeError(f"LumiMask accepted {n_mask} lookups, legacy filter {n_legacy}")
+
+    for name, result in results.items():
+        result["ns_per_lookup"] = 1e9 * result["lookup_s"] / args.n_lookups
+        print(f"{name}: init {result['init_s']:.3f} s, "
+              f"{result['ns_per_lookup']:.1f} ns/lookup")
+    print(f"Speed-up: {results['legacy']['lookup_s'] / results['lumi_mask']['lookup_s']:.1f}x "
+          f"({n_mask}/{args.n_lookups} accepted)")
+
+    return results
+
+def bench_vetomap(args):
+    """
+    Jet throughput of the correctionlib vetomap evaluation against the
+    precomputed bitmap, including a dense grid validation of the bitmap.
+    """
+    import correctionlib
+    correctionlib.register_pyroot_binding()
+
+    correction_info = get_correction_info(args)
+    vfile, vset = correction_info["vetomap_path"], correction_info["vetomap_set"]
+
+    declare_vetomap(vfile, vset)
+    start = time.time()
+    if not init_vetomap_bitmap(vfile, vset):
+        raise RuntimeError("Vetomap bitmap could not be built")
+    bitmap_init = time.time() - start
+
+    veval = correctionlib.CorrectionSet.from_file(vfile)[vset]
+    mismatches = validate_vetomap_bitmap(veval, n_points=2000)
+
+    eta_np, phi_np = random_jets(args, args.n_lookups)
+    eta, phi = ROOT.VecOps.AsRVec(eta_np), ROOT.VecOps.AsRVec(phi_np)
+
+    # Warm up the JIT before timing
+    warmup = ROOT.VecOps.AsRVec(eta_np[:1000]), ROOT.VecOps.AsRVec(phi_np[:1000])
+    ROOT.get_veto(*warmup)
+    ROOT.get_veto_bitmap(*warmup)
+
+    results = {"validation_mismatches": mismatches}
+    start = time.time()
+    ROOT.get_veto(eta, phi)
+    results["correctionlib"] = {"lookup_s": time.time() - start}
+    start = time.time()
+    ROOT.get_veto_bitmap(eta, phi)
+    results["bitmap"] = {"init_s": bitmap_init, "lookup_s": time.time() - start}
+
+    for name in ["correctionlib", "bitmap"]:
+        result = results[name]
+        result["jets_per_s"] = args.n_lookups / result["lookup_s"]
+        print(f"{name}: {result['jets_per_s']:.3g} jets/s")
+    print(f"Speed-up: {results['correctionlib']['lookup_s'] / results['bitmap']['lookup_s']:.1f}x, "
+          f"{mismatches} mismatches on a 2000x2000 grid")
+
+    return results
+
+def bench_jec(args):
+    """
+    Jet throughput of the per-jet JEC evaluation against the batched
+    evaluation, with and without the memoization cache.
+    """
+    import correctionlib
+    correctionlib.register_pyroot_binding()
+
+    correction_info = get_correction_info(args)
+    declare_jec(correction_info["jec_path"], correction_info["jec_stack"])
+    ROOT.gInterpreter.Declare(
+"""
+#ifndef BENCH_JEC
+#define BENCH_JEC
+// Evaluate the corrections event by event, events being given as offsets
+// into flat jet arrays
+double run_jec_events(int mode, const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta,
+                      const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi,
+                      const ROOT::VecOps::RVec<float>& rho, const std::vector<size_t>& offsets) {
+    double sum = 0.0;
+    for (size_t ev = 0; ev + 1 < offsets.size(); ev++) {
+        const size_t n = offsets[ev + 1] - offsets[ev];
+        ROOT::VecOps::RVec<float> ev_pt(const_cast<float*>(pt.data()) + offsets[ev], n);
+        ROOT::VecOps::RVec<float> ev_eta(const_cast<float*>(eta.data()) + offsets[ev], n);
+        ROOT::VecOps::RVec<float> ev_area(const_cast<float*>(area.data()) + offsets[ev], n);
+        ROOT::VecOps::RVec<float> ev_phi(const_cast<float*>(phi.data()) + offsets[ev], n);
+        if (mode == 0) {
+            sum += ROOT::VecOps::Sum(get_correction(ev_pt, ev_eta, rho[ev], ev_area, ev_phi));
+        } else {
+            sum += ROOT::VecOps::Sum(get_correction_batched(ev_pt, ev_eta, rho[ev], ev_area, ev_phi));
+        }
+    }
+    return sum;
+}
+#endif
+"""
+    )
+
+    # Jets drawn from a steeply falling spectrum, so that the cache sees a
+    # realistic share of repeated bins
+    rng = np.random.default_rng(args.seed)
+    n_jets = rng.poisson(8, args.n_events) + 1
+    offsets = np.concatenate([[0], np.cumsum(n_jets)])
+    eta, phi = random_jets(args, offsets[-1])
+    pt = (15.0 * (1.0 + rng.pareto(3.0, offsets[-1]))).astype(np.float32)
+    area = rng.normal(0.5, 0.03, offsets[-1]).astype(np.float32)
+    rho = rng.uniform(5.0, 40.0, args.n_events).astype(np.float32)
+    columns = [ROOT.VecOps.AsRVec(x) for x in (pt, eta, area, phi, rho)]
+    offsets = ROOT.std.vector["size_t"](offsets.tolist())
+
+    results = {}
+    for name, mode, cache_size in [("per_jet", 0, 0), ("batched", 1, 0),
+                                   ("batched_cached", 1, args.jec_cache_size)]:
+        ROOT.jec_cache_config.capacity = cache_size
+        start = time.time()
+        ROOT.run_jec_events(mode, *columns, offsets)
+        results[name] = {"jets_per_s": len(pt) / (time.time() - start)}
+        print(f"{name}: {results[name]['jets_per_s']:.3g} jets/s")
+    results["batched_cached"]["cache"] = print_jec_cache_report()
+
+    return results
+
+def bench_jet_kernel(args):
+    """
+    Events/s of the chain of jet correction columns against the fused
+    kernel on the same NanoAOD files, and the largest differences between
+    the jets and type-1 MET they produce, both with the MET propagation
+    """
+    import correctionlib
+    correctionlib.register_pyroot_binding()
+    from skim import jet_columns
+    from skimming_utils import apply_jet_corrections
+
+    if args.nThreads:
+        ROOT.EnableImplicitMT(args.nThreads)
+
+    correction_info = get_correction_info(args)
+    files = ROOT.std.vector["string"](args.filelist.split(","))
+
+    def make_rdf(kernel):
+        rdf = ROOT.RDataFrame("Events", files).Filter("nJet > 0", "nJet > 0")
+        return apply_jet_corrections(rdf, correction_info, jet_columns, kernel, propagate_met=True)
+
+    results = {}
+    checks = {}
+    for kernel in ["chain", "fused"]:
+        rdf = make_rdf(kernel)
+
+        # Use every jet column, so that none of them is skipped
+        columns = [str(col) for col in rdf.GetColumnNames()]
+        used = [col for col in jet_columns + ["Jet_vetoed"] if col in columns]
+        rdf = rdf.Define("used_temp", " + ".join(f"ROOT::VecOps::Sum({col}, 0.0)" for col in used))
+        count = rdf.Count()
+        total = rdf.Sum("used_temp")
+
+        start = time.time()
+        n_events = count.GetValue()
+        total.GetValue()
+        elapsed = time.time() - start
+        results[kernel] = {"events": n_events, "time_s": elapsed, "events_per_s": n_events / elapsed}
+        print(f"{kernel}: {n_events} events in {elapsed:.1f} s, {n_events / elapsed:.3g} events/s")
+
+        check = (make_rdf(kernel).Define("lead_pt_temp", "Jet_pt[0]")
+                 .Define("sum_pt_temp", "ROOT::VecOps::Sum(Jet_pt, 0.0)")
+                 .Define("n_vetoed_temp", "int(ROOT::VecOps::Sum(Jet_vetoed, 0))")
+                 .Define("met_temp", "double(PuppiMET_pt)")
+                 .AsNumpy(["run", "luminosityBlock", "event", "lead_pt_temp", "sum_pt_temp",
+                           "n_vetoed_temp", "met_temp"]))
+        order = np.lexsort((check["event"], check["luminosityBlock"], check["run"]))
+        checks[kernel] = {key: value[order] for key, value in check.items()}
+
+    results["speedup"] = results["fused"]["events_per_s"] / results["chain"]["events_per_s"]
+    for key in ["lead_pt_temp", "sum_pt_temp", "met_temp"]:
+        chain, fused = checks["chain"][key], checks["fused"][key]
+        results[f"max_rel_diff_{key[:-5]}"] = float(np.max(np.abs(fused / chain - 1.0), initial=0.0))
+    results["vetoed_mismatches"] = int(np.count_nonzero(
+        checks["chain"]["n_vetoed_temp"] != checks["fused"]["n_vetoed_temp"]))
+
+    print(f"Speed-up: {results['speedup']:.2f}x, largest relative differences: "
+          f"leading jet pT {results['max_rel_diff_lead_pt']:.1e}, "
+          f"sum jet pT {results['max_rel_diff_sum_pt']:.1e}, "
+          f"type-1 MET {results['max_rel_diff_met']:.1e}, "
+          f"{results['vetoed_mismatches']} events with different vetoed jets")
+
+    return results
+
+# Loads the kernels in a fresh interpreter and calls a function from each,
+# so that the JIT cost of the declare path is included
+STARTUP_SCRIPT = """
+import sys, time
+start = time.time()
+import ROOT
+ROOT.gErrorIgnoreLevel = ROOT.kWarning
+sys.path.insert(0, sys.argv[1])
+from kernels import load_kernels
+load_kernels("kernels")
+ROOT.isGoodLumi(1, 1)
+ROOT.findTagProbeIdxs(*[ROOT.RVec["float"]([1.0])] * 3, ROOT.RVec["int"]([6]))
+if sys.argv[2] == "1":
+    import correctionlib
+    correctionlib.register_pyroot_binding()
+    load_kernels("corrections")
+    ROOT.get_correction_batched(*[ROOT.RVec["float"]()] * 2, 0.0, ROOT.RVec["float"]())
+print(time.time() - start)
+"""
+
+def bench_startup(args):
+    """
+    Startup time of a job loading the C++ kernels: declared to cling, from
+    a freshly compiled library and from the cached library.
+    """
+    try:
+        import correctionlib
+        with_corrections = "1"
+    except ImportError:
+        with_corrections = "0"
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def startup(mode, cache_dir):
+        env = dict(os.environ, J4P_KERNELS=mode, J4P_KERNEL_CACHE=cache_dir)
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, src_dir, with_corrections],
+                             env=env, check=True, capture_output=True, text=True).stdout
+        return float(out.split()[-1])
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results["declare"] = {"startup_s": startup("declare", cache_dir)}
+        results["library_cold"] = {"startup_s": startup("library", cache_dir)}
+        results["library_warm"] = {"startup_s": startup("library", cache_dir)}
+
+    for name, result in results.items():
+        print(f"{name}: {result['startup_s']:.2f} s")
+    print(f"Speed-up: {results['declare']['startup_s'] / results['library_warm']['startup_s']:.1f}x "
+          f"with a cached library")
+
+    return results
+
+# Channel -> (skim trigger list, histogram config, histogram trigger list)
+channel_configs = {
+    "dijet": ("JME_triggers_skim.txt", "JME_histograms.ini", "JME_triggers.txt"),
+    "multijet": ("JME_triggers_skim.txt", "JME_histograms.ini", "JME_triggers.txt"),
+    "zmm": ("ZJET_triggers_skim.txt", "ZJET_histograms.ini", "ZJET_triggers.txt"),
+    "photonjet": ("EGM_triggers_skim.txt", "EGM_histograms.ini", "EGM_triggers.txt"),
+}
+
+def run_timed(command):
+    """
+    Run command and return its wall time in s and peak RSS in MB.
+    """
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.time() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed with exit code {process.returncode}")
+    # ru_maxrss is in kB on Linux
+    return elapsed, usage.ru_maxrss / 1024
+
+def get_output_size(paths):
+    return sum(os.path.getsize(path) for path in paths) / 1024**2
+
+def count_events(paths):
+    chain = ROOT.TChain("Events")
+    for path in paths:
+        chain.Add(path)
+    return chain.GetEntries()
+
+def bench_throughput(args):
+    """
+    End-to-end skim and hist jobs on synthetic NanoAOD for each channel and
+    thread count, each in its own process.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    repo_dir = os.path.dirname(src_dir)
+    main = os.path.join(src_dir, "main.py")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_dir = args.synthetic_dir
+        if synthetic_dir is None:
+            synthetic_dir = os.path.join(tmp_dir, "synthetic")
+            subprocess.run([sys.executable, main, "synthetic", "--out", synthetic_dir,
+                            "--seed", str(args.seed)], check=True)
+        with open(os.path.join(synthetic_dir, "synthetic.json")) as f:
+            synthetic = json.load(f)
+        input_mb = get_output_size(synthetic["files"])
+
+        results = {"n_events": synthetic["n_events"], "input_mb": input_mb}
+        for channel in args.channels.split(","):
+            skim_triggers, hist_config, hist_triggers = channel_configs[channel]
+            results[channel] = {}
+            for n_threads in [int(n) for n in args.threads.split(",")]:
+                out = os.path.join(tmp_dir, f"{channel}_{n_threads}")
+                skim_time, skim_rss = run_timed([sys.executable, main, "skim",
+                    "-fp", synthetic["filelist"], "--is_local",
+                    "--golden_json", synthetic["golden_json"],
+                    "--triggerpath", os.path.join(repo_dir, "data", "triggerlists", skim_triggers),
+                    "--correction_json", synthetic["correction_json"],
+                    "--correction_key", synthetic["correction_key"],
+                    "--channel", channel, "--nThreads", str(n_threads), "--out", out])
+                skim_files = [os.path.join(out, f"J4PSkim_{channel}.root")]
+                n_skimmed = count_events(skim_files)
+
+                hist_time, hist_rss = run_timed([sys.executable, main, "hist",
+                    "-hconf", os.path.join(repo_dir, "data", "histograms", hist_config),
+                    "-fl", ",".join(skim_files), "-loc",
+                    "--triggerpath", os.path.join(repo_dir, "data", "triggerlists", hist_triggers),
+                    "--nThreads", str(n_threads), "--out", out, "--run_tag", channel])
+                hist_files = [os.path.join(out, f) for f in os.listdir(out)
+                              if f.startswith("J4PHists_")]
+
+                results[channel][n_threads] = {
+                    "skim": {"time_s": skim_time, "events_per_s": synthetic["n_events"] / skim_time,
+                             "peak_rss_mb": skim_rss, "output_mb": get_output_size(skim_files),
+                             "n_events_out": n_skimmed},
+                    "hist": {"time_s": hist_time, "events_per_s": n_skimmed / hist_time,
+                             "peak_rss_mb": hist_rss, "output_mb": get_output_size(hist_files)},
+                }
+                for step, result in results[channel][n_threads].items():
+                    print(f"{channel} {step} with {n_threads} threads: "
+                          f"{result['events_per_s']:.0f} events/s, "
+                          f"{result['peak_rss_mb']:.0f} MB peak RSS, "
+                          f"{result['output_mb']:.1f} MB output")
+
+    return results
+
+suites = {
+    "lumi_mask": bench_lumi_mask,
+    "vetomap": bench_vetomap,
+    "jec": bench_jec,
+    "jet_kernel": bench_jet_kernel,
+    "startup": bench_startup,
+    "throughput": bench_throughput,
+}
+
+def run(args):
+    # Shut up ROOT
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+    results = {}
+    for suite in args.suite.split(","):
+        print(f"Running benchmark {suite}")
+        results[suite] = suites[suite](args)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,259 @@
+import ROOT
+import heapq
+import json
+import math
+import os
+import sqlite3
+import time
+
+from processing_utils import file_read_lines
+
+DEFAULT_PATH = os.environ.get("J4P_CATALOG",
+                              os.path.join(os.path.expanduser("~"), ".cache", "dijet_rdf",
+                                           "catalog.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    size INTEGER,
+    entries INTEGER,
+    zip_bytes INTEGER,
+    tot_bytes INTEGER,
+    min_run INTEGER,
+    max_run INTEGER,
+    lumis TEXT,
+    branches TEXT,
+    scanned REAL
+)
+"""
+
+def get_lumi_coverage(runs, lumis):
+    """
+    Compress (run, lumisection) pairs into golden JSON like
+    {run: [[first, last], ...]}.
+    """
+    coverage = {}
+    for run, lumi in sorted(set(zip(runs, lumis))):
+        ranges = coverage.setdefault(str(run), [])
+        if ranges and ranges[-1][1] == lumi - 1:
+            ranges[-1][1] = lumi
+        else:
+            ranges.append([lumi, lumi])
+    return coverage
+
+def stat_file(url):
+    """
+    (mtime, size) of a local or remote file without opening it
+    """
+    stat = ROOT.FileStat_t()
+    if ROOT.gSystem.GetPathInfo(url, stat) != 0:
+        return None
+    return int(stat.fMtime), int(stat.fSize)
+
+def scan_file(url):
+    f = ROOT.TFile.Open(url)
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open {url}")
+
+    events = f.Get("Events")
+    lumis = ROOT.RDataFrame(f.Get("LuminosityBlocks")).AsNumpy(["run", "luminosityBlock"])
+    coverage = get_lumi_coverage(lumis["run"].tolist(), lumis["luminosityBlock"].tolist())
+    runs = [int(run) for run in coverage]
+    info = {
+        "entries": int(events.GetEntries()),
+        "zip_bytes": int(events.GetZipBytes()),
+        "tot_bytes": int(events.GetTotBytes()),
+        "min_run": min(runs) if runs else None,
+        "max_run": max(runs) if runs else None,
+        "lumis": coverage,
+        "branches": sorted(str(b.GetName()) for b in events.GetListOfBranches()),
+    }
+    f.Close()
+    return info
+
+class Catalog:
+    """
+    On-disk cache of per-file metadata (entries, compressed bytes, run and
+    lumisection coverage and branches) keyed by path, and invalidated when
+    the mtime or size of the file changes.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(SCHEMA)
+        self.n_scanned = 0
+
+    def get(self, file, url=None, rescan=False):
+        """
+        Metadata of file, scanned from url (default file) if it is not in
+        the catalog or has changed since it was scanned.
+        """
+        url = url or file
+        stat = stat_file(url)
+        if stat is None:
+            raise OSError(f"Could not stat {url}")
+
+        row = self.connection.execute(
+                "SELECT entries, zip_bytes, tot_bytes, min_run, max_run, lumis, branches "
+                "FROM files WHERE path = ? AND mtime = ? AND size = ?", (file, *stat)).fetchone()
+        if row and not rescan:
+            return {"path": file, "mtime": stat[0], "size": stat[1],
+                    "entries": row[0], "zip_bytes": row[1], "tot_bytes": row[2],
+                    "min_run": row[3], "max_run": row[4],
+                    "lumis": json.loads(row[5]), "branches": json.loads(row[6])}
+
+        info = scan_file(url)
+        self.n_scanned += 1
+        with self.connection:
+            self.connection.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (file, *stat, info["entries"], info["zip_bytes"], info["tot_bytes"],
+                     info["min_run"], info["max_run"], json.dumps(info["lumis"]),
+                     json.dumps(info["branches"]), time.time()))
+        return dict(info, path=file, mtime=stat[0], size=stat[1])
+
+    def lookup(self, files, urls=None, rescan=False):
+        """
+        Metadata of all files, skipping the ones which can not be read
+        """
+        infos = []
+        for file, url in zip(files, urls or files):
+            try:
+                infos.append(self.get(file, url, rescan))
+            except OSError as e:
+                print(f"Catalog: {e}, skipping it")
+        return infos
+
+    def close(self):
+        self.connection.close()
+
+def get_run_range(infos):
+    runs = [(info["min_run"], info["max_run"]) for info in infos if info["min_run"] is not None]
+    if not runs:
+        raise ValueError(f"None of the {len(infos)} catalogued files has lumisections")
+    return min(r[0] for r in runs), max(r[1] for r in runs)
+
+def get_common_branches(infos):
+    """
+    Branches present in all files, ie. readable from a chain of them
+    """
+    if not infos:
+        return set()
+    branches = set(infos[0]["branches"])
+    for info in infos[1:]:
+        branches.intersection_update(info["branches"])
+    return branches
+
+def plan_steps(infos, nsteps, weight="entries"):
+    """
+    Split the files in infos into nsteps steps of similar total weight
+    (entries or zip_bytes) with LPT bin-packing: files heavier than a step
+    are first cut into entry ranges, then the heaviest remaining unit goes
+    to the lightest step. The plan only depends on the catalog, so each job
+    of a campaign computes the same plan.
+
+    Returns a list of steps, each a list of (file, begin, end) units.
+    """
+    total = sum(info[weight] for info in infos)
+    target = total / nsteps
+
+    units = []
+    for info in infos:
+        n = info["entries"]
+        n_chunks = min(max(1, math.ceil(info[weight] / target)), n) if target > 0 else 1
+        for k in range(n_chunks):
+            begin, end = n * k // n_chunks, n * (k + 1) // n_chunks
+            units.append((info[weight] * (end - begin) / max(n, 1), info["path"], begin, end))
+    units.sort(key=lambda unit: -unit[0])
+
+    steps = [[] for _ in range(nsteps)]
+    loads = [(0.0, i) for i in range(nsteps)]
+    for w, file, begin, end in units:
+        load, i = heapq.heappop(loads)
+        steps[i].append((file, begin, end))
+        heapq.heappush(loads, (load + w, i))
+
+    return steps
+
+def get_step_ranges(units):
+    """
+    Files of a step sorted by path, a dict of file -> [(begin, end), ...]
+    entry ranges and the set of files whose first entries are in the step.
+    """
+    files = []
+    entry_ranges = {}
+    first = set()
+    for file, begin, end in sorted(units):
+        if file not in entry_ranges:
+            files.append(file)
+            entry_ranges[file] = []
+        ranges = entry_ranges[file]
+        if ranges and ranges[-1][1] == begin:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((begin, end))
+        if begin == 0:
+            first.add(file)
+    return files, entry_ranges, first
+
+def get_step_lumis(files, step_files, get_lumis):
+    """
+    (run, ls) pairs counting for the step reading step_files out of files.
+    Lumisections can be split between files of different steps, so each of
+    them only counts for the step with the first file of files containing
+    it. get_lumis returns the set of (run, ls) of a file.
+    """
+    remaining = set(step_files)
+    seen = set()
+    lumis = set()
+    for file in files:
+        if not remaining:
+            break
+        file_lumis = get_lumis(file)
+        if file in remaining:
+            lumis |= file_lumis - seen
+            remaining.discard(file)
+        seen |= file_lumis
+    return lumis
+
+def print_step_plan(steps, infos, weight, step):
+    by_path = {info["path"]: info for info in infos}
+    loads = [sum(by_path[file][weight] * (end - begin) / max(by_path[file]["entries"], 1)
+                 for file, begin, end in units) for units in steps]
+    mean = sum(loads) / len(loads)
+    n_split = len({file for units in steps for file, begin, end in units
+                   if end - begin < by_path[file]["entries"]})
+    print(f"Step {step}/{len(steps)}: {len(steps[step])} units, {loads[step]:.0f} {weight} "
+          f"(mean {mean:.0f}, max {max(loads) / mean if mean > 0 else 0:.2f}x mean), "
+          f"{n_split} files split between steps")
+
+def run(args):
+    # Shut up ROOT
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+    files = []
+    if args.filelist:
+        files = [s.strip() for s in args.filelist.split(",")]
+    else:
+        for path in [p.strip() for p in args.filepaths.split(",")]:
+            files.extend(file_read_lines(path, find_ROOT=True))
+
+    urls = files if args.is_local else [f"root://cms-xrd-global.cern.ch/{file}" for file in files]
+
+    start = time.time()
+    catalog = Catalog(args.catalog)
+    infos = catalog.lookup(files, urls, args.rescan)
+    catalog.close()
+    print(f"Catalog {args.catalog}: {len(infos)}/{len(files)} files, "
+          f"scanned {catalog.n_scanned} in {time.time() - start:.1f} s")
+
+    if any(info["min_run"] is not None for info in infos):
+        min_run, max_run = get_run_range(infos)
+        # Lumisections can be split between files
+        n_lumis = len({(run, lumi) for info in infos for run, ranges in info["lumis"].items()
+                       for first, last in ranges for lumi in range(first, last + 1)})
+        print(f"{sum(info['entries'] for info in infos)} events, "
+              f"{sum(info['size'] for info in infos) / 1024**3:.2f} GB, "
+              f"{n_lumis} lumisections in runs {min_run}-{max_run}")
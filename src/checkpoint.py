@@ -0,0 +1,72 @@
+import ROOT
+import json
+import os
+
+def read_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(path, manifest):
+    """
+    Write the manifest atomically, so that a job killed while writing it
+    leaves the previous version in place.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+def probe_file(url):
+    """
+    Error message if url can not be opened or has no Events tree, else None
+    """
+    f = ROOT.TFile.Open(url)
+    if not f or f.IsZombie():
+        return f"could not open {url}"
+    events = f.Get("Events")
+    f.Close()
+    if not events:
+        return f"no Events tree in {url}"
+    return None
+
+def fix_cutflow(path):
+    """
+    Recompute the efficiencies of the cutflow histograms in path after the
+    pass and all histograms of several files have been summed.
+    """
+    f = ROOT.TFile.Open(path, "UPDATE")
+    pass_hist, all_hist = f.Get("pass"), f.Get("all")
+    if not pass_hist or not all_hist:
+        f.Close()
+        return
+    eff_hist = pass_hist.Clone("eff")
+    eff_hist.SetTitle("eff")
+    cum_eff_hist = pass_hist.Clone("cum_eff")
+    cum_eff_hist.SetTitle("cum_eff")
+    n_all = all_hist.GetBinContent(1)
+    for i in range(1, pass_hist.GetNbinsX() + 1):
+        n_pass, n = pass_hist.GetBinContent(i), all_hist.GetBinContent(i)
+        eff_hist.SetBinContent(i, 100.0 * n_pass / n if n > 0 else 0.0)
+        cum_eff_hist.SetBinContent(i, 100.0 * n_pass / n_all if n_all > 0 else 0.0)
+        eff_hist.SetBinError(i, 0.0)
+        cum_eff_hist.SetBinError(i, 0.0)
+    eff_hist.Write("", ROOT.TObject.kOverwrite)
+    cum_eff_hist.Write("", ROOT.TObject.kOverwrite)
+    f.Close()
+
+def merge_outputs(inputs, output):
+    """
+    Merge the skim outputs in inputs into output with TFileMerger
+    """
+    merger = ROOT.TFileMerger(False)
+    merger.SetPrintLevel(0)
+    if not merger.OutputFile(output, "RECREATE"):
+        raise RuntimeError(f"Could not create {output}")
+    for path in inputs:
+        if not merger.AddFile(path):
+            raise RuntimeError(f"Could not add {path} to {output}")
+    if not merger.Merge():
+        raise RuntimeError(f"Merging into {output} failed")
+    fix_cutflow(output)
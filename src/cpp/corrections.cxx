@@ -0,0 +1,280 @@
+#include "corrections.h"
+
+#include <algorithm>
+#include <numeric>
+#include <cmath>
+
+// The bodies were written for cling, where abs() also has the floating
+// point overloads
+using std::abs;
+
+// JECs
+
+std::unique_ptr<correction::CorrectionSet> cset;
+correction::CompoundCorrection::Ref cstack;
+
+void init_jec(const std::string& cfile, const std::string& cstack_name) {
+    cset = correction::CorrectionSet::from_file(cfile);
+    cstack = (cset->compound()).at(cstack_name);
+}
+
+const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area) {
+    ROOT::VecOps::RVec<float> correction_factors;
+
+    for (size_t i = 0; i < pt.size(); i++) {
+        correction_factors.push_back(cstack->evaluate({area[i], eta[i], pt[i], rho}));
+    }
+
+    return correction_factors;
+}
+
+const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi) {
+    ROOT::VecOps::RVec<float> correction_factors;
+
+    for (size_t i = 0; i < pt.size(); i++) {
+        correction_factors.push_back(cstack->evaluate({area[i], eta[i], phi[i], pt[i], rho}));
+    }
+
+    return correction_factors;
+}
+
+JECCacheConfig jec_cache_config;
+
+size_t JECCacheKeyHash::operator()(const JECCacheKey& key) const {
+    size_t h = std::hash<long>()(key.eta);
+    for (long x : {key.phi, key.area, key.rho, key.pt}) {
+        h ^= std::hash<long>()(x) + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2);
+    }
+    return h;
+}
+
+JECCacheKey JECCache::key(float area, float eta, float phi, float pt, float rho) const {
+    const auto& c = jec_cache_config;
+    return {std::lround(std::floor(eta / c.eta_step)), std::lround(std::floor(phi / c.phi_step)),
+            std::lround(std::floor(area / c.area_step)), std::lround(std::floor(rho / c.rho_step)),
+            std::lround(std::floor(std::log(pt) / c.log_pt_step))};
+}
+
+bool JECCache::get(const JECCacheKey& key, float& value) {
+    auto it = index_.find(key);
+    if (it == index_.end()) {
+        misses++;
+        return false;
+    }
+    entries_.splice(entries_.begin(), entries_, it->second);
+    value = it->second->second;
+    hits++;
+    return true;
+}
+
+void JECCache::put(const JECCacheKey& key, float value) {
+    entries_.emplace_front(key, value);
+    index_[key] = entries_.begin();
+    if (entries_.size() > capacity_) {
+        index_.erase(entries_.back().first);
+        entries_.pop_back();
+    }
+}
+
+void JECCache::check(float cached, float exact) {
+    checked++;
+    max_deviation = std::max(max_deviation, std::abs(cached / exact - 1.0));
+}
+
+std::mutex jec_caches_mutex;
+std::vector<std::shared_ptr<JECCache>> jec_caches;
+
+JECCache& get_jec_cache() {
+    thread_local std::shared_ptr<JECCache> cache;
+    if (!cache) {
+        cache = std::make_shared<JECCache>(jec_cache_config.capacity);
+        std::lock_guard<std::mutex> lock(jec_caches_mutex);
+        jec_caches.push_back(cache);
+    }
+    return *cache;
+}
+
+JECCacheReport jec_cache_report() {
+    std::lock_guard<std::mutex> lock(jec_caches_mutex);
+    JECCacheReport report;
+    for (const auto& cache : jec_caches) {
+        report.hits += cache->hits;
+        report.misses += cache->misses;
+        report.checked += cache->checked;
+        report.max_deviation = std::max(report.max_deviation, cache->max_deviation);
+    }
+    return report;
+}
+
+// Evaluate the stack with a per-thread input buffer, and through the cache
+// if it is enabled
+float evaluate_correction(std::vector<correction::Variable::Type>& inputs,
+                          float area, float eta, float phi, float pt, float rho) {
+    // The key quantizes log(pt), which is undefined for pt <= 0, so such
+    // jets and non-finite inputs are evaluated without the cache
+    if (jec_cache_config.capacity == 0 || !(pt > 0.0f) || !std::isfinite(area + eta + phi + pt + rho)) {
+        return cstack->evaluate(inputs);
+    }
+
+    auto& cache = get_jec_cache();
+    const auto key = cache.key(area, eta, phi, pt, rho);
+    float value;
+    if (cache.get(key, value)) {
+        if (cache.hits % jec_cache_config.check_every == 0) {
+            cache.check(value, cstack->evaluate(inputs));
+        }
+        return value;
+    }
+    value = cstack->evaluate(inputs);
+    cache.put(key, value);
+    return value;
+}
+
+ROOT::VecOps::RVec<float> get_correction_batched(const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area) {
+    thread_local std::vector<correction::Variable::Type> inputs(4);
+    ROOT::VecOps::RVec<float> correction_factors(pt.size());
+
+    for (size_t i = 0; i < pt.size(); i++) {
+        inputs[0] = static_cast<double>(area[i]);
+        inputs[1] = static_cast<double>(eta[i]);
+        inputs[2] = static_cast<double>(pt[i]);
+        inputs[3] = static_cast<double>(rho);
+        correction_factors[i] = evaluate_correction(inputs, area[i], eta[i], 0.0, pt[i], rho);
+    }
+
+    return correction_factors;
+}
+
+ROOT::VecOps::RVec<float> get_correction_batched(const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi) {
+    thread_local std::vector<correction::Variable::Type> inputs(5);
+    ROOT::VecOps::RVec<float> correction_factors(pt.size());
+
+    for (size_t i = 0; i < pt.size(); i++) {
+        inputs[0] = static_cast<double>(area[i]);
+        inputs[1] = static_cast<double>(eta[i]);
+        inputs[2] = static_cast<double>(phi[i]);
+        inputs[3] = static_cast<double>(pt[i]);
+        inputs[4] = static_cast<double>(rho);
+        correction_factors[i] = evaluate_correction(inputs, area[i], eta[i], phi[i], pt[i], rho);
+    }
+
+    return correction_factors;
+}
+
+// Vetomaps
+
+std::unique_ptr<correction::CorrectionSet> vset;
+correction::Correction::Ref veval;
+
+void init_vetomap(const std::string& vfile, const std::string& vset_name) {
+    vset = correction::CorrectionSet::from_file(vfile);
+    veval = vset->at(vset_name);
+}
+
+ROOT::VecOps::RVec<bool> get_veto( const ROOT::VecOps::RVec<float>& eta,
+                                   const ROOT::VecOps::RVec<float>& phi,
+                                   std::string type) {
+    ROOT::VecOps::RVec<bool> veto_flags;
+
+    for (size_t i = 0; i < eta.size(); i++) {
+        if (abs(eta[i]) > 5.131 || abs(phi[i]) > 3.14159) {
+            veto_flags.push_back(true);
+            continue;
+        }
+        float veto = veval->evaluate({type, eta[i], phi[i]});
+        veto_flags.push_back(veto > 0.0);
+    }
+
+    return veto_flags;
+}
+
+// Fused jet corrections
+
+bool is_vetoed(float eta, float phi, int veto_mode) {
+    if (veto_mode == kNoVeto) {
+        return false;
+    }
+    if (abs(eta) > 5.131 || abs(phi) > 3.14159) {
+        return true;
+    }
+    if (veto_mode == kVetoBitmap) {
+        return veto_bitmap.vetoed(eta, phi);
+    }
+    return veval->evaluate({std::string("jetvetomap"), eta, phi}) > 0.0;
+}
+
+CorrectedJets correct_jets_fused(const ROOT::VecOps::RVec<unsigned int>& jetId,
+                                 const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta,
+                                 const ROOT::VecOps::RVec<float>& phi, const ROOT::VecOps::RVec<float>& mass,
+                                 const ROOT::VecOps::RVec<float>& rawFactor, const ROOT::VecOps::RVec<float>& area,
+                                 float rho, float met_pt, float met_phi, bool propagate_met,
+                                 int veto_mode) {
+    const size_t n = pt.size();
+
+    // Scratch buffers reused between the events of a thread
+    thread_local std::vector<correction::Variable::Type> inputs(5);
+    thread_local std::vector<float> corr_pt, raw_pt, factor;
+    thread_local std::vector<std::size_t> order;
+    corr_pt.resize(n);
+    raw_pt.resize(n);
+    factor.resize(n);
+    order.resize(n);
+
+    float met_x = met_pt * std::cos(met_phi);
+    float met_y = met_pt * std::sin(met_phi);
+    bool sorted = true;
+    for (size_t i = 0; i < n; i++) {
+        raw_pt[i] = (1.0 - rawFactor[i]) * pt[i];
+        inputs[0] = static_cast<double>(area[i]);
+        inputs[1] = static_cast<double>(eta[i]);
+        inputs[2] = static_cast<double>(phi[i]);
+        inputs[3] = static_cast<double>(raw_pt[i]);
+        inputs[4] = static_cast<double>(rho);
+        factor[i] = evaluate_correction(inputs, area[i], eta[i], phi[i], raw_pt[i], rho);
+        corr_pt[i] = pt[i] * factor[i];
+
+        // Replace the raw jets by the corrected ones in the MET
+        if (propagate_met) {
+            met_x += (raw_pt[i] - corr_pt[i]) * std::cos(phi[i]);
+            met_y += (raw_pt[i] - corr_pt[i]) * std::sin(phi[i]);
+        }
+
+        sorted = sorted && (i == 0 || corr_pt[i - 1] >= corr_pt[i]);
+    }
+
+    std::iota(order.begin(), order.end(), 0);
+    if (!sorted) {
+        std::stable_sort(order.begin(), order.end(),
+                         [](std::size_t a, std::size_t b) { return corr_pt[a] > corr_pt[b]; });
+    }
+
+    CorrectedJets jets;
+    jets.pt.resize(n);
+    jets.eta.resize(n);
+    jets.phi.resize(n);
+    jets.mass.resize(n);
+    jets.rawFactor.resize(n);
+    jets.rawPt.resize(n);
+    jets.correctionFactor.resize(n);
+    jets.jetId.resize(n);
+    jets.vetoed.resize(n);
+    if (!sorted) {
+        jets.order.assign(order.begin(), order.end());
+    }
+    for (size_t j = 0; j < n; j++) {
+        const std::size_t i = order[j];
+        jets.pt[j] = corr_pt[i];
+        jets.eta[j] = eta[i];
+        jets.phi[j] = phi[i];
+        jets.mass[j] = (1.0 - rawFactor[i]) * mass[i] * factor[i];
+        jets.rawFactor[j] = 1.0 - 1.0 / factor[i];
+        jets.rawPt[j] = raw_pt[i];
+        jets.correctionFactor[j] = factor[i];
+        jets.jetId[j] = jetId[i];
+        jets.vetoed[j] = is_vetoed(eta[i], phi[i], veto_mode);
+    }
+    jets.met_pt = propagate_met ? std::hypot(met_x, met_y) : met_pt;
+    jets.met_phi = propagate_met ? std::atan2(met_y, met_x) : met_phi;
+
+    return jets;
+}
@@ -0,0 +1,132 @@
+#ifndef J4P_CORRECTIONS_H
+#define J4P_CORRECTIONS_H
+
+// correctionlib based helpers used by the skim. The definitions are in
+// corrections.cxx, which is either compiled into a shared library or
+// declared to cling directly (see kernels.py).
+
+#include <list>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include <ROOT/RVec.hxx>
+
+#include "correction.h"
+#include "kernels.h"
+
+// JECs
+
+extern std::unique_ptr<correction::CorrectionSet> cset;
+extern correction::CompoundCorrection::Ref cstack;
+
+void init_jec(const std::string& cfile, const std::string& cstack_name);
+
+const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area);
+const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi);
+
+// Optional memoization of the JEC evaluation. Inputs are quantized into a
+// key and the factor of the first jet seen in a bin is reused for the
+// following ones. Every cache keeps its own statistics and is only used by
+// one thread.
+struct JECCacheConfig {
+    size_t capacity = 0;
+    double eta_step = 0.01;
+    double phi_step = 0.01;
+    double area_step = 0.01;
+    double rho_step = 0.1;
+    double log_pt_step = 0.001;
+    size_t check_every = 100;
+};
+
+extern JECCacheConfig jec_cache_config;
+
+struct JECCacheKey {
+    long eta, phi, area, rho, pt;
+
+    bool operator==(const JECCacheKey& other) const {
+        return eta == other.eta && phi == other.phi && area == other.area &&
+               rho == other.rho && pt == other.pt;
+    }
+};
+
+struct JECCacheKeyHash {
+    size_t operator()(const JECCacheKey& key) const;
+};
+
+class JECCache {
+public:
+    explicit JECCache(size_t capacity) : capacity_(capacity) {}
+
+    JECCacheKey key(float area, float eta, float phi, float pt, float rho) const;
+
+    // Returns true and sets value if key is cached
+    bool get(const JECCacheKey& key, float& value);
+    void put(const JECCacheKey& key, float value);
+    void check(float cached, float exact);
+
+    size_t hits = 0;
+    size_t misses = 0;
+    size_t checked = 0;
+    double max_deviation = 0.0;
+
+private:
+    size_t capacity_;
+    std::list<std::pair<JECCacheKey, float>> entries_;
+    std::unordered_map<JECCacheKey, std::list<std::pair<JECCacheKey, float>>::iterator, JECCacheKeyHash> index_;
+};
+
+struct JECCacheReport {
+    size_t hits = 0;
+    size_t misses = 0;
+    size_t checked = 0;
+    double max_deviation = 0.0;
+};
+
+JECCacheReport jec_cache_report();
+
+ROOT::VecOps::RVec<float> get_correction_batched(const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area);
+ROOT::VecOps::RVec<float> get_correction_batched(const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi);
+
+// Vetomaps
+
+extern std::unique_ptr<correction::CorrectionSet> vset;
+extern correction::Correction::Ref veval;
+
+void init_vetomap(const std::string& vfile, const std::string& vset_name);
+
+ROOT::VecOps::RVec<bool> get_veto( const ROOT::VecOps::RVec<float>& eta,
+                                   const ROOT::VecOps::RVec<float>& phi,
+                                   std::string type="jetvetomap");
+
+// Fused jet corrections
+
+// Corrected jets of one event, sorted by corrected pT. order holds the
+// original index of each sorted jet, to reorder the other jet columns with
+// apply_jet_order, and is empty if the order did not change. met_pt and
+// met_phi are the type-1 corrected MET, or the input MET if it was not
+// propagated.
+struct CorrectedJets {
+    ROOT::VecOps::RVec<float> pt, eta, phi, mass, rawFactor, rawPt, correctionFactor;
+    ROOT::VecOps::RVec<unsigned int> jetId;
+    ROOT::VecOps::RVec<bool> vetoed;
+    ROOT::VecOps::RVec<std::size_t> order;
+    float met_pt = 0.0;
+    float met_phi = 0.0;
+};
+
+enum VetoMode { kNoVeto = 0, kVetoBitmap = 1, kVetoCorrectionlib = 2 };
+
+// JECs, pT sorting and vetomaps of the jets, and with propagate_met the
+// type-1 propagation of the JECs to the MET, in a single loop. jetId is the
+// output of fix_jetId.
+CorrectedJets correct_jets_fused(const ROOT::VecOps::RVec<unsigned int>& jetId,
+                                 const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta,
+                                 const ROOT::VecOps::RVec<float>& phi, const ROOT::VecOps::RVec<float>& mass,
+                                 const ROOT::VecOps::RVec<float>& rawFactor, const ROOT::VecOps::RVec<float>& area,
+                                 float rho, float met_pt, float met_phi, bool propagate_met,
+                                 int veto_mode);
+
+#endif
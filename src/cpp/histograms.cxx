@@ -0,0 +1,102 @@
+#include "histograms.h"
+
+#include <atomic>
+#include <stdexcept>
+
+SparseHistoHelper::SparseHistoHelper(const std::string& name, const std::string& title,
+                                     const std::vector<std::vector<double>>& edges,
+                                     unsigned int n_slots) {
+    const int dim = edges.size();
+    std::vector<int> n_bins;
+    std::vector<double> mins, maxs;
+    for (const auto& axis : edges) {
+        n_bins.push_back(axis.size() - 1);
+        mins.push_back(axis.front());
+        maxs.push_back(axis.back());
+    }
+    for (unsigned int slot = 0; slot < n_slots; ++slot) {
+        auto histo = std::make_shared<THnSparseD>((name + "_" + std::to_string(slot)).c_str(),
+                                                  title.c_str(), dim, n_bins.data(), mins.data(),
+                                                  maxs.data());
+        for (int i = 0; i < dim; ++i) {
+            histo->SetBinEdges(i, edges[i].data());
+        }
+        histo->Sumw2();
+        histos.push_back(histo);
+    }
+    histos[0]->SetName(name.c_str());
+}
+
+void SparseHistoHelper::Finalize() {
+    for (size_t slot = 1; slot < histos.size(); ++slot) {
+        histos[0]->Add(histos[slot].get());
+        histos[slot]->Reset();
+    }
+}
+
+ROOT::RDF::RResultPtr<THnSparseD> book_sparse_histo(ROOT::RDF::RNode df, const std::string& name,
+                                                   const std::string& title,
+                                                   const std::vector<std::vector<double>>& edges,
+                                                   const std::vector<std::string>& columns) {
+    if (columns.size() != edges.size() + 1) {
+        throw std::invalid_argument("book_sparse_histo: expected " + std::to_string(edges.size() + 1) +
+                                    " columns for " + name);
+    }
+
+    // Book needs the exact column types, so cast everything to double
+    static std::atomic<unsigned int> n_booked{0};
+    const std::string prefix = "sparse_" + std::to_string(n_booked++) + "_";
+    std::vector<std::string> cast;
+    for (size_t i = 0; i < columns.size(); ++i) {
+        cast.push_back(prefix + std::to_string(i));
+        df = df.Define(cast.back(), "double(" + columns[i] + ")");
+    }
+
+    SparseHistoHelper helper(name, title, edges, df.GetNSlots());
+    switch (edges.size()) {
+    case 1:
+        return df.Book<double, double>(std::move(helper), cast);
+    case 2:
+        return df.Book<double, double, double>(std::move(helper), cast);
+    case 3:
+        return df.Book<double, double, double, double>(std::move(helper), cast);
+    default:
+        throw std::invalid_argument("book_sparse_histo: only 1 to 3 dimensions are supported");
+    }
+}
+
+ROOT::RDF::RResultPtr<TH1F> book_float_histo(ROOT::RDF::RNode df, const TH1F& model,
+                                            const std::vector<std::string>& columns) {
+    return df.Fill(TH1F(model), columns);
+}
+
+ROOT::RDF::RResultPtr<TH2F> book_float_histo(ROOT::RDF::RNode df, const TH2F& model,
+                                            const std::vector<std::string>& columns) {
+    return df.Fill(TH2F(model), columns);
+}
+
+ROOT::RDF::RResultPtr<TH3F> book_float_histo(ROOT::RDF::RNode df, const TH3F& model,
+                                            const std::vector<std::string>& columns) {
+    return df.Fill(TH3F(model), columns);
+}
+
+// fBinEntries is protected, but a pointer to it can be taken in a derived
+// class and used on any profile
+template <typename Profile>
+struct BinEntriesAccess : Profile {
+    static TArrayD& get(Profile& profile) {
+        return profile.*(&BinEntriesAccess::fBinEntries);
+    }
+};
+
+TArrayD& profile_bin_entries(TProfile& profile) {
+    return BinEntriesAccess<TProfile>::get(profile);
+}
+
+TArrayD& profile_bin_entries(TProfile2D& profile) {
+    return BinEntriesAccess<TProfile2D>::get(profile);
+}
+
+TArrayD& profile_bin_entries(TProfile3D& profile) {
+    return BinEntriesAccess<TProfile3D>::get(profile);
+}
@@ -0,0 +1,71 @@
+#ifndef J4P_HISTOGRAMS_H
+#define J4P_HISTOGRAMS_H
+
+// Compact storage backends for large histograms of the hist command. The
+// definitions are in histograms.cxx (see kernels.py).
+
+#include <memory>
+#include <string>
+#include <vector>
+
+#include <ROOT/RDataFrame.hxx>
+#include <TH1F.h>
+#include <TH2F.h>
+#include <TH3F.h>
+#include <THnSparse.h>
+#include <TProfile.h>
+#include <TProfile2D.h>
+#include <TProfile3D.h>
+
+// RDF action filling one THnSparseD per slot, added together at the end.
+// Only filled bins are allocated, so the memory grows with the occupancy
+// instead of the number of bins times the number of slots. Exec takes the
+// coordinates followed by the weight.
+class SparseHistoHelper : public ROOT::Detail::RDF::RActionImpl<SparseHistoHelper> {
+public:
+    using Result_t = THnSparseD;
+
+    SparseHistoHelper(const std::string& name, const std::string& title,
+                      const std::vector<std::vector<double>>& edges, unsigned int n_slots);
+    SparseHistoHelper(SparseHistoHelper&&) = default;
+    SparseHistoHelper(const SparseHistoHelper&) = delete;
+
+    std::shared_ptr<THnSparseD> GetResultPtr() const { return histos[0]; }
+    void Initialize() {}
+    void InitTask(TTreeReader*, unsigned int) {}
+
+    template <typename... Values>
+    void Exec(unsigned int slot, Values... values) {
+        const double v[] = {static_cast<double>(values)...};
+        histos[slot]->Fill(v, v[sizeof...(Values) - 1]);
+    }
+
+    void Finalize();
+    std::string GetActionName() { return "SparseHisto"; }
+
+private:
+    std::vector<std::shared_ptr<THnSparseD>> histos;
+};
+
+// Book a sparse histogram of the columns (1 to 3 coordinates and the
+// weight), which are cast to double
+ROOT::RDF::RResultPtr<THnSparseD> book_sparse_histo(ROOT::RDF::RNode df, const std::string& name,
+                                                   const std::string& title,
+                                                   const std::vector<std::vector<double>>& edges,
+                                                   const std::vector<std::string>& columns);
+
+// Book a histogram with float storage, filled from clones of the model
+ROOT::RDF::RResultPtr<TH1F> book_float_histo(ROOT::RDF::RNode df, const TH1F& model,
+                                            const std::vector<std::string>& columns);
+ROOT::RDF::RResultPtr<TH2F> book_float_histo(ROOT::RDF::RNode df, const TH2F& model,
+                                            const std::vector<std::string>& columns);
+ROOT::RDF::RResultPtr<TH3F> book_float_histo(ROOT::RDF::RNode df, const TH3F& model,
+                                            const std::vector<std::string>& columns);
+
+// Sum of weights of the bins of a profile, which TProfile only exposes
+// bin by bin. Used by merge to add profiles as arrays.
+TArrayD& profile_bin_entries(TProfile& profile);
+TArrayD& profile_bin_entries(TProfile2D& profile);
+TArrayD& profile_bin_entries(TProfile3D& profile);
+
+#endif
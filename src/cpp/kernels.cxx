@@ -0,0 +1,304 @@
+#include "kernels.h"
+
+#include <algorithm>
+#include <cmath>
+#include <functional>
+#include <numeric>
+
+// The bodies were written for cling, where abs() also has the floating
+// point overloads
+using std::abs;
+
+// Jet ID
+
+ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<int>& Jet_jetId, const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF) {
+    ROOT::VecOps::RVec<unsigned int> Jet_passJetId(Jet_eta.size(), 0);
+
+    for (size_t i = 0; i < Jet_eta.size(); ++i) {
+        bool passTight = false;
+        bool passTightLepVeto = false;
+
+        if (abs(Jet_eta[i]) <= 2.7)
+            passTight = Jet_jetId[i] & (1 << 1);
+        else if (abs(Jet_eta[i]) > 2.7 && abs(Jet_eta[i]) <= 3.0)
+            passTight = (Jet_jetId[i] & (1 << 1)) && (Jet_neHEF[i] < 0.99);
+        else if (abs(Jet_eta[i]) > 3.0)
+            passTight = (Jet_jetId[i] & (1 << 1)) && (Jet_neEmEF[i] < 0.4);
+
+        if (passTight) {
+            passTightLepVeto = (abs(Jet_eta[i]) > 2.7) ? passTight : (passTight && (Jet_muEF[i] < 0.8) && (Jet_chEmEF[i] < 0.8));
+            Jet_passJetId[i] = passTightLepVeto ? 6 : 2;
+        }
+    }
+    return Jet_passJetId;
+}
+
+ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<int>& Jet_chMultiplicity, const ROOT::VecOps::RVec<int>& Jet_neMultiplicity, const ROOT::VecOps::RVec<float>& Jet_chHEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF) {
+    ROOT::VecOps::RVec<unsigned int> Jet_passJetId(Jet_eta.size(), 0);
+
+    for (size_t i = 0; i < Jet_eta.size(); ++i) {
+        bool passTight = false;
+        bool passTightLepVeto = false;
+
+        if (abs(Jet_eta[i]) <= 2.6)
+            passTight = (Jet_neHEF[i] < 0.99) && (Jet_neEmEF[i] < 0.9) && (Jet_chMultiplicity[i] + Jet_neMultiplicity[i] > 1) && (Jet_chHEF[i] > 0.01) && (Jet_chMultiplicity[i] > 0);
+        else if (abs(Jet_eta[i]) > 2.6 && abs(Jet_eta[i]) <= 2.7)
+            passTight = (Jet_neHEF[i] < 0.90) && (Jet_neEmEF[i] < 0.99);
+        else if (abs(Jet_eta[i]) > 2.7 && abs(Jet_eta[i]) <= 3.0)
+            passTight = (Jet_neHEF[i] < 0.99);
+        else if (abs(Jet_eta[i]) > 3.0)
+            passTight = (Jet_neMultiplicity[i] >= 2) && (Jet_neEmEF[i] < 0.4);
+
+        if (passTight) {
+            passTightLepVeto = (abs(Jet_eta[i]) > 2.7) ? passTight : (passTight && (Jet_muEF[i] < 0.8) && (Jet_chEmEF[i] < 0.8));
+            Jet_passJetId[i] = passTightLepVeto ? 6 : 2;
+        }
+    }
+    return Jet_passJetId;
+}
+
+// Golden JSON
+
+LumiMask::LumiMask() : offsets_(1, 0) {}
+
+void LumiMask::add_run(unsigned int run, const std::vector<unsigned int>& firsts,
+                       const std::vector<unsigned int>& lasts) {
+    runs_.push_back(run);
+    firsts_.insert(firsts_.end(), firsts.begin(), firsts.end());
+    lasts_.insert(lasts_.end(), lasts.begin(), lasts.end());
+    offsets_.push_back(lasts_.size());
+}
+
+bool LumiMask::accept(unsigned int run, unsigned int lumi) const {
+    auto r = std::lower_bound(runs_.begin(), runs_.end(), run);
+    if (r == runs_.end() || *r != run) {
+        return false;
+    }
+    const size_t i = r - runs_.begin();
+    auto begin = lasts_.begin() + offsets_[i];
+    auto end = lasts_.begin() + offsets_[i + 1];
+
+    // First range ending at or after lumi
+    auto l = std::lower_bound(begin, end, lumi);
+    return l != end && firsts_[l - lasts_.begin()] <= lumi;
+}
+
+bool LumiMask::hasRun(unsigned int run) const {
+    return std::binary_search(runs_.begin(), runs_.end(), run);
+}
+
+void LumiMask::clear() {
+    runs_.clear();
+    offsets_.assign(1, 0);
+    firsts_.clear();
+    lasts_.clear();
+}
+
+LumiMask lumi_mask;
+
+bool isGoodLumi(unsigned int run, unsigned int lumi) {
+    return lumi_mask.accept(run, lumi);
+}
+
+// Vetomaps
+
+int VetoAxis::index(double x) const {
+    const int n = edges.size() - 1;
+    int i;
+    if (uniform) {
+        i = std::floor((x - edges.front()) / (edges.back() - edges.front()) * n);
+    } else {
+        i = std::upper_bound(edges.begin(), edges.end(), x) - edges.begin() - 1;
+    }
+    return std::clamp(i, 0, n - 1);
+}
+
+void VetoBitmap::init(const std::vector<double>& eta_edges, bool eta_uniform,
+                      const std::vector<double>& phi_edges, bool phi_uniform,
+                      const std::vector<unsigned char>& bits) {
+    eta_ = {eta_edges, eta_uniform};
+    phi_ = {phi_edges, phi_uniform};
+    n_phi_ = phi_edges.size() - 1;
+    bits_ = bits;
+}
+
+bool VetoBitmap::vetoed(float eta, float phi) const {
+    return bits_[eta_.index(eta) * n_phi_ + phi_.index(phi)];
+}
+
+VetoBitmap veto_bitmap;
+
+ROOT::VecOps::RVec<bool> get_veto_bitmap(const ROOT::VecOps::RVec<float>& eta,
+                                         const ROOT::VecOps::RVec<float>& phi) {
+    ROOT::VecOps::RVec<bool> veto_flags(eta.size());
+
+    for (size_t i = 0; i < eta.size(); i++) {
+        if (abs(eta[i]) > 5.131 || abs(phi[i]) > 3.14159) {
+            veto_flags[i] = true;
+            continue;
+        }
+        veto_flags[i] = veto_bitmap.vetoed(eta[i], phi[i]);
+    }
+
+    return veto_flags;
+}
+
+// Jet sorting
+
+ROOT::VecOps::RVec<std::size_t> get_jet_order(const ROOT::VecOps::RVec<float>& pt) {
+    if (std::is_sorted(pt.begin(), pt.end(), std::greater<float>())) {
+        return {};
+    }
+
+    ROOT::VecOps::RVec<std::size_t> order(pt.size());
+    std::iota(order.begin(), order.end(), 0);
+    std::stable_sort(order.begin(), order.end(),
+                     [&pt](std::size_t a, std::size_t b) { return pt[a] > pt[b]; });
+    return order;
+}
+
+// Selections: dijet
+
+std::pair<std::pair<int, int>, int> findTagProbeIdxs(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId) {
+
+    int idx1 = (int(Jet_phi[0]) * 100) % 2;
+    int idx2 = -1;
+
+    // Check that the tag is in barrel
+    if (abs(Jet_eta[idx1]) > 1.3 || Jet_pt[idx1] < 15 || Jet_jetId[idx1] < 4) {
+        return std::make_pair(std::make_pair(-1, -1), -1);
+    }
+
+    // Find the probe jet as:
+    // leading jet back-to-back with the tag jet
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (i == idx1 || Jet_pt[i] < 12 || Jet_jetId[i] < 4) {
+            continue;
+        }
+        if (abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Jet_phi[idx1])) > 2.7 &&
+            Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
+            idx2 = i;
+            break;
+        }
+    }
+
+    // Find the activity jet
+    int idx3 = -1;
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (i != idx1 && i != idx2 && Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
+            idx3 = i;
+            break;
+        }
+    }
+
+    return std::make_pair(std::make_pair(idx1, idx2), idx3);
+}
+
+// Selections: multijet
+
+ROOT::RVec<int> findRecoilJetIdxs(const ROOT::RVec<float>& Jet_pt, const ROOT::RVec<float>& Jet_eta,
+                          const ROOT::RVec<float>& Jet_phi, const ROOT::RVec<float>& Jet_mass, const ROOT::RVec<int>& Jet_jetId) {
+    ROOT::RVec<int> idxs;
+
+    for (int i = 1; i < Jet_pt.size(); i++) {
+        if (Jet_pt[i] > 30 && abs(Jet_eta[i]) < 2.5 && Jet_jetId[i] >= 4 && abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Jet_phi[0])) > 1.0) {
+            idxs.push_back(i);
+        }
+    }
+
+    return idxs;
+}
+
+// Selections: photonjet
+
+int findPhotonIdx(ROOT::RVec<float> Photon_eta, ROOT::RVec<float> Photon_pt,
+                    ROOT::RVec<int> Photon_cutBased, ROOT::RVec<float> Photon_hoe,
+                    ROOT::RVec<float> Photon_r9) {
+    for (int i = 0; i < Photon_pt.size(); i++) {
+        if (abs(Photon_eta[i]) < 1.3 && Photon_pt[i] > 15 && Photon_cutBased[i] == 3 &&
+            Photon_hoe[i] < 0.02148 && Photon_r9[i] > 0.94 && Photon_r9[i] < 1.00) {
+            return i;
+        }
+    }
+
+    return -1;
+}
+
+std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
+                    int Photon_jetIdx, float Photon_phi) {
+    int idx1 = -1;
+    int idx2 = -1;
+
+    // Find the probe jet
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (Jet_pt[i] > 12 && Jet_jetId[i] >= 4
+                && i != Photon_jetIdx
+                && abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Photon_phi)) > 2.7) {
+            idx1 = i;
+            break;
+        }
+    }
+
+    // Find the activity jet
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (i != idx1 && Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
+            idx2 = i;
+            break;
+        }
+    }
+
+    return std::make_pair(idx1, idx2);
+}
+
+// Selections: zmm
+
+std::pair<int, int> findMuonIdxs(ROOT::RVec<float> Muon_eta, ROOT::RVec<float> Muon_pt,
+                    ROOT::RVec<float> Muon_pfRelIso03_all, ROOT::RVec<int> Muon_tightId,
+                    ROOT::RVec<float> Muon_charge) {
+    int idx1 = -1;
+    int idx2 = -1;
+    for (int i = 0; i < Muon_pt.size(); i++) {
+        if (abs(Muon_eta[i]) < 2.4 && Muon_pfRelIso03_all[i] < 0.15 &&
+            Muon_tightId[i]) {
+            // Leading muon pt>20, subleading pt>10
+            if (idx1 == -1 && Muon_pt[i] > 20) {
+                idx1 = i;
+            } else if (idx2 == -1 && Muon_charge[i] != Muon_charge[idx1] &&
+                    Muon_pt[i] > 10) {
+                idx2 = i;
+                break;
+            }
+        }
+    }
+
+    return std::make_pair(idx1, idx2);
+}
+
+std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
+                    float Z_eta, float Z_phi) {
+    int idx1 = -1;
+    int idx2 = -1;
+
+    // Find the probe jet
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (Jet_pt[i] > 12 && Jet_jetId[i] >= 4 && abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Z_phi)) > 2.7) {
+            if (idx1 == -1) {
+                idx1 = i;
+                break;
+            }
+        }
+    }
+
+    // Find the activity jet
+    for (int i = 0; i < Jet_pt.size(); i++) {
+        if (i != idx1 && Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
+            idx2 = i;
+            break;
+        }
+    }
+
+    return std::make_pair(idx1, idx2);
+}
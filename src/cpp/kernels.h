@@ -0,0 +1,126 @@
+#ifndef J4P_KERNELS_H
+#define J4P_KERNELS_H
+
+// C++ helpers used by the skim. The definitions are in kernels.cxx, which
+// is either compiled into a shared library or declared to cling directly
+// (see kernels.py).
+
+#include <utility>
+#include <vector>
+
+#include <ROOT/RVec.hxx>
+
+// Jet ID
+
+ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<int>& Jet_jetId, const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF);
+
+ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<int>& Jet_chMultiplicity, const ROOT::VecOps::RVec<int>& Jet_neMultiplicity, const ROOT::VecOps::RVec<float>& Jet_chHEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF);
+
+// Golden JSON
+
+// Read-only golden JSON lookup: a sorted run array and, per run, a slice of
+// flat sorted lumisection range arrays. Safe to share between threads.
+class LumiMask {
+public:
+    LumiMask();
+
+    void add_run(unsigned int run, const std::vector<unsigned int>& firsts,
+                 const std::vector<unsigned int>& lasts);
+
+    bool accept(unsigned int run, unsigned int lumi) const;
+    bool hasRun(unsigned int run) const;
+    void clear();
+
+    size_t nRuns() const { return runs_.size(); }
+    size_t nRanges() const { return lasts_.size(); }
+
+private:
+    std::vector<unsigned int> runs_;
+    std::vector<size_t> offsets_;
+    std::vector<unsigned int> firsts_;
+    std::vector<unsigned int> lasts_;
+};
+
+extern LumiMask lumi_mask;
+
+bool isGoodLumi(unsigned int run, unsigned int lumi);
+
+// Vetomaps
+
+// Binned axis following the correctionlib conventions: uniform axes are
+// indexed arithmetically, others with a binary search over the edges.
+struct VetoAxis {
+    std::vector<double> edges;
+    bool uniform = false;
+
+    int index(double x) const;
+};
+
+// Dense eta x phi bitmap of a jet veto map, read-only after initialization
+class VetoBitmap {
+public:
+    void init(const std::vector<double>& eta_edges, bool eta_uniform,
+              const std::vector<double>& phi_edges, bool phi_uniform,
+              const std::vector<unsigned char>& bits);
+
+    bool vetoed(float eta, float phi) const;
+
+    size_t size() const { return bits_.size(); }
+
+private:
+    VetoAxis eta_;
+    VetoAxis phi_;
+    size_t n_phi_ = 0;
+    std::vector<unsigned char> bits_;
+};
+
+extern VetoBitmap veto_bitmap;
+
+ROOT::VecOps::RVec<bool> get_veto_bitmap(const ROOT::VecOps::RVec<float>& eta,
+                                         const ROOT::VecOps::RVec<float>& phi);
+
+// Jet sorting
+
+// Permutation sorting the jets by descending pT, empty if they already are
+ROOT::VecOps::RVec<std::size_t> get_jet_order(const ROOT::VecOps::RVec<float>& pt);
+
+// Jet column in the order given by get_jet_order. Columns of events that
+// are already sorted are passed through as a view, without a copy.
+template <typename T>
+ROOT::VecOps::RVec<T> apply_jet_order(const ROOT::VecOps::RVec<T>& col,
+                                      const ROOT::VecOps::RVec<std::size_t>& order) {
+    if (order.empty()) {
+        return ROOT::VecOps::RVec<T>(const_cast<T*>(col.data()), col.size());
+    }
+    ROOT::VecOps::RVec<T> sorted(col.size());
+    for (size_t j = 0; j < order.size(); j++) {
+        sorted[j] = col[order[j]];
+    }
+    return sorted;
+}
+
+// Selections
+
+std::pair<std::pair<int, int>, int> findTagProbeIdxs(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId);
+
+ROOT::RVec<int> findRecoilJetIdxs(const ROOT::RVec<float>& Jet_pt, const ROOT::RVec<float>& Jet_eta,
+                          const ROOT::RVec<float>& Jet_phi, const ROOT::RVec<float>& Jet_mass, const ROOT::RVec<int>& Jet_jetId);
+
+int findPhotonIdx(ROOT::RVec<float> Photon_eta, ROOT::RVec<float> Photon_pt,
+                    ROOT::RVec<int> Photon_cutBased, ROOT::RVec<float> Photon_hoe,
+                    ROOT::RVec<float> Photon_r9);
+
+std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
+                    int Photon_jetIdx, float Photon_phi);
+
+std::pair<int, int> findMuonIdxs(ROOT::RVec<float> Muon_eta, ROOT::RVec<float> Muon_pt,
+                    ROOT::RVec<float> Muon_pfRelIso03_all, ROOT::RVec<int> Muon_tightId,
+                    ROOT::RVec<float> Muon_charge);
+
+std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
+                    ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
+                    float Z_eta, float Z_phi);
+
+#endif
@@ -0,0 +1,162 @@
+#include "synthetic.h"
+
+#include <algorithm>
+#include <cmath>
+#include <random>
+#include <vector>
+
+namespace {
+
+struct Jet {
+    float pt, eta, phi;
+};
+
+float wrap_phi(float phi) {
+    return std::remainder(phi, 2.0 * M_PI);
+}
+
+// Falling spectrum of the tag pT
+float tag_pt(std::mt19937_64& rng) {
+    std::uniform_real_distribution<float> u(0.0, 1.0);
+    return std::min(30.0 * std::pow(1.0 - u(rng), -1.0 / 2.5), 4000.0);
+}
+
+// Two body decay of a Z with the given (pt, eta, phi) into massless muons
+void decay_z(std::mt19937_64& rng, float pt, float eta, float phi, float mass,
+             Jet& mu1, Jet& mu2) {
+    std::uniform_real_distribution<double> u(0.0, 1.0);
+    const double px = pt * std::cos(phi), py = pt * std::sin(phi), pz = pt * std::sinh(eta);
+    const double e = std::sqrt(px * px + py * py + pz * pz + mass * mass);
+    const double bx = px / e, by = py / e, bz = pz / e;
+    const double b2 = bx * bx + by * by + bz * bz;
+    const double gamma = e / mass;
+
+    const double cos_t = 2.0 * u(rng) - 1.0, sin_t = std::sqrt(1.0 - cos_t * cos_t);
+    const double phi_r = 2.0 * M_PI * u(rng);
+    const double p = mass / 2.0;
+    for (int sign : {1, -1}) {
+        const double qx = sign * p * sin_t * std::cos(phi_r);
+        const double qy = sign * p * sin_t * std::sin(phi_r);
+        const double qz = sign * p * cos_t;
+        const double bq = bx * qx + by * qy + bz * qz;
+        const double f = (gamma - 1.0) * bq / b2 + gamma * p;
+        const double lx = qx + f * bx, ly = qy + f * by, lz = qz + f * bz;
+        const double lpt = std::hypot(lx, ly);
+        Jet& mu = sign > 0 ? mu1 : mu2;
+        mu = {static_cast<float>(lpt), static_cast<float>(std::asinh(lz / lpt)),
+              static_cast<float>(std::atan2(ly, lx))};
+    }
+}
+
+}
+
+SyntheticEvent make_synthetic_event(unsigned long long seed, unsigned long long entry,
+                                    double mean_jets, double photon_fraction, double z_fraction) {
+    std::mt19937_64 rng(seed * 0x9E3779B97F4A7C15ULL + entry);
+    std::uniform_real_distribution<float> u(0.0, 1.0);
+    std::normal_distribution<float> gauss(0.0, 1.0);
+    std::exponential_distribution<float> soft(1.0 / 15.0);
+    std::poisson_distribution<int> n_soft(std::max(mean_jets - 2.0, 0.1));
+
+    SyntheticEvent ev;
+    std::vector<Jet> jets;
+
+    // Tag object
+    const float type = u(rng);
+    const float pt = tag_pt(rng);
+    const float phi = wrap_phi(2.0 * M_PI * u(rng));
+    float recoil_eta = 9.4 * u(rng) - 4.7;
+    if (type < photon_fraction) {
+        ev.photon_pt.push_back(pt);
+        ev.photon_eta.push_back(2.6 * u(rng) - 1.3);
+        ev.photon_phi.push_back(phi);
+        ev.photon_hoe.push_back(0.05 * u(rng));
+        ev.photon_r9.push_back(0.9 + 0.1 * u(rng));
+        ev.photon_cutBased.push_back(3);
+        ev.photon_jetIdx.push_back(-1);
+    } else if (type < photon_fraction + z_fraction) {
+        const float mass = 91.1876 + 2.4952 / 2.0 * std::tan(M_PI * (u(rng) - 0.5));
+        Jet mu1, mu2;
+        decay_z(rng, pt, 4.0 * u(rng) - 2.0, phi, std::clamp(mass, 50.0f, 150.0f), mu1, mu2);
+        for (const Jet& mu : {mu1, mu2}) {
+            ev.muon_pt.push_back(mu.pt);
+            ev.muon_eta.push_back(mu.eta);
+            ev.muon_phi.push_back(mu.phi);
+            ev.muon_mass.push_back(0.10566);
+            ev.muon_pfRelIso03_all.push_back(0.1 * u(rng));
+            ev.muon_tightId.push_back(u(rng) < 0.95);
+        }
+        const int charge = u(rng) < 0.5 ? 1 : -1;
+        ev.muon_charge = {charge, -charge};
+        recoil_eta = 5.0 * u(rng) - 2.5;
+    } else {
+        jets.push_back({pt, 2.6f * u(rng) - 1.3f, phi});
+    }
+
+    // Probe jet balancing the tag, and soft jets
+    jets.push_back({std::max(pt * (1.0f + 0.1f * gauss(rng)), 10.0f), recoil_eta,
+                    wrap_phi(phi + M_PI + 0.1 * gauss(rng))});
+    const int n = n_soft(rng);
+    for (int i = 0; i < n; i++) {
+        jets.push_back({10.0f + soft(rng), 9.4f * u(rng) - 4.7f, wrap_phi(2.0 * M_PI * u(rng))});
+    }
+    std::sort(jets.begin(), jets.end(), [](const Jet& a, const Jet& b) { return a.pt > b.pt; });
+
+    float raw_met_x = 10.0 * gauss(rng), raw_met_y = 10.0 * gauss(rng);
+    for (const Jet& jet : jets) {
+        const float abs_eta = std::abs(jet.eta);
+        const float ch = abs_eta < 2.5 ? 0.3 + 0.4 * u(rng) : 0.0;
+        const float ne_em = (1.0 - ch) * (0.2 + 0.3 * u(rng));
+        const float mu = 0.02 * u(rng);
+        const float ch_em = ch * 0.1 * u(rng);
+        const float ne_h = std::max(1.0f - ch - ne_em - mu - ch_em, 0.0f);
+        ev.jet_pt.push_back(jet.pt);
+        ev.jet_eta.push_back(jet.eta);
+        ev.jet_phi.push_back(jet.phi);
+        ev.jet_mass.push_back(jet.pt * (0.05 + 0.1 * u(rng)));
+        ev.jet_rawFactor.push_back(0.3 * u(rng));
+        ev.jet_area.push_back(0.5 + 0.03 * gauss(rng));
+        ev.jet_chEmEF.push_back(ch_em);
+        ev.jet_chHEF.push_back(ch);
+        ev.jet_neEmEF.push_back(ne_em);
+        ev.jet_neHEF.push_back(ne_h);
+        ev.jet_hfEmEF.push_back(abs_eta > 3.0 ? ne_em : 0.0);
+        ev.jet_hfHEF.push_back(abs_eta > 3.0 ? ne_h : 0.0);
+        ev.jet_muEF.push_back(mu);
+        ev.jet_btagPNetQvG.push_back(u(rng));
+        const unsigned char n_ch = abs_eta < 2.5 ? 1 + static_cast<unsigned char>(20 * u(rng)) : 0;
+        const unsigned char n_ne = 2 + static_cast<unsigned char>(20 * u(rng));
+        ev.jet_jetId.push_back(u(rng) < 0.95 ? 6 : 2);
+        ev.jet_chMultiplicity.push_back(n_ch);
+        ev.jet_neMultiplicity.push_back(n_ne);
+        ev.jet_nConstituents.push_back(n_ch + n_ne);
+        ev.jet_nElectrons.push_back(u(rng) < 0.05 ? 1 : 0);
+        ev.jet_nMuons.push_back(u(rng) < 0.05 ? 1 : 0);
+
+        raw_met_x -= 0.05 * jet.pt * std::cos(jet.phi);
+        raw_met_y -= 0.05 * jet.pt * std::sin(jet.phi);
+
+        ev.lead_jet_pt = std::max(ev.lead_jet_pt, jet.pt);
+        if (abs_eta > 2.7) {
+            ev.lead_fwd_jet_pt = std::max(ev.lead_fwd_jet_pt, jet.pt);
+        }
+    }
+    if (jets.size() > 1) {
+        ev.dijet_ave = 0.5 * (jets[0].pt + jets[1].pt);
+    }
+
+    ev.raw_met_pt = std::hypot(raw_met_x, raw_met_y);
+    ev.raw_met_phi = std::atan2(raw_met_y, raw_met_x);
+    ev.met_pt = ev.raw_met_pt * (1.0 + 0.1 * u(rng));
+    ev.met_phi = ev.raw_met_phi;
+
+    ev.rho = 5.0 + 35.0 * u(rng);
+    ev.npvs = 20 + static_cast<int>(50 * u(rng));
+    ev.flags = u(rng) > 0.001;
+    ev.random = u(rng);
+    ev.lead_photon_pt = ev.photon_pt.empty() ? 0.0 : ev.photon_pt[0];
+    ev.lead_muon_pt = ev.muon_pt.empty() ? 0.0 : ROOT::VecOps::Max(ev.muon_pt);
+    ev.n_muons = ev.muon_pt.size();
+
+    return ev;
+}
@@ -0,0 +1,43 @@
+#ifndef J4P_SYNTHETIC_H
+#define J4P_SYNTHETIC_H
+
+// Event generator for synthetic NanoAOD files, used for benchmarks. The
+// definitions are in synthetic.cxx (see kernels.py).
+
+#include <ROOT/RVec.hxx>
+
+// Content of one synthetic event. Every event has a tag object (a jet, a
+// photon or a Z -> mumu) balanced by a probe jet, plus soft jets.
+struct SyntheticEvent {
+    ROOT::VecOps::RVec<float> jet_pt, jet_eta, jet_phi, jet_mass, jet_rawFactor, jet_area,
+                              jet_chEmEF, jet_chHEF, jet_neEmEF, jet_neHEF, jet_hfEmEF, jet_hfHEF,
+                              jet_muEF, jet_btagPNetQvG;
+    ROOT::VecOps::RVec<unsigned char> jet_jetId, jet_nConstituents, jet_nElectrons, jet_nMuons,
+                                      jet_chMultiplicity, jet_neMultiplicity;
+
+    ROOT::VecOps::RVec<float> muon_pt, muon_eta, muon_phi, muon_mass, muon_pfRelIso03_all;
+    ROOT::VecOps::RVec<int> muon_charge;
+    ROOT::VecOps::RVec<bool> muon_tightId;
+
+    ROOT::VecOps::RVec<float> photon_pt, photon_eta, photon_phi, photon_hoe, photon_r9;
+    ROOT::VecOps::RVec<unsigned char> photon_cutBased;
+    ROOT::VecOps::RVec<short> photon_jetIdx;
+
+    float rho = 0.0;
+    float met_pt = 0.0, met_phi = 0.0, raw_met_pt = 0.0, raw_met_phi = 0.0;
+    int npvs = 0;
+    bool flags = true;
+
+    // Trigger emulation
+    float random = 0.0;
+    float lead_jet_pt = 0.0, lead_fwd_jet_pt = 0.0, dijet_ave = 0.0;
+    float lead_photon_pt = 0.0, lead_muon_pt = 0.0;
+    int n_muons = 0;
+};
+
+// Deterministic in (seed, entry), so that files can be generated in any
+// order and with any number of threads
+SyntheticEvent make_synthetic_event(unsigned long long seed, unsigned long long entry,
+                                    double mean_jets, double photon_fraction, double z_fraction);
+
+#endif
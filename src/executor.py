@@ -0,0 +1,61 @@
+import heapq
+import importlib
+import multiprocessing
+import os
+import time
+
+def parse_executor(value):
+    """
+    ("threads", None) for implicit multithreading in one process, or
+    ("processes", N) for N worker processes
+    """
+    if value == "threads":
+        return "threads", None
+    kind, _, n = value.partition(":")
+    if kind != "processes" or not n.isdigit() or int(n) < 1:
+        raise ValueError(f"Unknown executor {value}, expected threads or processes:N")
+    return kind, int(n)
+
+def balance_files(files, n, weight=os.path.getsize):
+    """
+    Split files into at most n groups of similar total weight, the heaviest
+    remaining file going to the lightest group
+    """
+    groups = [[] for _ in range(min(n, len(files)))]
+    loads = [(0, i) for i in range(len(groups))]
+    for file in sorted(files, key=lambda f: -weight(f)):
+        load, i = heapq.heappop(loads)
+        groups[i].append(file)
+        heapq.heappush(loads, (load + weight(file), i))
+    return [sorted(group) for group in groups]
+
+def run_worker(module, function, args, i):
+    start = time.time()
+    getattr(importlib.import_module(module), function)(args)
+    return i, os.getpid(), time.time() - start
+
+def run_processes(module, function, worker_args):
+    """
+    Call module.function(args) for every args of worker_args in its own
+    process. The processes are spawned, so each of them has its own ROOT
+    interpreter and builds its own RDataFrame.
+    """
+    start = time.time()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(len(worker_args)) as pool:
+        results = pool.starmap(run_worker, [(module, function, args, i)
+                                            for i, args in enumerate(worker_args)])
+    print_timing(results, time.time() - start)
+
+def print_timing(results, wall_time):
+    """
+    Time of every worker, and how well the wall time was used, to compare
+    with implicit multithreading on the same node
+    """
+    times = [t for _, _, t in results]
+    for i, pid, t in sorted(results):
+        print(f"Worker {i} (pid {pid}): {t:.1f} s")
+    mean = sum(times) / len(times)
+    print(f"{len(times)} workers in {wall_time:.1f} s: mean {mean:.1f} s, slowest "
+          f"{max(times) / mean if mean > 0 else 0:.2f}x mean, "
+          f"{sum(times) / (len(times) * wall_time):.0%} of the wall time used")
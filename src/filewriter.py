@@ -1,7 +1,17 @@
 import ROOT
 import os
 from typing import List, Dict
-from RDFAnalyzer import RDFAnalyzer
+
+class HistogramSample:
+    """
+    Histograms of one system as lists keyed by trigger, for write_samples
+    """
+    def __init__(self, system : str, histograms : Dict[str, list] = None):
+        self.system = system
+        self.histograms = histograms if histograms is not None else {}
+
+    def get_histograms(self):
+        return self.histograms
 
 class FileWriter:
     def __init__(self, output_file : str, triggers : List[str] = [], cut_hist_names : bool = False):
@@ -9,7 +19,7 @@ class FileWriter:
         self.cut_hist_names = cut_hist_names
         
         self.output_file = output_file
-        if not os.path.exists(os.path.dirname(output_file)):
+        if os.path.dirname(output_file) and not os.path.exists(os.path.dirname(output_file)):
             os.makedirs(os.path.dirname(output_file))
         self.output = ROOT.TFile(output_file, "RECREATE")
         self.output.cd()
@@ -31,7 +41,7 @@ class FileWriter:
             
         self.output.cd("..")
         
-    def write_samples(self, samples : List[RDFAnalyzer], triggers : List[str] = []):
+    def write_samples(self, samples : List[HistogramSample], triggers : List[str] = []):
         if not triggers:
             triggers = self.triggers
             
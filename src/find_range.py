@@ -1,6 +1,7 @@
 import ROOT
 import argparse
 
+from catalog import Catalog, get_run_range
 from processing_utils import file_read_lines
 
 def find_run_range(rdf):
@@ -14,6 +15,7 @@ def run(args):
         ROOT.EnableImplicitMT(args.nThreads)
 
     # Split the file list and trigger list if they are given as a string
+    files = []
     if args.filelist:
         files= args.filelist.split(",")
     elif args.filepaths:
@@ -23,18 +25,23 @@ def run(args):
     else:
         raise ValueError("No file list provided")
 
-    chain = ROOT.TChain("Events")
-    for file in files:
-        if args.is_local:
-            chain.Add(file)
-        else:
-            chain.Add(f"root://cms-xrd-global.cern.ch/{file}")
+    urls = files if args.is_local else [f"root://cms-xrd-global.cern.ch/{file}" for file in files]
 
-    rdf = ROOT.RDataFrame(chain)
-    if args.progress_bar:
-        ROOT.RDF.Experimental.AddProgressBar(rdf)
+    if args.catalog:
+        # Run range from the LuminosityBlocks trees, without an event loop
+        catalog = Catalog(args.catalog)
+        min_run, max_run = get_run_range(catalog.lookup(files, urls))
+        catalog.close()
+    else:
+        chain = ROOT.TChain("Events")
+        for url in urls:
+            chain.Add(url)
+
+        rdf = ROOT.RDataFrame(chain)
+        if args.progress_bar:
+            ROOT.RDF.Experimental.AddProgressBar(rdf)
 
-    min_run, max_run = find_run_range(rdf)
+        min_run, max_run = find_run_range(rdf)
     if args.for_brilcalc:
         print(f"--begin {min_run} --end {max_run}");
     else:
@@ -1,20 +1,221 @@
 import ROOT
 import configparser
+import copy
+import glob
 import os
+import shutil
 import subprocess
 import json
+import numpy as np
+import re
+import tempfile
+import time
 # import tomllib
-from processing_utils import find_site, get_bins, read_config_file, file_read_lines
+from processing_utils import find_site, get_bins, read_config_file, file_read_lines, get_slices
+from metadata import define_constants, read_trigger_bits, get_trigger_filter, get_trigger_mask, \
+        get_trigger_expression, read_parameters, write_parameters
+from filewriter import FileWriter, HistogramSample
+from kernels import load_kernels
+from executor import parse_executor, balance_files, run_processes
+from merge import merge_files
+from plan import get_identifiers, get_dataset_branches, get_graph_counts, get_n_slots, \
+        make_input, make_report, write_report
 
-def create_histogram(rdf, hist_config, bins, triggers):
-    if len(triggers) > 0:
-        trg_filter = " || ".join(triggers)
-        rdf = (rdf.Filter(trg_filter))
+# Axes of the histogram types with a compact storage backend
+histo_axes = {
+    "Histo1D": ["x"],
+    "Histo2D": ["x", "y"],
+    "Histo3D": ["x", "y", "z"],
+}
 
-    cut = hist_config.get("cut")
+def normalize_cut(cut):
+    """
+    Cut expression with one space between tokens, so that cuts differing
+    only by whitespace share a filter
+    """
+    tokens = re.findall(r"[A-Za-z_]\w*|\d*\.?\d+(?:[eE][+-]?\d+)?|&&|\|\||[<>=!]=|\S", cut)
+    return " ".join(tokens)
+
+class FilterCache:
+    """
+    Filter nodes of the histograms, one per distinct (trigger set, cut) so
+    that each expression is compiled and evaluated once per event
+    """
+    def __init__(self, rdf, trigger_bits=None, trigger_column="trigger_mask"):
+        self.rdf = rdf
+        self.trigger_bits = trigger_bits
+        self.trigger_column = trigger_column
+        self.nodes = {}
+        self.uses = {}
+        self.n_requested = 0
+
+    def get(self, triggers, cut=None):
+        rdf = self.rdf
+        key = ()
+        if len(triggers) > 0:
+            key = (tuple(sorted(set(triggers))),)
+            rdf = self.get_node(key, rdf, get_trigger_filter(triggers, self.trigger_bits,
+                                                                self.trigger_column))
+        if cut:
+            rdf = self.get_node(key + (normalize_cut(cut),), rdf, cut)
+        return rdf
+
+    def get_node(self, key, rdf, expression):
+        self.n_requested += 1
+        if key not in self.nodes:
+            self.nodes[key] = rdf.Filter(expression)
+            self.uses[key] = 0
+        self.uses[key] += 1
+        return self.nodes[key]
+
+    def print_summary(self, verbose=False):
+        print(f"Filter cache: {len(self.nodes)} filter nodes instead of {self.n_requested}, "
+              f"{self.n_requested - len(self.nodes)} saved")
+        if verbose:
+            for key, n in sorted(self.uses.items(), key=lambda item: -item[1]):
+                label = key[-1] if isinstance(key[-1], str) else " || ".join(key[-1])
+                print(f"  {n:4d} x {label}")
+
+def get_slice_column(hist_config):
+    """
+    Column of the slice variable, defined by define_slice_columns if it is
+    an expression
+    """
+    slice_var = hist_config["slice_var"]
+    if re.fullmatch(r"\w+", slice_var):
+        return slice_var
+    return "slice_" + re.sub(r"\W+", "_", slice_var).strip("_")
 
-    if cut:
-        rdf = (rdf.Filter(cut))
+def define_slice_columns(rdf, hist_config):
+    defined = {str(col) for col in rdf.GetColumnNames()}
+    for hist in hist_config:
+        if hist_config[hist].get("type") != "SlicedProfile1D":
+            continue
+        column = get_slice_column(hist_config[hist])
+        if column not in defined:
+            rdf = rdf.Define(column, hist_config[hist]["slice_var"])
+            defined.add(column)
+    return rdf
+
+def get_slice_axis(hist_config):
+    """
+    Finite slice edges, open-ended slices go to the under- and overflow
+    """
+    slices = get_slices(hist_config)
+    edges = [low for _, low, _ in slices] + [slices[-1][2]]
+    edges = [edge for edge in edges if abs(edge) != float("inf")]
+    if len(edges) < 2:
+        raise ValueError(f"{hist_config['name']}: at least two finite slice edges are needed")
+    return np.array(edges, dtype=float)
+
+def project_slices(profile, hist_config):
+    """
+    Profile1D of each slice of a SlicedProfile1D from its Profile2D, named
+    <name>_<slice>
+    """
+    axis = profile.GetYaxis()
+    projections = []
+    for i, (slice_name, low, high) in enumerate(get_slices(hist_config)):
+        first = 0 if low == float("-inf") else axis.FindFixBin(low)
+        last = axis.GetNbins() + 1 if high == float("inf") else axis.FindFixBin(high) - 1
+        # ProfileX reuses an existing object of the same name, so project
+        # into a temporary name and detach it before renaming
+        projection = profile.ProfileX(f"slice_projection_{i}", first, last)
+        projection.SetDirectory(ROOT.nullptr)
+        projection.SetName(f"{hist_config['name']}_{slice_name}")
+        projection.SetTitle(hist_config["title"])
+        projections.append(projection)
+    return projections
+
+def get_trigger_names(triggers):
+    """
+    Directory names of the trigger regions, the first path of each
+    """
+    names = []
+    for i, trigger in enumerate(triggers):
+        name = re.search(r"\w+", trigger).group(0)
+        names.append(f"{name}_{i}" if name in names else name)
+    return names
+
+def get_n_bins(hist_config, bins):
+    """
+    Number of bins of a histogram including under- and overflow
+    """
+    n = 1
+    for axis in ["x", "y", "z"]:
+        if f"{axis}_bins" in hist_config:
+            n *= bins[hist_config[f"{axis}_bins"]]["n"] + 2
+    if hist_config["type"] == "SlicedProfile1D":
+        n *= len(get_slice_axis(hist_config)) + 1
+    return n
+
+def get_storage(hist_config, bins, storage="auto", threshold=100000):
+    """
+    Storage of a histogram: dense, float or sparse. Profiles are always
+    dense. In auto mode histograms above threshold bins are sparse, or
+    float in one dimension.
+    """
+    hist_type = hist_config["type"]
+    if hist_type not in histo_axes or storage == "dense":
+        return "dense"
+    if storage == "auto":
+        if get_n_bins(hist_config, bins) <= threshold:
+            return "dense"
+        return "float" if hist_type == "Histo1D" else "sparse"
+    return storage
+
+def book_compact_histogram(rdf, hist_config, bins, storage):
+    """
+    Histogram with sparse (THnSparseD) or float (TH*F) storage, converted
+    to the dense type by to_dense after the event loop
+    """
+    load_kernels("histograms")
+    axes = histo_axes[hist_config["type"]]
+    edges = [bins[hist_config[f"{axis}_bins"]]["bins"] for axis in axes]
+    columns = [hist_config[f"{axis}_val"] for axis in axes] + ["weight"]
+    if storage == "sparse":
+        vector_edges = ROOT.std.vector[ROOT.std.vector["double"]]()
+        for axis_edges in edges:
+            vector_edges.push_back(ROOT.std.vector["double"](axis_edges.tolist()))
+        return ROOT.book_sparse_histo(ROOT.RDF.AsRNode(rdf), hist_config["name"],
+                                      hist_config["title"], vector_edges, columns)
+    model_type = getattr(ROOT, f"TH{len(axes)}F")
+    model = model_type(hist_config["name"], hist_config["title"],
+                       *[v for e in edges for v in (len(e)-1, e)])
+    model.SetDirectory(ROOT.nullptr)
+    model.Sumw2()
+    return ROOT.book_float_histo(ROOT.RDF.AsRNode(rdf), model, columns)
+
+def to_dense(hist, hist_config, bins):
+    """
+    TH1D, TH2D or TH3D with the content of a sparse or float histogram
+    """
+    if hist.InheritsFrom("THnBase"):
+        n = hist.GetNdimensions()
+        # The two dimensional projection takes the y dimension first
+        dense = (hist.Projection(0, "E") if n == 1 else hist.Projection(1, 0, "E") if n == 2
+                 else hist.Projection(0, 1, 2, "E"))
+    else:
+        axes = histo_axes[hist_config["type"]]
+        edges = [bins[hist_config[f"{axis}_bins"]]["bins"] for axis in axes]
+        add_directory = ROOT.TH1.AddDirectoryStatus()
+        ROOT.TH1.AddDirectory(False)
+        dense = getattr(ROOT, f"TH{len(axes)}D")(hist_config["name"], "",
+                                                 *[v for e in edges for v in (len(e)-1, e)])
+        ROOT.TH1.AddDirectory(add_directory)
+        dense.Sumw2()
+        dense.Add(hist)
+    dense.SetDirectory(ROOT.nullptr)
+    dense.SetName(hist_config["name"])
+    dense.SetTitle(hist_config["title"])
+    dense.SetEntries(hist.GetEntries())
+    return dense
+
+def create_histogram(filters, hist_config, bins, triggers, storage="dense"):
+    rdf = filters.get(triggers, hist_config.get("cut"))
+
+    if storage != "dense":
+        return book_compact_histogram(rdf, hist_config, bins, storage)
 
     if hist_config["type"] == "Histo1D":
         return rdf.Histo1D((hist_config["name"], hist_config["title"],
@@ -46,26 +247,41 @@ def create_histogram(rdf, hist_config, bins, triggers):
                             bins[hist_config["y_bins"]]["n"], bins[hist_config["y_bins"]]["bins"],
                             bins[hist_config["z_bins"]]["n"], bins[hist_config["z_bins"]]["bins"]),
                             hist_config["x_val"], hist_config["y_val"], hist_config["z_val"], "weight")
+    elif hist_config["type"] == "SlicedProfile1D":
+        # One fill in (x, slice variable), projected into the slices later
+        y_bins = get_slice_axis(hist_config)
+        return rdf.Profile2D((hist_config["name"], hist_config["title"],
+                            bins[hist_config["x_bins"]]["n"], bins[hist_config["x_bins"]]["bins"],
+                            len(y_bins)-1, y_bins),
+                            hist_config["x_val"], get_slice_column(hist_config), hist_config["y_val"],
+                            "weight")
     else:
         raise ValueError(f"Unknown histogram type: {hist_config['type']}")
 
-def make_histograms(args):
-    if args.nThreads:
-        ROOT.EnableImplicitMT(args.nThreads)
-
-    events_chain = ROOT.TChain("Events")
-    runs_chain = ROOT.TChain("Runs")
-                
-    # Split the file list and trigger list if they are given as a string
+def get_filelist(args):
+    # Split the file list if it is given as a string
     if args.filelist:
         filelist = [s.strip() for s in args.filelist.split(",")]
     elif args.filepaths:
+        filelist = []
         paths = [p.strip() for p in args.filepaths.split(",")]
         for path in paths:
-            files.extend(file_read_lines(path, find_ROOT=True))
+            filelist.extend(file_read_lines(path, find_ROOT=True))
     else:
         raise ValueError("No file list provided")
+    return filelist
 
+def get_urls(args):
+    filelist = get_filelist(args)
+    return filelist if args.is_local else [f"root://cms-xrd-global.cern.ch/{file}" for file in filelist]
+
+def make_histograms(args):
+    if args.nThreads:
+        ROOT.EnableImplicitMT(args.nThreads)
+
+    events_chain = ROOT.TChain("Events")
+    runs_chain = ROOT.TChain("Runs")
+                
     triggers = []
     if args.triggerlist:
         triggers = args.triggerlist.split(",")
@@ -73,15 +289,14 @@ def make_histograms(args):
         triggers = file_read_lines(args.triggerpath)
 
     # Load the files
-    for file in filelist:
-        if not args.is_local:
-            events_chain.Add(f"root://cms-xrd-global.cern.ch/{file}")
-            runs_chain.Add(f"root://cms-xrd-global.cern.ch/{file}")
-        else:
-            events_chain.Add(file)
-            runs_chain.Add(file)
+    urls = get_urls(args)
+    for url in urls:
+        events_chain.Add(url)
+        runs_chain.Add(url)
 
-    events_rdf = ROOT.RDataFrame(events_chain)
+    root_rdf = ROOT.RDataFrame(events_chain)
+    events_rdf = define_constants(root_rdf, urls)
+    trigger_bits = read_trigger_bits(urls) if triggers else None
     runs_rdf = ROOT.RDataFrame(runs_chain)
 
     if args.progress_bar:
@@ -93,44 +308,137 @@ def make_histograms(args):
     hist_config.read(args.hist_config)
     hist_config = dict(hist_config)
     bins = get_bins()
+    events_rdf = define_slice_columns(events_rdf, hist_config)
+
+    # Histograms with many bins are stored sparse or as floats, as every
+    # slot of the event loop has its own copy
+    storages = {hist: get_storage(hist_config[hist], bins, args.hist_storage, args.sparse_threshold)
+                for hist in hist_config if hist.lower() != "default"}
+    compact = [storage for storage in storages.values() if storage != "dense"]
+    if compact:
+        print(f"Storage: {compact.count('sparse')} sparse and {compact.count('float')} float "
+              f"histograms")
 
+    # Book all histograms first, so that they are filled in one event loop
     histograms = {}
+    if args.per_trigger:
+        if not triggers:
+            raise ValueError("per_trigger requires a trigger list")
+        # The trigger menu is evaluated once per event into a bitmask with
+        # one bit per region, and every region gets its own histograms
+        # On skims with a trigger mask the paths of the regions are bits of it
+        trigger_names = get_trigger_names(triggers)
+        regions = triggers if trigger_bits is None else \
+                [get_trigger_expression(trigger, trigger_bits) for trigger in triggers]
+        filters = FilterCache(events_rdf.Define("trigger_bins", get_trigger_mask(regions)),
+                              trigger_names, "trigger_bins")
+        for trigger in trigger_names:
+            for hist in hist_config:
+                if hist.lower() == "default":
+                    continue
+                system = hist_config[hist].get("system", args.system)
+                histograms[(trigger, system, hist)] = create_histogram(filters, hist_config[hist],
+                                                                      bins, [trigger],
+                                                                      storages[hist])
+    else:
+        filters = FilterCache(events_rdf, trigger_bits)
+        for hist in hist_config:
+            if hist.lower() == "default":
+                continue
+            histograms[hist] = create_histogram(filters, hist_config[hist], bins, triggers,
+                                                storages[hist])
 
-    for hist in hist_config:
-        if hist.lower() == "default":
-            continue
-        histograms[hist] = create_histogram(events_rdf, hist_config[hist], bins, triggers).GetValue()
+    filters.print_summary(verbose=bool(args.debug_graph))
+    if args.debug_graph:
+        ROOT.RDF.SaveGraph(root_rdf, args.debug_graph)
+        print(f"Computation graph written to {args.debug_graph}")
+
+    if args.dry_run:
+        plan_histograms(args, root_rdf, urls, hist_config, bins, triggers, storages, histograms)
+        return None
+
+    start = time.time()
+    if histograms:
+        ROOT.RDF.RunGraphs(list(histograms.values()))
+    print(f"Filled {len(histograms)} histograms in {root_rdf.GetNRuns()} event loop(s) "
+          f"in {time.time()-start:.1f} s")
+
+    return get_values(histograms, hist_config, bins)
+
+def plan_histograms(args, root_rdf, urls, hist_config, bins, triggers, storages, histograms):
+    """
+    Write the cost estimate of the booked histograms instead of filling them
+    """
+    expressions = list(triggers) + ["weight"] + (["trigger_mask"] if triggers else [])
+    for hist in storages:
+        expressions += [hist_config[hist].get(key) for key in
+                        ["x_val", "y_val", "z_val", "cut", "slice_var"]]
+    branches = get_dataset_branches(urls[0]) & get_identifiers(expressions) if urls else set()
+
+    planned = []
+    for key in histograms:
+        hist = key[-1] if isinstance(key, tuple) else key
+        name = "/".join(key) if isinstance(key, tuple) else key
+        planned.append((name, hist_config[hist]["type"], storages[hist],
+                        get_n_bins(hist_config[hist], bins)))
 
-    return histograms
+    report = make_report("hist", [make_input(urls, branches, 1 if histograms else 0)],
+                         get_graph_counts(root_rdf), planned, get_n_slots(args.nThreads))
+    write_report(report, args.dry_run)
 
-def get_values(histograms):
+def get_values(histograms, hist_config=None, bins=None):
+    """
+    Filled histograms, with the SlicedProfile1D ones replaced by their
+    slices and the sparse and float ones converted to the dense types
+    """
     values = {}
     for hist in histograms:
-        values[hist] = histograms[hist].GetValue()
+        section = hist[-1] if isinstance(hist, tuple) else hist
+        value = histograms[hist].GetValue()
+        if hist_config and hist_config[section].get("type") == "SlicedProfile1D":
+            for projection in project_slices(value, hist_config[section]):
+                name = projection.GetName()
+                values[hist[:-1] + (name,) if isinstance(hist, tuple) else name] = projection
+        elif value.InheritsFrom("THnBase") or value.ClassName() in ("TH1F", "TH2F", "TH3F"):
+            values[hist] = to_dense(value, hist_config[section], bins)
+        else:
+            values[hist] = value
     return values
 
-def save_histograms(histograms, args):
+def get_output_path(args):
     range_str = ""
     if args.run_range:
         run_range = args.run_range.split(",")
         assert(len(run_range) == 2)
         range_str = f"runs{run_range[0]}to{run_range[1]}_"
 
+    output_path = f"J4PHists_{range_str}{args.run_tag}.root"
     if args.out:
         if not os.path.exists(args.out):
             os.makedirs(args.out)
-        output_file = ROOT.TFile(
-                f"{args.out}/J4PHists_{range_str}{args.run_tag}.root",
-                "RECREATE")
-    else:
-        output_file = ROOT.TFile(
-                f"J4PHists_{range_str}{args.run_tag}.root",
-                "RECREATE")
+        output_path = f"{args.out}/{output_path}"
+    return output_path
+
+def save_histograms(histograms, args):
+    output_path = get_output_path(args)
 
+    if args.per_trigger:
+        # trigger/system/method/ layout read by produce_responses
+        samples = {}
+        for (trigger, system, _), hist in histograms.items():
+            sample = samples.setdefault(system, HistogramSample(system))
+            sample.get_histograms().setdefault(trigger, []).append(hist)
+        writer = FileWriter(output_path, list(dict.fromkeys(t for t, _, _ in histograms)))
+        writer.write_samples(list(samples.values()))
+        writer.close()
+        return output_path
+
+    output_file = ROOT.TFile(output_path, "RECREATE")
     for hist in histograms:
         histograms[hist].Write()
 
     output_file.Close()
+    return output_path
 
 def run(args):
     """
@@ -161,5 +469,51 @@ def run(args):
             else:
                 setattr(args, arg, value)
 
+    kind, n_processes = parse_executor(args.executor)
+    if kind == "processes" and not args.dry_run:
+        fill_processes(args, n_processes)
+    else:
+        fill(args)
+
+def fill(args):
+    """
+    Fill the histograms of args and write them with the metadata of the
+    input skims
+    """
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
     histograms = make_histograms(args)
-    save_histograms(histograms, args)    
+    if histograms is not None:
+        output_path = save_histograms(histograms, args)
+
+        # Luminosity and run range of the inputs, combined by merge
+        parameters = read_parameters(get_urls(args))
+        if parameters:
+            write_parameters(output_path, parameters)
+
+def fill_processes(args, n_processes):
+    """
+    Fill the histograms of groups of input files of similar size in worker
+    processes and merge their outputs
+    """
+    filelist = get_filelist(args)
+    groups = balance_files(filelist, n_processes,
+                           os.path.getsize if args.is_local else lambda file: 1)
+
+    tmp_dir = tempfile.mkdtemp(prefix="hist_", dir=os.path.dirname(get_output_path(args)) or ".")
+    worker_args = []
+    for i, group in enumerate(groups):
+        worker = copy.copy(args)
+        worker.executor = "threads"
+        worker.filelist = ",".join(group)
+        worker.filepaths = None
+        worker.out = tmp_dir
+        worker.run_tag = f"{args.run_tag}_{i}"
+        worker.debug_graph = None
+        worker_args.append(worker)
+
+    try:
+        run_processes("histograms", "fill", worker_args)
+        parts = sorted(glob.glob(os.path.join(tmp_dir, "J4PHists_*.root")))
+        merge_files(parts, get_output_path(args), len(parts))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)    
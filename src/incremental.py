@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import time
+
+from checkpoint import read_manifest, write_manifest
+from skimming_utils import get_lumi_ranges
+
+MANIFEST_NAME = "J4PSkim_incremental.json"
+
+def to_lumi_set(lumi_json):
+    return {(int(run), lumi) for run, ranges in lumi_json.items()
+            for first, last in ranges for lumi in range(first, last + 1)}
+
+def to_lumi_json(lumis):
+    """
+    Golden JSON like {run: [[first, last], ...]} of (run, lumi) pairs
+    """
+    lumi_json = {}
+    for run, lumi in sorted(lumis):
+        ranges = lumi_json.setdefault(str(run), [])
+        if ranges and ranges[-1][1] == lumi - 1:
+            ranges[-1][1] = lumi
+        else:
+            ranges.append([lumi, lumi])
+    return lumi_json
+
+def get_file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def get_manifest_path(args):
+    return os.path.join(args.out, MANIFEST_NAME)
+
+def plan_increment(files, infos, args):
+    """
+    Golden lumisections of files not covered by the existing shards of
+    args.out, using the lumisection coverage of the files in the catalog.
+
+    Returns the files with new lumisections, the new (run, lumi) pairs of
+    each of them and the files which were never skimmed before.
+    """
+    manifest = read_manifest(get_manifest_path(args))
+    if manifest.get("channels", args.channel) != args.channel:
+        raise ValueError(f"{get_manifest_path(args)} was written for channels "
+                         f"{manifest['channels']}, not {args.channel}")
+    covered = manifest.get("covered", {})
+
+    golden = {(run, lumi) for run, ranges in get_lumi_ranges(args.golden_json).items()
+              for first, last in ranges for lumi in range(first, last + 1)}
+
+    # Lumisections can be decertified, but they are already in a shard
+    decertified = set()
+    for lumi_json in covered.values():
+        decertified |= to_lumi_set(lumi_json) - golden
+    if decertified:
+        print(f"WARNING: {len(decertified)} lumisections in existing shards are not in "
+              f"{args.golden_json} anymore")
+
+    new_files = []
+    new_lumis = {}
+    for file in files:
+        lumis = (to_lumi_set(infos[file]["lumis"]) & golden) - to_lumi_set(covered.get(file, {}))
+        if lumis:
+            new_files.append(file)
+            new_lumis[file] = lumis
+
+    shard_lumis = set().union(*new_lumis.values())
+    print(f"Incremental skim: {len(new_files)}/{len(files)} files with "
+          f"{len(shard_lumis)} new golden lumisections, "
+          f"{len([f for f in new_files if f not in covered])} new files")
+
+    # The shard is filtered with a single JSON, so a lumisection split
+    # between an old and a new file would be read again from the old one
+    overlap = sum(len(to_lumi_set(covered[f]) & shard_lumis) for f in new_files if f in covered)
+    if overlap:
+        print(f"WARNING: {overlap} lumisections of the new files are already covered in "
+              f"other files and will be skimmed again")
+
+    return new_files, new_lumis, {f for f in new_files if f not in covered}
+
+def write_shard_json(new_lumis, args):
+    """
+    Golden JSON of the new lumisections, used both to filter the shard and
+    for its luminosity. Returns its path and run range.
+    """
+    lumis = set().union(*new_lumis.values())
+    runs = sorted({run for run, _ in lumis})
+    shard = len(read_manifest(get_manifest_path(args)).get("shards", []))
+    path = os.path.join(args.out, f"J4PSkim_runs{runs[0]}to{runs[-1]}_golden_{shard}.json")
+    with open(path, "w") as f:
+        json.dump(to_lumi_json(lumis), f)
+    return path, (runs[0], runs[-1])
+
+def record_shard(new_lumis, outputs, golden_json, shard_json, args):
+    """
+    Add the lumisections skimmed into outputs to the manifest
+    """
+    manifest_path = get_manifest_path(args)
+    manifest = read_manifest(manifest_path)
+    manifest["channels"] = args.channel
+    covered = manifest.setdefault("covered", {})
+    for file, lumis in new_lumis.items():
+        covered[file] = to_lumi_json(to_lumi_set(covered.get(file, {})) | lumis)
+    manifest.setdefault("shards", []).append({
+        "outputs": outputs,
+        "files": sorted(new_lumis),
+        "golden_json": os.path.abspath(golden_json),
+        "golden_hash": get_file_hash(golden_json),
+        "shard_json": shard_json,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    write_manifest(manifest_path, manifest)
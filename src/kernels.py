@@ -0,0 +1,105 @@
+import ROOT
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+KERNEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpp")
+CACHE_DIR = os.environ.get("J4P_KERNEL_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "dijet_rdf"))
+
+# Kernels using symbols of other kernels
+dependencies = {
+    "corrections": ["kernels"],
+}
+
+# Kernels loaded in this process, name -> "library" or "declare"
+loaded = {}
+
+def get_headers():
+    return sorted(f for f in os.listdir(KERNEL_DIR) if f.endswith(".h"))
+
+def get_kernel_hash(name):
+    """
+    Hash of everything the compiled library depends on: the kernel source,
+    all kernel headers, the ROOT version and the include path (ie.
+    correctionlib).
+    """
+    h = hashlib.sha256()
+    for source in [name + ".cxx"] + get_headers():
+        with open(os.path.join(KERNEL_DIR, source), "rb") as f:
+            h.update(f.read())
+    h.update(ROOT.gROOT.GetVersion().encode())
+    h.update(str(ROOT.gSystem.GetIncludePath()).encode())
+    return h.hexdigest()[:16]
+
+def build_library(name, lib_dir):
+    """
+    Compile the kernel with ACLiC in a temporary directory and move the
+    result into lib_dir. The rename is atomic, so concurrent jobs sharing
+    the cache never see a partial build.
+    """
+    os.makedirs(os.path.dirname(lib_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f"{name}_", dir=os.path.dirname(lib_dir))
+    try:
+        for source in [name + ".cxx"] + get_headers():
+            shutil.copy(os.path.join(KERNEL_DIR, source), tmp_dir)
+        start = time.time()
+        if not ROOT.gSystem.CompileMacro(os.path.join(tmp_dir, name + ".cxx"), "kO", "", tmp_dir):
+            raise RuntimeError(f"Compilation of {name}.cxx failed")
+        print(f"Compiled {name} kernels in {time.time() - start:.1f} s")
+        try:
+            os.rename(tmp_dir, lib_dir)
+        except OSError:
+            # Someone else finished first
+            if not os.path.isdir(lib_dir):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def find_library(lib_dir, name):
+    if not os.path.isdir(lib_dir):
+        return None
+    for f in os.listdir(lib_dir):
+        if f.startswith(name + "_cxx") and f.endswith(".so"):
+            return os.path.join(lib_dir, f)
+    return None
+
+def load_library(name):
+    lib_dir = os.path.join(CACHE_DIR, f"{name}_{get_kernel_hash(name)}")
+    lib = find_library(lib_dir, name)
+    if lib is None:
+        build_library(name, lib_dir)
+        lib = find_library(lib_dir, name)
+    if lib is None or ROOT.gSystem.Load(lib) < 0:
+        raise RuntimeError(f"Could not load {name} kernels from {lib_dir}")
+    ROOT.gInterpreter.Declare(f'#include "{os.path.join(KERNEL_DIR, name)}.h"')
+
+def load_kernels(name):
+    """
+    Make the C++ kernels in cpp/<name>.cxx available to ROOT.
+
+    By default the kernels are compiled once into a shared library, cached
+    under J4P_KERNEL_CACHE by content hash and loaded, so that jobs do not
+    pay the JIT cost at startup. With J4P_KERNELS=declare, or if the
+    library can not be built, the sources are declared to cling instead.
+    """
+    if name in loaded:
+        return loaded[name]
+    for dependency in dependencies.get(name, []):
+        load_kernels(dependency)
+
+    mode = os.environ.get("J4P_KERNELS", "library")
+    if mode == "library":
+        try:
+            load_library(name)
+            loaded[name] = "library"
+            return loaded[name]
+        except Exception as e:
+            print(f"Falling back to declaring {name} kernels: {e}")
+
+    if not ROOT.gInterpreter.Declare(f'#include "{os.path.join(KERNEL_DIR, name)}.cxx"'):
+        raise RuntimeError(f"Could not declare {name} kernels")
+    loaded[name] = "declare"
+    return loaded[name]
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+
+DEFAULT_PATH = os.environ.get("J4P_LUMI_INDEX",
+                              os.path.join(os.path.expanduser("~"), ".cache", "dijet_rdf",
+                                           "lumi.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lumis (
+    run INTEGER,
+    ls INTEGER,
+    delivered REAL,
+    recorded REAL,
+    avgpu REAL,
+    PRIMARY KEY (run, ls)
+) WITHOUT ROWID
+"""
+
+# Factors from the brilcalc units to /fb
+units = {"/fb": 1.0, "/pb": 1e-3, "/nb": 1e-6, "/ub": 1e-9, "/mb": 1e-12}
+
+def get_unit_factor(column):
+    for unit, factor in units.items():
+        if column.endswith(f"({unit})"):
+            return factor
+    raise ValueError(f"Unknown luminosity unit in {column}")
+
+def read_brilcalc_csv(path):
+    """
+    Read the output of brilcalc lumi --byls into (run, ls, delivered,
+    recorded, avgpu) rows with the luminosities in /fb
+    """
+    rows = []
+    header = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#run:fill"):
+                header = line[1:].split(",")
+                delivered = next(i for i, c in enumerate(header) if c.startswith("delivered"))
+                recorded = next(i for i, c in enumerate(header) if c.startswith("recorded"))
+                delivered_factor = get_unit_factor(header[delivered])
+                recorded_factor = get_unit_factor(header[recorded])
+                avgpu = header.index("avgpu") if "avgpu" in header else None
+                if "ls" not in header:
+                    raise ValueError(f"{path} has no ls column, run brilcalc lumi with --byls")
+                ls = header.index("ls")
+                continue
+            if not line or line.startswith("#"):
+                continue
+            if header is None:
+                raise ValueError(f"{path} has no brilcalc header")
+
+            values = line.split(",")
+            rows.append((int(values[0].split(":")[0]), int(values[ls].split(":")[0]),
+                         float(values[delivered]) * delivered_factor,
+                         float(values[recorded]) * recorded_factor,
+                         float(values[avgpu]) if avgpu is not None else 0.0))
+    return rows
+
+class LumiIndex:
+    """
+    Per-lumisection delivered and recorded luminosity imported from
+    brilcalc, indexed by (run, ls)
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(SCHEMA)
+
+    def import_csv(self, path):
+        rows = read_brilcalc_csv(path)
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO lumis VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def get_lumi(self, lumis):
+        """
+        Recorded luminosity in /fb of the (run, ls) pairs in lumis and the
+        number of them missing from the index
+        """
+        by_run = {}
+        for run, ls in lumis:
+            by_run.setdefault(run, set()).add(ls)
+
+        total = 0.0
+        n_missing = 0
+        for run, lss in by_run.items():
+            recorded = dict(self.connection.execute(
+                    "SELECT ls, recorded FROM lumis WHERE run = ?", (run,)).fetchall())
+            for ls in lss:
+                if ls in recorded:
+                    total += recorded[ls]
+                else:
+                    n_missing += 1
+        return total, n_missing
+
+    def summary(self):
+        return self.connection.execute(
+                "SELECT COUNT(DISTINCT run), COUNT(*), SUM(recorded) FROM lumis").fetchone()
+
+    def close(self):
+        self.connection.close()
+
+def run(args):
+    index = LumiIndex(args.index)
+    for path in args.csv.split(","):
+        print(f"Imported {index.import_csv(path.strip())} lumisections from {path}")
+    n_runs, n_lumis, recorded = index.summary()
+    print(f"{args.index}: {n_runs} runs, {n_lumis} lumisections, {recorded or 0.0:.3f} /fb recorded")
+    index.close()
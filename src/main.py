@@ -1,10 +1,16 @@
 import argparse
+import os
 import ROOT
 
+import benchmark
+import catalog
+import executor
 import find_json
 import find_newest
 import find_range
 import histograms
+import lumi_index
+import merge
 import produce_ratio
 import produce_responses
 import produce_time_evolution
@@ -12,6 +18,7 @@ import produce_vetomaps
 # from plotting import produce_plots
 import skim
 import met
+import synthetic
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='JEC4PROMPT Toolkit: \
@@ -44,8 +51,45 @@ def parse_arguments():
     hist_parser.add_argument("--run_tag", type=str, help="Run tag")
     hist_parser.add_argument("--nThreads", type=int, help="Number of threads to be used \
             for multithreading")
+    hist_parser.add_argument("--executor", type=str, default="threads", help="threads (default) runs one \
+            RDataFrame with --nThreads threads, processes:N splits the input into N groups of \
+            similar size, each processed by its own worker process with its own RDataFrame, \
+            and merges their outputs. A timing summary of the workers is printed")
     hist_parser.add_argument("--out", type=str, required=True, default="", help="Output path \
             (output file name included)")
+    hist_parser.add_argument("--per_trigger", action="store_true", help="Fill the histograms \
+            separately for each trigger region of the trigger list in the same event loop, \
+            written as trigger/system/method/histogram")
+    hist_parser.add_argument("--system", type=str, default="all", help="System directory of the \
+            histograms with --per_trigger, unless set with system in the histogram config")
+    hist_parser.add_argument("--hist_storage", type=str, default="auto",
+            choices=["auto", "dense", "float", "sparse"], help="Storage of the Histo1D/2D/3D \
+            histograms while filling. auto uses sparse storage for 2D and 3D and float storage \
+            for 1D histograms above --sparse_threshold bins and dense storage otherwise. The \
+            histograms are written as the usual TH1D/TH2D/TH3D")
+    hist_parser.add_argument("--sparse_threshold", type=int, default=100000, help="Number of \
+            bins above which --hist_storage auto uses a compact storage")
+    hist_parser.add_argument("--debug_graph", type=str, help="Print the shared filter nodes \
+            and write the computation graph in DOT format into the given file")
+    hist_parser.add_argument("--dry_run", type=str, nargs="?", const="-", help="Build the \
+            computation graph and write the estimated event loops, bytes read, JIT expressions \
+            and histogram memory of the histograms as JSON into the given file (stdout without a file) \
+            instead of running it")
+
+    # Merge config
+    merge_parser = subparsers.add_parser("merge", help="Merge histogram outputs of hist in \
+            parallel")
+    merge_files = merge_parser.add_mutually_exclusive_group(required=True)
+    merge_files.add_argument("--filelist", type=str, help="Comma separated list of input files")
+    merge_files.add_argument('-fp', '--filepaths', type=str, help='Comma separated list of \
+            text files containing input files (one input file per line).')
+    merge_files.add_argument("--input_dir", type=str, help="Directory of the J4PHists_*.root \
+            files to merge")
+    merge_parser.add_argument("--out", type=str, required=True, help="Output file")
+    merge_parser.add_argument("--nWorkers", type=int, help="Number of worker processes \
+            (default: number of CPUs)")
+    merge_parser.add_argument("--fan_in", type=int, default=8, help="Number of files merged \
+            by a worker at each level of the reduction")
 
     # Find JSON config
     find_json_parser = subparsers.add_parser('find_json', help='Find JSON File appropriate for given run')
@@ -84,6 +128,24 @@ def parse_arguments():
     find_range_parser.add_argument("--nThreads", type=int, help="Number of threads to be used \
             for multithreading")
     find_range_parser.add_argument("--progress_bar", action="store_true", help="Show progress bar")
+    find_range_parser.add_argument("--catalog", type=str, help="Read the run range from the \
+            file catalog at this path, ie. " + catalog.DEFAULT_PATH + ", instead of an event loop")
+
+    # Catalog config
+    catalog_parser = subparsers.add_parser("catalog", help="Scan the metadata of input files \
+            into the file catalog")
+    catalog_files = catalog_parser.add_mutually_exclusive_group(required=True)
+    catalog_files.add_argument("--filelist", type=str, help="Comma separated list of \
+            input files")
+    catalog_files.add_argument('-fp', '--filepaths', type=str, help='Comma separated list of \
+            text files containing input files (one input file per line).')
+    catalog_parser.add_argument("-loc", "--is_local", action="store_true", help='Run locally. \
+            If not set will append root://cms-xrd-global.cern.ch/ \
+            to the start of file names')
+    catalog_parser.add_argument("--catalog", type=str, default=catalog.DEFAULT_PATH,
+            help="Path to the catalog (default %(default)s)")
+    catalog_parser.add_argument("--rescan", action="store_true", help="Scan all files again, \
+            even if they have not changed")
 
     # Produce ratio config
     ratio_parser = subparsers.add_parser("produce_ratio", help="Produce Data vs. MC comparisons")
@@ -107,6 +169,10 @@ def parse_arguments():
             the histogram config file.')
     ratio_parser.add_argument("--groups_of", type=int, help="Produce ratios for \
             groups containing given number of runs")
+    ratio_parser.add_argument("--dry_run", type=str, nargs="?", const="-", help="Build the \
+            computation graph and write the estimated event loops, bytes read, JIT expressions \
+            and histogram memory of the ratios as JSON into the given file (stdout without a file) \
+            instead of running it")
 
     # Produce responses config
     responses_parser = subparsers.add_parser("produce_responses", help="Produce responses \
@@ -146,6 +212,10 @@ def parse_arguments():
     time_evolution_parser.add_argument("--progress_bar", action="store_true", help="Show progress bar")
     time_evolution_parser.add_argument('-hconf', '--hist_config', required=True, type=str, help='Path to the histogram \
             config file.')
+    time_evolution_parser.add_argument("--dry_run", type=str, nargs="?", const="-", help="Build the \
+            computation graph and write the estimated event loops, bytes read, JIT expressions \
+            and histogram memory of the time evolution as JSON into the given file (stdout without a file) \
+            instead of running it")
 
     # Produce vetomaps config
     vetomaps_parser = subparsers.add_parser("produce_vetomaps", help="Produce VetoMaps for files \
@@ -198,11 +268,22 @@ def parse_arguments():
             choices=["dijet", "zjet", "egamma", "multijet"],
             help="Dataset type: dijet, zjet, egamma or multijet")
     skim_parser.add_argument("--channel", type=str,
-            choices=["dijet", "zmm", "photonjet", "multijet"],
-            help="Channel type: dijet, zmm, photonjet or multijet")
+            help="Comma separated list of channels: dijet, zmm, photonjet or multijet. \
+                    All channels are written in the same event loop")
     skim_parser.add_argument("--nThreads", type=int, help="Number of threads to be used \
             for multithreading")
+    skim_parser.add_argument("--executor", type=str, default="threads", help="threads (default) runs one \
+            RDataFrame with --nThreads threads, processes:N splits the input into N steps (see \
+            --split), each processed by its own worker process with its own RDataFrame, \
+            and merges their outputs. A timing summary of the workers is printed")
+    skim_parser.add_argument("--dry_run", type=str, nargs="?", const="-", help="Build the \
+            computation graph and write the estimated event loops, bytes read, JIT expressions \
+            and histogram memory of the skim as JSON into the given file (stdout without a file) \
+            instead of running it")
     skim_parser.add_argument("--golden_json", type=str, help="Golden JSON for filtering")
+    skim_parser.add_argument("--plan_lumis", action="store_true", help="Read the LuminosityBlocks \
+            tree of the input files before the event loop to drop files without golden \
+            lumisections and only read the clusters of partially good files")
     skim_parser.add_argument("--is_mc", action="store_true", help="Set if input files are MC data.")
     skim_parser.add_argument("--run_range", type=str, help="Run range of the given input files \
             (run_min and run_max separated by a comma)")
@@ -211,10 +292,112 @@ def parse_arguments():
                              JECs, vetomaps, etc.")
     skim_parser.add_argument("--correction_key", type=str, help="Key in the correction JSON file \
                              defining the corrections to be applied")
+    skim_parser.add_argument("--jec_cache_size", type=int, default=0, help="Memoize JECs \
+            of quantized (eta, phi, area, rho, pt) inputs in a per-thread LRU cache of given \
+            size (default 0, disabled)")
+    skim_parser.add_argument("--vetomap_mode", type=str, default="bitmap",
+            choices=["bitmap", "correctionlib"], help="Evaluate vetomaps from a precomputed \
+                    bitmap validated against correctionlib at startup (default), or with \
+                    correctionlib for every jet")
+    skim_parser.add_argument("--catalog", type=str, help="Path to a file catalog used to \
+            split the input files, plan the golden JSON filtering and check the \
+            input branches. Files missing from the catalog are scanned into it")
+    skim_parser.add_argument("--split", type=str, choices=["files", "entries", "bytes"],
+            help="How --nsteps splits the input: every nsteps-th file (files, default without \
+                    --catalog), or steps with similar numbers of events (entries, default with \
+                    --catalog) or compressed bytes (bytes, default with --executor processes), \
+                    splitting large files into entry ranges. entries and bytes use the file \
+                    catalog")
+    skim_parser.add_argument("--checkpoint", action="store_true", help="Skim groups of \
+            --files_per_unit input files separately, recording finished groups and unreadable \
+            files in a manifest next to the output, so that a rerun skips them. The groups are \
+            merged into the usual outputs at the end")
+    skim_parser.add_argument("--files_per_unit", type=int, default=1, help="Number of input \
+            files skimmed together with --checkpoint (default 1)")
+    skim_parser.add_argument("--retry_quarantined", action="store_true", help="With \
+            --checkpoint, retry the files quarantined by previous runs")
+    skim_parser.add_argument("--incremental", action="store_true", help="Only skim the golden \
+            lumisections of the input files not covered by the outputs already in --out, \
+            according to the manifest J4PSkim_incremental.json, into a new output tagged with \
+            its run range. Uses the file catalog")
+    skim_parser.add_argument("--lumi_index", type=str, help="Path to a lumi index (see the \
+            lumi_index command) used to compute the integrated luminosity of the golden \
+            lumisections of the input files. Defaults to " + lumi_index.DEFAULT_PATH + " if it \
+            exists. Without an index, --run_range calls brilcalc")
+    skim_parser.add_argument("--jet_kernel", type=str, default="chain",
+            choices=["chain", "fused"], help="Apply the jet ID fix, JECs, pT sorting and \
+                    vetomaps as a chain of RDF columns (default), or in a single compiled \
+                    kernel with the same output")
+    skim_parser.add_argument("--propagate_met", action="store_true", help="Replace the \
+            PuppiMET by the type-1 corrected one, with the JECs propagated to it, with both \
+            --jet_kernel options")
+    skim_parser.add_argument("--trigger_mask", action="store_true", help="Write the triggers \
+            as a single uint64 bitmask column trigger_mask, with the trigger of each bit stored \
+            in the file, instead of one branch per trigger. At most 64 triggers")
+
+    # Lumi index config
+    lumi_index_parser = subparsers.add_parser("lumi_index", help="Import brilcalc lumi --byls \
+            CSV output into the lumi index used by the skim")
+    lumi_index_parser.add_argument("--csv", type=str, required=True, help="Comma separated list \
+            of CSV files written by brilcalc lumi --byls")
+    lumi_index_parser.add_argument("--index", type=str, default=lumi_index.DEFAULT_PATH,
+            help="Path to the lumi index (default %(default)s)")
+
+    # Benchmark config
+    benchmark_parser = subparsers.add_parser("benchmark", help="Run performance benchmarks")
+    benchmark_parser.add_argument("--suite", type=str, required=True, help="Comma separated list \
+            of benchmarks to run: " + ", ".join(benchmark.suites))
+    benchmark_parser.add_argument("--golden_json", type=str, help="Golden JSON used by the \
+            lumi_mask benchmark")
+    benchmark_parser.add_argument("--correction_json", type=str, help="Path to a JSON file \
+            defining JECs, vetomaps, etc.")
+    benchmark_parser.add_argument("--correction_key", type=str, help="Key in the correction \
+            JSON file defining the corrections to be benchmarked")
+    benchmark_parser.add_argument("--n_lookups", type=int, default=10000000, help="Number of \
+            lookups per timed loop")
+    benchmark_parser.add_argument("--n_events", type=int, default=1000000, help="Number of \
+            events per timed loop")
+    benchmark_parser.add_argument("--jec_cache_size", type=int, default=100000, help="JEC cache \
+            size used by the jec benchmark")
+    benchmark_parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    benchmark_parser.add_argument("--filelist", type=str, help="Comma separated list of \
+            NanoAOD files used by the jet_kernel benchmark")
+    benchmark_parser.add_argument("--nThreads", type=int, help="Number of threads to be used \
+            for multithreading")
+    benchmark_parser.add_argument("--synthetic_dir", type=str, help="Directory written by the \
+            synthetic command used by the throughput benchmark. If not set, synthetic files \
+            are generated into a temporary directory")
+    benchmark_parser.add_argument("--threads", type=str, default="1,4,8", help="Comma separated \
+            list of thread counts used by the throughput benchmark")
+    benchmark_parser.add_argument("--channels", type=str, default="dijet,zmm,photonjet,multijet",
+            help="Comma separated list of channels used by the throughput benchmark")
+    benchmark_parser.add_argument("--out", type=str, help="Output JSON file for the results")
+
+    # Synthetic NanoAOD config
+    synthetic_parser = subparsers.add_parser("synthetic", help="Generate synthetic NanoAOD \
+            files with a matching golden JSON, JECs and vetomap for benchmarks")
+    synthetic_parser.add_argument("--out", type=str, required=True, help="Output directory")
+    synthetic_parser.add_argument("--n_runs", type=int, default=4, help="Number of runs, \
+            one file per run")
+    synthetic_parser.add_argument("--lumis_per_run", type=int, default=20, help="Number of \
+            lumisections per run")
+    synthetic_parser.add_argument("--events_per_lumi", type=int, default=500, help="Number of \
+            events per lumisection")
+    synthetic_parser.add_argument("--mean_jets", type=float, default=6.0, help="Mean jet \
+            multiplicity")
+    synthetic_parser.add_argument("--photon_fraction", type=float, default=0.2, help="Fraction \
+            of events with a photon tag")
+    synthetic_parser.add_argument("--z_fraction", type=float, default=0.1, help="Fraction \
+            of events with a Z -> mumu tag")
+    synthetic_parser.add_argument("--bad_lumi_fraction", type=float, default=0.1, help="Fraction \
+            of lumisections left out of the golden JSON")
+    synthetic_parser.add_argument("--seed", type=int, default=42, help="Random seed")
 
     met_parser = subparsers.add_parser('met', help = 'Perform MET analysis')
     met_parser.add_argument('-nt', '--n_threads', type = int,
                             help = 'How many threads for multithreading')
+    met_parser.add_argument('--executor', type = str, default = 'threads',
+                            help = 'threads (default) runs one RDataFrame with --n_threads threads, processes:N runs N steps (see --split) in worker processes and merges their histograms')
     met_parser.add_argument('-o', '--out', type = str, required = True, default = '',
                             help = 'Output path')
     met_parser.add_argument('-il', '--is_local', action = 'store_true',
@@ -226,6 +409,10 @@ def parse_arguments():
                            help = 'Number of steps input files are grouped into')
     met_parser.add_argument('-s', '--step', type = int,
                            help = 'Step to be processed.')
+    met_parser.add_argument('--split', type = str, choices = ['files', 'entries', 'bytes'],
+                           help = 'Split by files (default), or into steps with similar numbers of events or compressed bytes (default with --executor processes) using the file catalog')
+    met_parser.add_argument('--catalog', type = str, default = catalog.DEFAULT_PATH,
+                           help = 'Path to the file catalog used by --split entries and bytes')
     
     met_files = met_parser.add_mutually_exclusive_group(required = True)
     met_files.add_argument('-fl', '--filelist', type = str,
@@ -253,13 +440,67 @@ def parse_arguments():
         if (args.step is not None and args.nsteps is not None):
             if args.step > args.nsteps:
                 raise ValueError("step should be less than nsteps")
+        if args.channel:
+            for channel in args.channel.split(","):
+                if channel.strip() not in ["dijet", "zmm", "photonjet", "multijet"]:
+                    raise ValueError(f"Unknown channel {channel}")
         if args.dataset:
             print("--dataset is deprecated. Use --channel instead.")
             args.channel = args.dataset
+        if args.incremental:
+            if not args.golden_json or args.is_mc or not args.channel:
+                raise ValueError("incremental requires golden_json, channel and data")
+            if args.nsteps is not None or args.run_range:
+                raise ValueError("incremental can not be used with nsteps or run_range")
+            if not args.catalog:
+                args.catalog = catalog.DEFAULT_PATH
+        if args.lumi_index is None and os.path.exists(lumi_index.DEFAULT_PATH):
+            args.lumi_index = lumi_index.DEFAULT_PATH
+        if args.files_per_unit < 1:
+            raise ValueError("files_per_unit should be at least 1")
+        if args.split is None:
+            if executor.parse_executor(args.executor)[0] == "processes":
+                args.split = "bytes"
+            else:
+                args.split = "entries" if args.catalog else "files"
+        if executor.parse_executor(args.executor)[0] == "processes":
+            if args.nsteps is not None or args.incremental:
+                raise ValueError("executor processes can not be used with nsteps or incremental")
+        if args.split != "files" and not args.catalog:
+            args.catalog = catalog.DEFAULT_PATH
+
+    elif args.subparser_name == "benchmark":
+        for suite in args.suite.split(","):
+            if suite not in benchmark.suites:
+                raise ValueError(f"Unknown benchmark suite {suite}")
+        suites = args.suite.split(",")
+        if "lumi_mask" in suites and not args.golden_json:
+            raise ValueError("lumi_mask benchmark requires --golden_json")
+        if any(suite in suites for suite in ["vetomap", "jec", "jet_kernel"]) and \
+                not (args.correction_json and args.correction_key):
+            raise ValueError("vetomap, jec and jet_kernel benchmarks require --correction_json and --correction_key")
+        if "jet_kernel" in suites and not args.filelist:
+            raise ValueError("jet_kernel benchmark requires --filelist")
+        if "throughput" in suites:
+            for channel in args.channels.split(","):
+                if channel not in benchmark.channel_configs:
+                    raise ValueError(f"Unknown channel {channel}")
+
+    elif args.subparser_name == "synthetic":
+        if args.photon_fraction + args.z_fraction > 1.0:
+            raise ValueError("photon_fraction and z_fraction should sum up to at most 1")
+
+    elif args.subparser_name == "merge":
+        if args.fan_in < 2:
+            raise ValueError("fan_in should be at least 2")
 
     elif args.subparser_name == 'met':
         if not args.filelist and not args.filepaths:
             raise ValueError('Filelist or filepath required')
+        if executor.parse_executor(args.executor)[0] == 'processes' and args.n_steps is not None:
+            raise ValueError('executor processes can not be used with n_steps')
+        if args.split is None:
+            args.split = 'bytes' if executor.parse_executor(args.executor)[0] == 'processes' else 'files'
 
     return args
 
@@ -271,10 +512,18 @@ if __name__ == "__main__":
     
     # One day when Python version >= 3.10.0
     # is used implement match here instead.
-    if command == "find_json":
+    if command == "benchmark":
+        benchmark.run(args)
+    elif command == "catalog":
+        catalog.run(args)
+    elif command == "find_json":
         find_json.run(args)
     elif command == "find_newest":
         find_newest.run(args)
+    elif command == "lumi_index":
+        lumi_index.run(args)
+    elif command == "merge":
+        merge.run(args)
     elif command == "find_range":
         find_range.run(args)
     elif command == "hist":
@@ -287,6 +536,8 @@ if __name__ == "__main__":
         produce_responses.run(args)
     elif command == "skim":
         skim.run(args)
+    elif command == "synthetic":
+        synthetic.run(args)
     elif command == "produce_time_evolution":
         produce_time_evolution.run(args)
     elif command == "produce_plots":
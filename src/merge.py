@@ -0,0 +1,210 @@
+import ROOT
+import glob
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+from kernels import load_kernels
+from metadata import read_parameters, write_parameters
+from processing_utils import file_read_lines
+
+# Storage type of the bin contents by the last letter of the class name,
+# profiles always store doubles
+dtypes = {"D": np.float64, "F": np.float32, "I": np.int32, "S": np.int16, "C": np.int8,
+          "L": np.int64}
+
+# Length of the statistics arrays of GetStats and PutStats (TProfile3D)
+N_STATS = 13
+
+def as_array(view, n, dtype=np.float64):
+    """
+    Writable NumPy view of n elements of a C++ array
+    """
+    view.reshape((n,))
+    return np.frombuffer(view, dtype=dtype, count=n)
+
+def is_profile(hist):
+    return hist.InheritsFrom("TProfile") or hist.InheritsFrom("TProfile2D") \
+            or hist.InheritsFrom("TProfile3D")
+
+def get_binning(hist):
+    """
+    Class, number of bins, range and variable edges of every axis of hist
+    """
+    binning = [hist.ClassName()]
+    for axis in [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()][:hist.GetDimension()]:
+        edges = axis.GetXbins()
+        binning.append((axis.GetNbins(), axis.GetXmin(), axis.GetXmax(),
+                        tuple(as_array(edges.GetArray(), edges.GetSize()))
+                        if edges.GetSize() else ()))
+    return binning
+
+def get_arrays(hist):
+    """
+    Views of the bin contents and sums of squared weights of hist, and for
+    profiles the sums of weights and squared weights of the bins. Missing
+    arrays are None.
+    """
+    n = hist.GetNcells()
+    dtype = np.float64 if is_profile(hist) else dtypes[hist.ClassName()[-1]]
+    arrays = [as_array(hist.GetArray(), n, dtype)]
+    others = [hist.GetSumw2()]
+    if is_profile(hist):
+        others += [ROOT.profile_bin_entries(hist), hist.GetBinSumw2()]
+    for array in others:
+        arrays.append(as_array(array.GetArray(), array.GetSize()) if array.GetSize() else None)
+    return arrays
+
+def add_histogram(hist, other, name, path):
+    """
+    Add other, read from path, to hist bin by bin with NumPy
+    """
+    if get_binning(hist) != get_binning(other):
+        raise ValueError(f"Binning of {name} in {path} differs from the other inputs")
+
+    stats, other_stats = np.zeros(N_STATS), np.zeros(N_STATS)
+    hist.GetStats(stats)
+    other.GetStats(other_stats)
+    entries = hist.GetEntries() + other.GetEntries()
+
+    arrays, other_arrays = get_arrays(hist), get_arrays(other)
+    # Only one of them has sums of squared weights, so fill them from the
+    # contents like TH1::Add does
+    if any((a is None) != (b is None) for a, b in zip(arrays, other_arrays)):
+        for h in (hist, other):
+            if h.GetSumw2N() == 0 or (is_profile(h) and h.GetBinSumw2().GetSize() == 0):
+                h.Sumw2()
+        arrays, other_arrays = get_arrays(hist), get_arrays(other)
+    for array, other_array in zip(arrays, other_arrays):
+        if array is not None:
+            np.add(array, other_array, out=array)
+
+    hist.PutStats(stats + other_stats)
+    hist.SetEntries(entries)
+
+def read_histograms(path, directory=None, prefix="", histograms=None):
+    """
+    Histograms of path keyed by their path in the file, ie.
+    trigger/system/method/name for the FileWriter layout
+    """
+    if histograms is None:
+        histograms = {}
+    f = None
+    if directory is None:
+        f = directory = ROOT.TFile.Open(path)
+        if not f or f.IsZombie():
+            raise OSError(f"Could not open {path}")
+    for key in directory.GetListOfKeys():
+        name = prefix + key.GetName()
+        # Keys are sorted by cycle, only the newest one is read
+        if name in histograms:
+            continue
+        cls = ROOT.TClass.GetClass(key.GetClassName())
+        if cls.InheritsFrom("TDirectory"):
+            read_histograms(path, key.ReadObj(), name + "/", histograms)
+        elif cls.InheritsFrom("TH1"):
+            hist = key.ReadObj()
+            hist.SetDirectory(ROOT.nullptr)
+            histograms[name] = hist
+    if f:
+        f.Close()
+    return histograms
+
+def write_histograms(histograms, path):
+    f = ROOT.TFile(path, "RECREATE")
+    for name, hist in histograms.items():
+        directory, _, key = name.rpartition("/")
+        if directory and not f.GetDirectory(directory):
+            f.mkdir(directory)
+        (f.GetDirectory(directory) if directory else f).cd()
+        hist.Write(key)
+    f.Close()
+
+def merge_group(inputs, output):
+    """
+    Merge the histogram files inputs into output, reading every file once.
+    Run in the worker processes.
+    """
+    start = time.time()
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+    load_kernels("histograms")
+
+    merged = read_histograms(inputs[0])
+    for path in inputs[1:]:
+        histograms = read_histograms(path)
+        different = sorted(merged.keys() ^ histograms.keys())
+        if different:
+            raise ValueError(f"Histograms of {path} differ from {inputs[0]}: "
+                             f"{', '.join(different[:5])}")
+        for name, hist in histograms.items():
+            add_histogram(merged[name], hist, name, path)
+    write_histograms(merged, output)
+
+    # int_lumi adds up and the run range is the union, see metadata.py
+    parameters = read_parameters(inputs, strict=True)
+    if parameters:
+        write_parameters(output, parameters)
+    elif any(read_parameters([path]) for path in inputs):
+        print(f"Some of {inputs[0]} ... {inputs[-1]} have no metadata, int_lumi and the "
+              f"run range are not written")
+    return output, len(inputs), time.time() - start
+
+def merge_files(inputs, output, n_workers, fan_in=8):
+    """
+    Merge inputs into output with a tree reduction: groups of fan_in files
+    are merged in parallel into temporary files, which are merged again
+    until a single group is left
+    """
+    start = time.time()
+    tmp_dir = tempfile.mkdtemp(prefix="merge_", dir=os.path.dirname(os.path.abspath(output)))
+    context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(n_workers) as pool:
+            level = 0
+            while True:
+                groups = [inputs[i:i+fan_in] for i in range(0, len(inputs), fan_in)]
+                outputs = [output] if len(groups) == 1 else \
+                        [os.path.join(tmp_dir, f"level{level}_{i}.root") for i in range(len(groups))]
+
+                level_start = time.time()
+                results = pool.starmap(merge_group, zip(groups, outputs))
+                times = [t for _, _, t in results]
+                print(f"Level {level}: {len(inputs)} files into {len(groups)} in "
+                      f"{time.time() - level_start:.1f} s (slowest group {max(times):.1f} s)")
+
+                if len(groups) == 1:
+                    break
+                # Temporary files of the previous level are no longer needed
+                if level > 0:
+                    for path in inputs:
+                        os.remove(path)
+                inputs = outputs
+                level += 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Merged into {output} in {time.time() - start:.1f} s")
+
+def run(args):
+    # Shut up ROOT
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+    if args.filelist:
+        inputs = [s.strip() for s in args.filelist.split(",")]
+    elif args.filepaths:
+        inputs = []
+        for path in [p.strip() for p in args.filepaths.split(",")]:
+            inputs.extend(file_read_lines(path, find_ROOT=True))
+    else:
+        inputs = sorted(glob.glob(os.path.join(args.input_dir, "J4PHists_*.root")))
+    if not inputs:
+        raise ValueError("No input files")
+
+    if os.path.dirname(args.out) and not os.path.exists(os.path.dirname(args.out)):
+        os.makedirs(os.path.dirname(args.out))
+
+    n_workers = args.nWorkers or os.cpu_count()
+    print(f"Merging {len(inputs)} files with {n_workers} workers")
+    merge_files(inputs, args.out, n_workers, args.fan_in)
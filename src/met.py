@@ -1,29 +1,42 @@
 import matplotlib.pyplot as mp
 import mplhep as hep
-import os, uproot
+import copy, os, uproot
 
 from ROOT import gPad, EnableImplicitMT, RDataFrame, RDF, TChain, TCanvas, TFile, TEfficiency
+from catalog import Catalog, plan_steps, get_step_ranges, print_step_plan
+from executor import parse_executor, run_processes
+from merge import merge_files
 from processing_utils import file_read_lines
+from skimming_utils import make_entry_list
 from typing import List
 
-def get_met(sample, files, triggers, args, step = None):
+def get_url(file, is_local):
+    return file if is_local else f'root://hip-cms-se.csc.fi//{file}'
+
+def get_met(sample, files, triggers, args, step = None, entry_ranges = None):
+    return write_met(sample, fill_met(sample, files, triggers, args, entry_ranges), triggers, args)
+
+def fill_met(sample, files, triggers, args, entry_ranges = None):
     events_chain = TChain('Events')
     for file in files:
-        if args.is_local: events_chain.Add(file)
-        else:
-            try: events_chain.Add(f'root://hip-cms-se.csc.fi//{file}')
-            except Exception as ex: print(f'Skipping problematic run: {ex}')
+        try: events_chain.Add(get_url(file, args.is_local))
+        except Exception as ex: print(f'Skipping problematic run: {ex}')
+    if entry_ranges:
+        events_chain.SetEntryList(make_entry_list({get_url(f, args.is_local): entry_ranges.get(f) for f in files}))
     events_rdf = RDataFrame(events_chain)
     if args.progress_bar: RDF.Experimental.AddProgressBar(events_rdf)
     events_rdf = get_pure_single_muon(events_rdf)
     details, target = ('temp', sample, 150, 0, 3000), 'PuppiMET_pt'
-    pt_initial = events_rdf.Histo1D(details, target).Clone(f'{target} 0')
-    hists = {'pt': [pt_initial], 'eff': []}
-    TCanvas('', '', 300, 300).cd()
+    pt_hists = [events_rdf.Histo1D(details, target).Clone(f'{target} 0')]
     for t, trigger in enumerate(triggers):
-        pt_hist = events_rdf.Filter(trigger).Histo1D(details, target).Clone(f'{target} {t + 1}')
-        hists['pt'].append(pt_hist)
-        eff_hist = TEfficiency(pt_hist, pt_initial)
+        pt_hists.append(events_rdf.Filter(trigger).Histo1D(details, target).Clone(f'{target} {t + 1}'))
+    return pt_hists
+
+def write_met(sample, pt_hists, triggers, args):
+    hists = {'pt': pt_hists, 'eff': []}
+    TCanvas('', '', 300, 300).cd()
+    for pt_hist in pt_hists[1:]:
+        eff_hist = TEfficiency(pt_hist, pt_hists[0])
         eff_hist.Draw('')
         gPad.Update()
         hists['eff'].append(eff_hist.GetPaintedGraph().Clone())
@@ -36,6 +49,29 @@ def get_met(sample, files, triggers, args, step = None):
         outfiles[key] = outfile
     return outfiles
 
+def fill_step(args):
+    # Worker of --executor processes: fill the pT histograms of one step
+    if args.n_threads: EnableImplicitMT(args.n_threads)
+    sample, files, entry_ranges = get_inputs(args)
+    with TFile.Open(f'{args.out}/{sample}/pt_{args.step}.root', 'RECREATE') as hist_out:
+        for hist in fill_met(sample, files, get_triggers(args), args, entry_ranges): hist.Write()
+
+def get_met_processes(sample, files, triggers, args, n_processes):
+    if args.split == 'files': n_processes = min(n_processes, len(files))
+    worker_args = []
+    for i in range(n_processes):
+        worker = copy.copy(args)
+        worker.executor, worker.n_steps, worker.step = 'threads', n_processes, i
+        worker_args.append(worker)
+    run_processes('met', 'fill_step', worker_args)
+    parts = [f'{args.out}/{sample}/pt_{i}.root' for i in range(n_processes)]
+    merge_files(parts, f'{args.out}/{sample}/pt.root', n_processes)
+    for part in parts: os.remove(part)
+    with TFile.Open(f'{args.out}/{sample}/pt.root') as pt_in:
+        pt_hists = [pt_in.Get(f'PuppiMET_pt {t}') for t in range(len(triggers) + 1)]
+        for pt_hist in pt_hists: pt_hist.SetDirectory(0)
+    return write_met(sample, pt_hists, triggers, args)
+
 def get_pure_single_muon(events_rdf):
     return events_rdf.Filter('HLT_IsoMu24').Filter('nMuon == 1')
 
@@ -70,9 +106,7 @@ def plot_met(hist_files, sample, triggers):
     mp.savefig(f'out_met/{sample}/efficiency.png')
 
 
-def run(args):
-    hep.style.use('CMS')
-    if args.n_threads: EnableImplicitMT(args.n_threads)
+def get_inputs(args):
     files: List[str] = []
     if args.filepaths:
         paths = [p.strip() for p in args.filepaths.split(',')]
@@ -82,12 +116,35 @@ def run(args):
         files = [l.strip() for l in args.filelist.split(',')]
         sample = '_'.join([l.split('/')[-1].replace('.root', '')
                              for l in args.filelist.split(',')])
+    entry_ranges = None
     if args.n_steps is not None and args.step is not None:
-        files = files[args.step::args.n_steps]
+        if args.split == 'files': files = files[args.step::args.n_steps]
+        else:
+            catalog = Catalog(args.catalog)
+            infos = [info for info in catalog.lookup(files, [get_url(f, args.is_local) for f in files]) if info['entries'] > 0]
+            catalog.close()
+            weight = 'zip_bytes' if args.split == 'bytes' else 'entries'
+            steps = plan_steps(infos, args.n_steps, weight)
+            print_step_plan(steps, infos, weight, args.step)
+            files, entry_ranges, _ = get_step_ranges(steps[args.step])
+    return sample, files, entry_ranges
+
+def get_triggers(args):
     triggers: List[str] = []
     if args.trigger_list: triggers = args.trigger_list.split(',')
     elif args.trigger_path: triggers = file_read_lines(args.trigger_path)
+    return triggers
+
+def run(args):
+    hep.style.use('CMS')
+    if args.n_threads: EnableImplicitMT(args.n_threads)
+    sample, files, entry_ranges = get_inputs(args)
+    triggers = get_triggers(args)
     for dir in [args.out, f'{args.out}/{sample}']:
         if not os.path.exists(dir): os.makedirs(dir)
-    hist_files = get_met(sample, files, triggers, args, args.step)
-    plot_met(hist_files, sample, triggers)
\ No newline at end of file
+    kind, n_processes = parse_executor(args.executor)
+    if kind == 'processes':
+        hist_files = get_met_processes(sample, files, triggers, args, n_processes)
+    else:
+        hist_files = get_met(sample, files, triggers, args, args.step, entry_ranges)
+    plot_met(hist_files, sample, triggers)
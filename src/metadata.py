@@ -0,0 +1,188 @@
+import ROOT
+import json
+import re
+
+# Per-file constants of the skim outputs, stored as TParameters instead of
+# per-event columns. The merge mode is set so that hadd and TFileMerger
+# combine them correctly: the luminosity of disjoint lumisections adds up,
+# the run range is the union and the constant weight is kept.
+merge_modes = {
+    "min_run": "kMin",
+    "max_run": "kMax",
+    "weight": "kFirst",
+}
+
+def make_parameter(name, value, mode=None):
+    if isinstance(value, str):
+        return ROOT.TNamed(name, value)
+    if isinstance(value, int):
+        parameter = ROOT.TParameter["Long64_t"](name, value)
+        if mode:
+            parameter.SetBit(getattr(ROOT.TParameter["Long64_t"], mode))
+    else:
+        parameter = ROOT.TParameter["double"](name, value)
+        if mode:
+            parameter.SetBit(getattr(ROOT.TParameter["double"], mode))
+    return parameter
+
+def write_metadata(path, metadata, additive_lumi=True):
+    """
+    Write the constants in metadata (name -> value) into path, strings as
+    TNamed objects. Without
+    additive_lumi, int_lumi is the luminosity of a whole run range shared
+    by all files and is kept instead of summed when merging.
+    """
+    f = ROOT.TFile.Open(path, "UPDATE")
+    for name, value in metadata.items():
+        mode = merge_modes.get(name)
+        if name == "int_lumi" and not additive_lumi:
+            mode = "kFirst"
+        make_parameter(name, value, mode).Write("", ROOT.TObject.kOverwrite)
+    f.Close()
+
+def read_parameters(files, strict=False):
+    """
+    Metadata objects of files (name -> TParameter or TNamed) combined like
+    hadd would, or None if a file was written before the constants were
+    stored as metadata. With strict, kept values and strings differing
+    between files raise a ValueError instead of keeping the first one.
+    """
+    parameters = {}
+    for file in files:
+        f = ROOT.TFile.Open(file)
+        if not f or f.IsZombie():
+            raise OSError(f"Could not open {file}")
+        if not f.Get("int_lumi"):
+            f.Close()
+            return None
+        for key in f.GetListOfKeys():
+            class_name = key.GetClassName()
+            if not class_name.startswith("TParameter") and class_name != "TNamed":
+                continue
+            parameter = key.ReadObj()
+            name = parameter.GetName()
+            if name not in parameters:
+                parameters[name] = parameter
+            elif class_name == "TNamed":
+                if strict and parameter.GetTitle() != parameters[name].GetTitle():
+                    raise ValueError(f"{name} of {file} differs from {files[0]}")
+            else:
+                combine_parameter(parameters[name], parameter, strict, file)
+        f.Close()
+    return parameters
+
+def combine_parameter(parameter, other, strict=False, file=None):
+    """
+    Combine other into parameter according to the merge bit of parameter
+    """
+    value, other_value = parameter.GetVal(), other.GetVal()
+    if parameter.TestBit(parameter.kMin):
+        parameter.SetVal(min(value, other_value))
+    elif parameter.TestBit(parameter.kMax):
+        parameter.SetVal(max(value, other_value))
+    elif parameter.TestBit(parameter.kFirst):
+        if strict and value != other_value:
+            raise ValueError(f"{parameter.GetName()} of {file} is {other_value} instead of {value}")
+    else:
+        parameter.SetVal(value + other_value)
+
+def write_parameters(path, parameters):
+    """
+    Write the metadata objects of read_parameters into path
+    """
+    f = ROOT.TFile.Open(path, "UPDATE")
+    for parameter in parameters.values():
+        parameter.Write("", ROOT.TObject.kOverwrite)
+    f.Close()
+
+def read_metadata(files):
+    """
+    Constants of the skim outputs in files combined like hadd would, or
+    None if a file was written before they were stored as metadata.
+    """
+    parameters = read_parameters(files)
+    if parameters is None:
+        return None
+    return {name: parameter.GetVal() for name, parameter in parameters.items()
+            if parameter.ClassName().startswith("TParameter")}
+
+def get_run_metadata(rdf, files):
+    """
+    int_lumi, min_run and max_run of files from their metadata, or with
+    an event loop over the columns of older skims
+    """
+    metadata = read_metadata(files)
+    if metadata is None:
+        metadata = {"int_lumi": rdf.Mean("int_lumi").GetValue(),
+                    "min_run": rdf.Min("min_run").GetValue(),
+                    "max_run": rdf.Max("max_run").GetValue()}
+    return metadata
+
+def define_constants(rdf, files):
+    """
+    Define the constant weight of data skims as a column, as expected by
+    the histogram configs
+    """
+    if "weight" in rdf.GetColumnNames():
+        return rdf
+    metadata = read_metadata(files) or {}
+    return rdf.Define("weight", f"{metadata.get('weight', 1.0)}")
+
+def get_trigger_mask(triggers):
+    """
+    Expression of the uint64 bitmask with bit i set when triggers[i] fired
+    """
+    if len(triggers) > 64:
+        raise ValueError(f"{len(triggers)} triggers do not fit into a 64 bit trigger mask")
+    return " | ".join(f"(ULong64_t(bool({trigger})) << {i})"
+                      for i, trigger in enumerate(triggers)) or "ULong64_t(0)"
+
+def read_trigger_bits(files):
+    """
+    Triggers of the bits of the trigger_mask column in files, or None if
+    the files have no trigger mask
+    """
+    bits = None
+    for i, file in enumerate(files):
+        f = ROOT.TFile.Open(file)
+        if not f or f.IsZombie():
+            raise OSError(f"Could not open {file}")
+        named = f.Get("trigger_bits")
+        file_bits = json.loads(named.GetTitle()) if named else None
+        f.Close()
+        if i > 0 and file_bits != bits:
+            raise ValueError(f"Trigger bits of {file} differ from {files[0]}")
+        bits = file_bits
+    return bits
+
+def get_trigger_expression(trigger, bits, column="trigger_mask"):
+    """
+    trigger with every path in bits replaced by a test of its bit in the
+    bitmask column, keeping the rest of the expression, ie. the kinematic
+    part of a trigger region
+    """
+    def replace(match):
+        path = match.group(0)
+        if path in bits:
+            return f"(({column} >> {bits.index(path)}) & 1)"
+        if path.startswith("HLT_"):
+            raise ValueError(f"Trigger {path} not in the trigger mask")
+        return path
+    return re.sub(r"\b[A-Za-z_]\w*\b", replace, trigger)
+
+def get_trigger_filter(triggers, bits=None, column="trigger_mask"):
+    """
+    Filter expression for events passing any of triggers: a mask operation
+    on the bitmask column with bits, else the OR of the trigger columns.
+    Triggers which are not bits themselves, ie. trigger regions, have their
+    paths replaced by bit tests, see get_trigger_expression.
+    """
+    if bits is None:
+        return " || ".join(triggers)
+    if not triggers:
+        raise ValueError("No triggers to filter on")
+    if all(trigger in bits for trigger in triggers):
+        mask = sum(1 << bits.index(trigger) for trigger in triggers)
+        return f"({column} & {mask}ULL) != 0"
+    return " || ".join(f"({get_trigger_expression(trigger, bits, column)})"
+                       for trigger in triggers)
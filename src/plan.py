@@ -0,0 +1,162 @@
+import ROOT
+import json
+import os
+import re
+import sys
+
+# Bytes per bin of each storage, with the sum of squared weights
+bytes_per_bin = {
+    "Histo": 16,
+    "Profile": 32,
+    "float": 12,
+    # Upper bound with every bin filled, the index of each filled bin
+    # comes on top of the content
+    "sparse": 24,
+}
+
+def get_identifiers(expressions):
+    """
+    Identifiers used in C++ expressions, ie. the columns they read
+    """
+    identifiers = set()
+    for expression in expressions:
+        if expression:
+            identifiers.update(re.findall(r"[A-Za-z_]\w*", expression))
+    return identifiers
+
+def get_source_identifiers(modules):
+    """
+    Identifiers in the source of the given modules (paths relative to
+    src/), which contain the expressions of the RDF graph as strings
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    identifiers = set()
+    for module in modules:
+        path = os.path.join(src_dir, module)
+        if os.path.exists(path):
+            with open(path) as f:
+                identifiers.update(re.findall(r"[A-Za-z_]\w*", f.read()))
+    return identifiers
+
+def get_dataset_branches(url, tree_name="Events"):
+    f = ROOT.TFile.Open(url)
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open {url}")
+    tree = f.Get(tree_name)
+    branches = {str(b.GetName()) for b in tree.GetListOfBranches()} if tree else set()
+    f.Close()
+    return branches
+
+def get_branch_sizes(urls, branches, tree_name="Events", entry_ranges=None):
+    """
+    Compressed bytes of branches in the baskets of all files and their total
+    number of entries, only counting the fraction of the entries of a file
+    in its entry_ranges (url -> [(begin, end), ...]) if given. Branches
+    not in any file, ie. columns defined by the graph, are dropped.
+    """
+    sizes = dict.fromkeys(sorted(branches), 0)
+    found = set()
+    n_entries = 0
+    for url in urls:
+        f = ROOT.TFile.Open(url)
+        if not f or f.IsZombie():
+            raise OSError(f"Could not open {url}")
+        tree = f.Get(tree_name)
+        if tree and tree.GetEntries() > 0:
+            fraction = 1.0
+            if entry_ranges and entry_ranges.get(url):
+                fraction = sum(end - begin for begin, end in entry_ranges[url]) / tree.GetEntries()
+            n_entries += int(tree.GetEntries() * fraction)
+            for branch in sizes:
+                b = tree.GetBranch(branch)
+                if b:
+                    sizes[branch] += int(b.GetZipBytes("*") * fraction)
+                    found.add(branch)
+        f.Close()
+    return {branch: size for branch, size in sizes.items() if branch in found}, n_entries
+
+def get_graph_counts(rdf):
+    """
+    Number of Define, Filter and action nodes in the computation graph of
+    rdf. Defines and Filters from Python are strings, so this is the
+    number of expressions to JIT.
+    """
+    graph = str(ROOT.RDF.SaveGraph(rdf))
+    shapes = re.findall(r'shape="(\w+)"', graph)
+    return {"defines": shapes.count("oval"), "filters": shapes.count("hexagon"),
+            "actions": shapes.count("box")}
+
+def get_histogram_memory(n_bins, hist_type, storage, n_slots):
+    """
+    Memory of the copies of a histogram filled by all slots
+    """
+    if storage == "dense":
+        storage = "Profile" if hist_type.startswith("Profile") or hist_type == "SlicedProfile1D" \
+                else "Histo"
+    return n_bins * bytes_per_bin[storage] * n_slots
+
+def get_n_slots(n_threads):
+    return max(n_threads or 1, 1)
+
+def make_input(urls, branches, event_loops, entry_ranges=None):
+    """
+    Input of a command: the branches read from urls in each of event_loops
+    loops over them
+    """
+    return {"urls": list(urls), "branches": set(branches), "event_loops": event_loops,
+            "entry_ranges": entry_ranges}
+
+def make_report(command, inputs, graph, histograms=None, n_slots=1, **extra):
+    """
+    JSON-serializable cost estimate of a command reading inputs (see
+    make_input), with graph the node counts of get_graph_counts and
+    histograms a list of (name, type, storage, bins)
+    """
+    report = {
+        "command": command,
+        "n_files": 0,
+        "n_entries": 0,
+        "entries_processed": 0,
+        "n_slots": n_slots,
+        "event_loops": 0,
+        "jit_expressions": graph["defines"] + graph["filters"],
+        "graph": graph,
+        "branches_read": {},
+        "bytes_read": 0,
+    }
+    for input in inputs:
+        sizes, n_entries = get_branch_sizes(input["urls"], input["branches"],
+                                            entry_ranges=input["entry_ranges"])
+        report["n_files"] += len(input["urls"])
+        report["n_entries"] += n_entries
+        report["entries_processed"] += n_entries * input["event_loops"]
+        report["event_loops"] += input["event_loops"]
+        for branch, size in sizes.items():
+            report["branches_read"][branch] = report["branches_read"].get(branch, 0) + size
+        # Every event loop reads the branches again
+        report["bytes_read"] += sum(sizes.values()) * input["event_loops"]
+
+    if histograms is not None:
+        report["histograms"] = {
+            name: {"type": hist_type, "storage": storage, "bins": bins,
+                   "bytes": get_histogram_memory(bins, hist_type, storage, n_slots)}
+            for name, hist_type, storage, bins in histograms
+        }
+        report["histogram_memory"] = sum(h["bytes"] for h in report["histograms"].values())
+    report.update(extra)
+    return report
+
+def write_report(report, path):
+    """
+    Write the report as JSON into path, or to stdout for "-"
+    """
+    if path == "-":
+        json.dump(report, sys.stdout, indent=4)
+        print()
+        return
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Plan written to {path}: {report['event_loops']} event loop(s), "
+          f"{report['bytes_read'] / 1024**2:.1f} MB read, {report['jit_expressions']} JIT "
+          f"expressions" + (f", {report['histogram_memory'] / 1024**2:.1f} MB of histograms"
+                            if "histogram_memory" in report else ""))
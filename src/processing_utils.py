@@ -1,6 +1,7 @@
 import configparser
 import json
 import numpy as np
+import re
 import subprocess
 from typing import Dict, List
 
@@ -126,6 +127,50 @@ def read_config_file(config_file: str) -> configparser.ConfigParser:
     config.read(config_file)
     return config
 
+def get_slices(hist_config) -> List[tuple]:
+    """
+    (name, low, high) of each slice of a SlicedProfile1D section. Slices
+    are named after the slice variable and edges, ie. pt50to110 and pt230
+    for Tag_pt with edges 50, 110, 230, inf, unless slice_names is given.
+    """
+    edges = [e.strip() for e in hist_config["slice_edges"].split(",")]
+    if "slice_names" in hist_config:
+        names = [n.strip() for n in hist_config["slice_names"].split(",")]
+    else:
+        prefix = re.findall(r"[A-Za-z_]\w*", hist_config["slice_var"])[-1].split("_")[-1]
+        names = []
+        for low, high in zip(edges[:-1], edges[1:]):
+            name = prefix + low.replace(".", "_")
+            if float(high) != float("inf"):
+                name += "to" + high.replace(".", "_")
+            names.append(name)
+    if len(names) != len(edges) - 1:
+        raise ValueError(f"{hist_config['name']}: {len(edges)} slice edges for {len(names)} slices")
+    return [(name, float(low), float(high)) for name, low, high in zip(names, edges[:-1], edges[1:])]
+
+def expand_slices(hist_config: Dict) -> Dict:
+    """
+    Replace each SlicedProfile1D section by a Profile1D section with a cut
+    for each of its slices, named like the projections written by hist
+    """
+    expanded = {}
+    for section, config in hist_config.items():
+        if config.get("type") != "SlicedProfile1D":
+            expanded[section] = config
+            continue
+        slice_var = config["slice_var"]
+        for slice_name, low, high in get_slices(config):
+            cuts = [f"({config['cut']})"] if config.get("cut") else []
+            if low != float("-inf"):
+                cuts.append(f"{slice_var} >= {low}")
+            if high != float("inf"):
+                cuts.append(f"{slice_var} < {high}")
+            sliced = {key: value for key, value in config.items() if not key.startswith("slice_")}
+            sliced.update(type="Profile1D", name=f"{config['name']}_{slice_name}",
+                          cut=" && ".join(cuts))
+            expanded[sliced["name"]] = sliced
+    return expanded
+
 def read_trigger_config(config_file: str) -> Dict:
     config = configparser.ConfigParser()
     config.optionxform = str
@@ -1,11 +1,15 @@
 import ROOT
-from processing_utils import file_read_lines, read_config_file, get_bins
+from processing_utils import file_read_lines, read_config_file, get_bins, expand_slices
 from typing import List
 import argparse, configparser
 import numpy as np
 import time
 
 from find_range import find_run_range
+from metadata import get_run_metadata, define_constants, read_metadata, read_trigger_bits, \
+        get_trigger_filter
+from plan import get_identifiers, get_dataset_branches, get_n_slots, make_input, make_report, \
+        write_report
 
 def produce_ratio(rdf_numerator, h_denominator, hist_config, bins, i=None):
     name = hist_config["name"]
@@ -41,6 +45,41 @@ def produce_ratio(rdf_numerator, h_denominator, hist_config, bins, i=None):
         raise ValueError(f"Histogram type {hist_config['type']} not supported by produce_ratio. \
                 Supported types: Histo1D, Profile1D")
 
+def plan_ratio(args, mc_files, groups, hist_config, bins, triggers):
+    """
+    Cost estimate of produce_ratio. Every MC histogram is projected right
+    after booking and every data histogram is cloned, so each of them
+    costs its own event loop.
+    """
+    n_hists = len(hist_config)
+    cuts = sum(1 for hist in hist_config if hist_config[hist].get("cut"))
+    expressions = list(triggers) + ["weight", "trigger_mask"]
+    for hist in hist_config:
+        expressions += [hist_config[hist].get(key) for key in ["x_val", "y_val", "cut"]]
+    identifiers = get_identifiers(expressions)
+
+    inputs = [make_input(mc_files, get_dataset_branches(mc_files[0]) & identifiers, n_hists)]
+    for group in groups:
+        # Older skims without metadata need Mean, Min and Max of their columns
+        loops = n_hists + (3 if read_metadata(group) is None else 0)
+        inputs.append(make_input(group, get_dataset_branches(group[0]) & identifiers, loops))
+
+    # One trigger Filter and the weight Define per dataframe, the cuts of the
+    # Profile1D and Stats of MC and the cuts of each group of data
+    n_rdfs = 1 + len(groups)
+    graph = {"defines": n_rdfs, "filters": n_rdfs * bool(triggers) + cuts * (2 + len(groups)),
+             "actions": n_hists * (2 + len(groups))}
+    planned = []
+    for hist in hist_config:
+        n_bins = bins[hist_config[hist]["x_bins"]]["n"] + 2
+        planned.append((f"mc_{hist_config[hist]['name']}", "Profile1D", "dense", n_bins))
+        for i in range(len(groups)):
+            planned.append((f"data_{hist_config[hist]['name']}_{i}", hist_config[hist]["type"],
+                            "dense", n_bins))
+    report = make_report("produce_ratio", inputs, graph, planned, get_n_slots(args.nThreads),
+                         groups=len(groups))
+    write_report(report, args.dry_run)
+
 def run(args):
     # Shut up ROOT
     ROOT.gErrorIgnoreLevel = ROOT.kWarning
@@ -54,7 +93,7 @@ def run(args):
     chain_mc = ROOT.TChain("Events")
     for file in mc_files:
         chain_mc.Add(file)
-    rdf_mc = ROOT.RDataFrame(chain_mc)
+    rdf_mc = define_constants(ROOT.RDataFrame(chain_mc), mc_files)
 
     if args.progress_bar:
         ROOT.RDF.Experimental.AddProgressBar(rdf_mc)
@@ -66,7 +105,7 @@ def run(args):
         triggers = file_read_lines(args.triggerpath)
 
     if len(triggers) > 0:
-        trg_filter = " || ".join(triggers)
+        trg_filter = get_trigger_filter(triggers, read_trigger_bits(mc_files))
         rdf_mc = (rdf_mc.Filter(trg_filter))
 
     data_files = [s.strip() for s in args.data_files.split(",")]
@@ -82,6 +121,11 @@ def run(args):
     bins = get_bins()
     hist_config = dict(read_config_file(args.hist_config))
     del hist_config["DEFAULT"]
+    hist_config = expand_slices(hist_config)
+
+    if args.dry_run:
+        plan_ratio(args, mc_files, groups, hist_config, bins, triggers)
+        return
 
     hm = {}
     for hist in hist_config:
@@ -121,7 +165,7 @@ def run(args):
             chain_runs.Add(file)
             rdf = ROOT.RDataFrame("Events", file)
 
-        rdf_data = ROOT.RDataFrame(chain_data)
+        rdf_data = define_constants(ROOT.RDataFrame(chain_data), group)
         rdf_runs = ROOT.RDataFrame(chain_runs)
 
         if args.progress_bar:
@@ -129,11 +173,12 @@ def run(args):
             ROOT.RDF.Experimental.AddProgressBar(rdf_data)
 
         if len(triggers) > 0:
-            trg_filter = " || ".join(triggers)
+            trg_filter = get_trigger_filter(triggers, read_trigger_bits(group))
             rdf_data = (rdf_data.Filter(trg_filter))
 
-        min_run = int(rdf_data.Min("min_run").GetValue())
-        max_run = int(rdf_data.Max("max_run").GetValue())
+        metadata = get_run_metadata(rdf_data, group)
+        min_run = int(metadata["min_run"])
+        max_run = int(metadata["max_run"])
         print(f"Group run range: [{min_run}, {max_run}]")
         if args.data_tag:
             output_path = f"{args.out}/J4PRatio_runs{min_run}to{max_run}_{args.data_tag}_vs_{args.mc_tag}.root"
@@ -1,17 +1,19 @@
 import ROOT
-from processing_utils import file_read_lines, read_config_file, get_bins
+from processing_utils import file_read_lines, read_config_file, get_bins, expand_slices
 from typing import List
 import argparse, configparser
 import numpy as np
 import time
 
 from find_range import find_run_range
-
-def data_hists(rdf, hist_config, bins):
-    hd = {}
-    hd["int_lumi"] = rdf.Mean("int_lumi").GetValue()
-    hd["min_run"] = rdf.Min("min_run").GetValue()
-    hd["max_run"] = rdf.Max("max_run").GetValue()
+from metadata import get_run_metadata, define_constants, read_metadata, read_trigger_bits, \
+        get_trigger_filter
+from plan import get_identifiers, get_dataset_branches, get_n_slots, make_input, make_report, \
+        write_report
+
+def data_hists(rdf, hist_config, bins, files):
+    hd = get_run_metadata(rdf, files)
+    rdf = define_constants(rdf, files)
     for hist in hist_config:
         name = hist_config[hist]["name"]
         title = hist_config[hist]["title"]
@@ -38,15 +40,13 @@ def data_hists(rdf, hist_config, bins):
                         x_val, y_val, "weight")
     return hd
 
-def lumi_data(rdf, hist_config, triggers):
-    ld = {}
-    ld["int_lumi"] = rdf.Mean("int_lumi")
-    ld["min_run"] = rdf.Min("min_run")
-    ld["max_run"] = rdf.Max("max_run")
+def lumi_data(rdf, hist_config, triggers, files):
+    ld = get_run_metadata(rdf, files)
+    rdf = define_constants(rdf, files)
 
     trg_filter = "1"
     if len(triggers) > 0:
-        trg_filter = " || ".join(triggers)
+        trg_filter = get_trigger_filter(triggers, read_trigger_bits(files))
 
     for hist in hist_config:
         if hist_config[hist]["type"] == "Histo1D":
@@ -73,7 +73,7 @@ def produce_time_evolution(lds, hist_config, bins):
     lumi = 0.0
     lumi_bins = [0.0]
     for ld in lds:
-        lumi = ld["int_lumi"].GetValue()
+        lumi = ld["int_lumi"]
         clumi += lumi
         lumi_bins.append(clumi)
 
@@ -90,9 +90,8 @@ def produce_time_evolution(lds, hist_config, bins):
     print("Filling time evolution histograms")
     start_time_evolution = time.time()
     for i, ld in enumerate(lds):
-        int_lumi = ld["int_lumi"].GetValue()
-        min_run = ld["min_run"].GetValue()
-        max_run = ld["max_run"].GetValue()
+        min_run = ld["min_run"]
+        max_run = ld["max_run"]
 
         hs["min_runs"].SetBinContent(i+1, min_run)
         hs["max_runs"].SetBinContent(i+1, max_run)
@@ -109,6 +108,27 @@ def produce_time_evolution(lds, hist_config, bins):
 
     return hists
 
+def plan_time_evolution(args, files, hist_config, triggers):
+    """
+    Cost estimate of produce_time_evolution: RunGraphs fills the Stats of
+    all files, one event loop per file
+    """
+    profiles = [hist for hist in hist_config if hist_config[hist]["type"] != "Histo1D"]
+    cuts = sum(1 for hist in profiles if hist_config[hist].get("cut"))
+    expressions = list(triggers) + ["weight", "trigger_mask"]
+    for hist in profiles:
+        expressions += [hist_config[hist].get(key) for key in ["x_val", "y_val", "cut"]]
+    branches = get_dataset_branches(files[0]) & get_identifiers(expressions) if files else set()
+
+    # Older skims without metadata need Mean, Min and Max of their columns
+    inputs = [make_input([file], branches, 1 + (3 if read_metadata([file]) is None else 0))
+              for file in files]
+    # Each Stats has its own trigger Filter, next to the weight Define
+    graph = {"defines": len(files), "filters": len(files) * (len(profiles) + cuts),
+             "actions": len(files) * len(profiles)}
+    report = make_report("produce_time_evolution", inputs, graph, [], get_n_slots(args.nThreads))
+    write_report(report, args.dry_run)
+
 def run(args):
     # Shut up ROOT
     ROOT.gErrorIgnoreLevel = ROOT.kWarning
@@ -137,6 +157,11 @@ def run(args):
     bins = get_bins()
     hist_config = dict(read_config_file(args.hist_config))
     del hist_config["DEFAULT"]
+    hist_config = expand_slices(hist_config)
+
+    if args.dry_run:
+        plan_time_evolution(args, files, hist_config, triggers)
+        return
 
     chain_data = ROOT.TChain("Events")
     chain_runs = ROOT.TChain("Runs")
@@ -145,11 +170,11 @@ def run(args):
     for file in files:
         rdf = ROOT.RDataFrame("Events", file)
 
-        ld = lumi_data(rdf, hist_config, triggers)
+        ld = lumi_data(rdf, hist_config, triggers, [file])
         lds.append(ld)
 
-    min_run = int(min([ld["min_run"].GetValue() for ld in lds]))
-    max_run = int(max([ld["max_run"].GetValue() for ld in lds]))
+    min_run = int(min([ld["min_run"] for ld in lds]))
+    max_run = int(max([ld["max_run"] for ld in lds]))
     print(f"Group run range: [{min_run}, {max_run}]")
     if args.data_tag:
         output_path = f"{args.out}/J4PTimeEvolution_runs{min_run}to{max_run}_{args.data_tag}.root"
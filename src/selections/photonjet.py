@@ -1,52 +1,9 @@
 import ROOT
 
-def init_photonjet(rdf, jet_columns):
-    ROOT.gInterpreter.Declare("""
-    #ifndef EGAMMA_IDXS
-    #define EGAMMA_IDXS
-    
-    int findPhotonIdx(ROOT::RVec<float> Photon_eta, ROOT::RVec<float> Photon_pt,
-                        ROOT::RVec<int> Photon_cutBased, ROOT::RVec<float> Photon_hoe,
-                        ROOT::RVec<float> Photon_r9) {
-        for (int i = 0; i < Photon_pt.size(); i++) {
-            if (abs(Photon_eta[i]) < 1.3 && Photon_pt[i] > 15 && Photon_cutBased[i] == 3 &&
-                Photon_hoe[i] < 0.02148 && Photon_r9[i] > 0.94 && Photon_r9[i] < 1.00) {
-                return i;
-            }
-        }
-                                
-        return -1;
-    }
-                                
-    std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
-                        ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
-                        int Photon_jetIdx, float Photon_phi) {
-        int idx1 = -1;
-        int idx2 = -1;
-                                
-        // Find the probe jet
-        for (int i = 0; i < Jet_pt.size(); i++) {
-            if (Jet_pt[i] > 12 && Jet_jetId[i] >= 4
-                    && i != Photon_jetIdx
-                    && abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Photon_phi)) > 2.7) {
-                idx1 = i;
-                break;
-            }
-        }
+from kernels import load_kernels
 
-        // Find the activity jet
-        for (int i = 0; i < Jet_pt.size(); i++) {
-            if (i != idx1 && Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
-                idx2 = i;
-                break;
-            }
-        }
-                                
-        return std::make_pair(idx1, idx2);
-    }
-                                
-    #endif
-    """)
+def init_photonjet(rdf, jet_columns):
+    load_kernels("kernels")
 
     rdf = (rdf.Define("Tag_idx_temp", "findPhotonIdx(Photon_eta, Photon_pt, Photon_cutBased, \
             Photon_hoe, Photon_r9)")
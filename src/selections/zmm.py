@@ -1,61 +1,9 @@
 import ROOT
 
-def init_zmm(rdf, jet_columns):
-    ROOT.gInterpreter.Declare("""
-    #ifndef ZJET_IDXS
-    #define ZJET_IDXS
-                                
-    std::pair<int, int> findMuonIdxs(ROOT::RVec<float> Muon_eta, ROOT::RVec<float> Muon_pt,
-                        ROOT::RVec<float> Muon_pfRelIso03_all, ROOT::RVec<int> Muon_tightId,
-                        ROOT::RVec<float> Muon_charge) {
-        int idx1 = -1;
-        int idx2 = -1;
-        for (int i = 0; i < Muon_pt.size(); i++) {
-            if (abs(Muon_eta[i]) < 2.4 && Muon_pfRelIso03_all[i] < 0.15 &&
-                Muon_tightId[i]) {
-                // Leading muon pt>20, subleading pt>10
-                if (idx1 == -1 && Muon_pt[i] > 20) {
-                    idx1 = i;
-                } else if (idx2 == -1 && Muon_charge[i] != Muon_charge[idx1] &&
-                        Muon_pt[i] > 10) {
-                    idx2 = i;
-                    break;
-                }
-            }
-        }
-                                
-        return std::make_pair(idx1, idx2);
-    }
-
-    std::pair<int, int> findJetIdx(ROOT::RVec<float> Jet_eta, ROOT::RVec<float> Jet_pt,
-                        ROOT::RVec<float> Jet_phi, ROOT::RVec<int> Jet_jetId,
-                        float Z_eta, float Z_phi) {
-        int idx1 = -1;
-        int idx2 = -1;
-        
-        // Find the probe jet
-        for (int i = 0; i < Jet_pt.size(); i++) {
-            if (Jet_pt[i] > 12 && Jet_jetId[i] >= 4 && abs(ROOT::VecOps::DeltaPhi(Jet_phi[i], Z_phi)) > 2.7) {
-                if (idx1 == -1) {
-                    idx1 = i;
-                    break;
-                }
-            }
-        }
+from kernels import load_kernels
 
-        // Find the activity jet
-        for (int i = 0; i < Jet_pt.size(); i++) {
-            if (i != idx1 && Jet_pt[i] > 12 && Jet_jetId[i] >= 4) {
-                idx2 = i;
-                break;
-            }
-        }
-                                
-        return std::make_pair(idx1, idx2);
-    }
-                                
-    #endif
-    """)
+def init_zmm(rdf, jet_columns):
+    load_kernels("kernels")
     rdf = (rdf.Filter("nMuon > 1", "nMuon > 1")
             .Define("Muon_idx_temp", "findMuonIdxs(Muon_eta, Muon_pt, Muon_pfRelIso03_all, \
                     Muon_tightId, Muon_charge)")
@@ -1,16 +1,28 @@
 import ROOT
+import copy
+import json
 import os
+import shutil
 import subprocess
-import argparse
-import pathlib
-import ctypes
+import tempfile
 import numpy as np
 import pandas as pd
 import time
 from typing import List
 
-from processing_utils import file_read_lines, find_site
-from skimming_utils import filter_json, correct_jets, find_vetojets, get_Flags, sort_jets, correct_jetId
+from executor import parse_executor, run_processes
+from checkpoint import read_manifest, write_manifest, probe_file, merge_outputs
+from incremental import plan_increment, write_shard_json, record_shard, get_manifest_path
+from lumi_index import LumiIndex
+from metadata import write_metadata, get_trigger_mask
+from plan import get_source_identifiers, get_graph_counts, get_n_slots, make_input, make_report, \
+        write_report
+from catalog import Catalog, get_common_branches, plan_steps, get_step_ranges, get_step_lumis, \
+        print_step_plan
+from processing_utils import file_read_lines
+from skimming_utils import filter_json, get_Flags, correct_jetId, apply_jet_corrections, \
+        plan_golden_files, intersect_ranges, make_entry_list, print_jec_cache_report, \
+        load_lumi_mask
 
 weight_info = {
     "xsec" : {
@@ -213,10 +225,71 @@ def run(args):
     else:
         files = [s.strip() for s in args.filelist.split(',')]
 
+    # File metadata from the catalog, scanning only new or changed files
+    infos = None
+    if args.catalog:
+        catalog = Catalog(args.catalog)
+        infos = {info["path"]: info for info in
+                 catalog.lookup(files, [get_url(f, args.is_local) for f in files])}
+        catalog.close()
+
+        # Empty and unreadable files are dropped
+        files = [f for f in files if f in infos and infos[f]["entries"] > 0]
+
+    # Create the output directory
+    if not args.dry_run and not os.path.exists(args.out):
+        os.makedirs(args.out)
+
+    # Each worker process skims one step, with the files already scanned
+    # into the catalog above
+    kind, n_processes = parse_executor(args.executor)
+    if kind == "processes" and not args.dry_run:
+        skim_processes(args, min(n_processes, len(files)) if args.split == "files" else n_processes)
+        return
+
+    # Only skim the golden lumisections not covered by the existing shards,
+    # into a new shard tagged with its run range
+    runs_files = None
+    if args.incremental and not args.dry_run:
+        files, new_lumis, runs_files = plan_increment(files, infos, args)
+        if not files:
+            print("Nothing new to skim")
+            return
+        golden_json = args.golden_json
+        args.golden_json, run_range = write_shard_json(new_lumis, args)
+        args.run_range = f"{run_range[0]},{run_range[1]}"
+        channels = [ch.strip() for ch in args.channel.split(",")]
+        if any(os.path.exists(get_output_path(args, ch) + ".root") for ch in channels):
+            args.step = len(read_manifest(get_manifest_path(args)).get("shards", []))
+
+    step_ranges = {}
+    all_files = None
     if args.nsteps is not None and args.step is not None:
+        all_files = files
         n = args.nsteps
         i = args.step
-        files = files[i::n]
+        if args.split == "files":
+            files = files[i::n]
+        else:
+            weight = "zip_bytes" if args.split == "bytes" else "entries"
+            steps = plan_steps([infos[f] for f in files], n, weight)
+            print_step_plan(steps, [infos[f] for f in files], weight, i)
+            files, step_ranges, runs_files = get_step_ranges(steps[i])
+
+    # Drop files without golden lumisections before opening the chain
+    entry_ranges = {}
+    if args.golden_json and not args.is_mc:
+        files, entry_ranges = plan_golden_files(files, [get_url(f, args.is_local) for f in files],
+                                                args.golden_json, args.plan_lumis, infos)
+
+    # Files of the step whose luminosity is counted, even if the entries
+    # of their golden lumisections are read by other steps
+    lumi_files = files
+
+    # Only read the entries of the files both in the step and golden
+    if step_ranges:
+        entry_ranges = {f: intersect_ranges(step_ranges[f], entry_ranges.get(f)) for f in files}
+        files = [f for f in files if entry_ranges[f]]
 
     triggers: List[str] = []
     if args.triggerlist:
@@ -224,194 +297,244 @@ def run(args):
     elif args.triggerpath:
         triggers = file_read_lines(args.triggerpath)
 
-    # Write and hadd the output
-    if not os.path.exists(args.out):
-        os.makedirs(args.out)
-
-    skim(files, triggers, args, args.step)
-
-
-def skim(files, triggers, args, step=None):
-    # Load the files
-    events_chain = ROOT.TChain("Events")
-    runs_chain = ROOT.TChain("Runs")
-
-    for file in files:
-        if not args.is_local:
-            try:
-                events_chain.Add(f"root://xrootd-cms.infn.it//{file}")
-                runs_chain.Add(f"root://xrootd-cms.infn.it//{file}")
-            except Exception as e:
-                print(f"Skipping problematic run: {e}")
-        else:
-            events_chain.Add(file)
-            runs_chain.Add(file)
-
-    events_rdf = ROOT.RDataFrame(events_chain)
-    runs_rdf = ROOT.RDataFrame(runs_chain)
-
-    if args.progress_bar:
-        ROOT.RDF.Experimental.AddProgressBar(events_rdf)
-
-    if args.golden_json:
-        events_rdf = filter_json(events_rdf, args.golden_json)
-
-    events_rdf = events_rdf.Filter("nJet > 0", "nJet > 0")
-
-    events_rdf = correct_jetId(events_rdf)
-
-    # Apply corrections
-    if args.correction_json:
-        import json
-        import correctionlib
-        correctionlib.register_pyroot_binding()
+    branches = get_common_branches([infos[f] for f in files]) if infos else None
 
-        with open(args.correction_json) as f:
-            correction_info = json.load(f)
+    # Exact luminosity of the golden lumisections of the input files
+    lumi = None
+    if args.lumi_index and args.golden_json and not args.is_mc and not args.dry_run:
+        lumi = get_selected_lumi(lumi_files, args, infos, runs_files, all_files)
 
-        correction_info = correction_info[args.correction_key]
+    if args.dry_run:
+        skim(files, triggers, args, args.step, entry_ranges, branches, runs_files, lumi)
+        return
 
-        # JECs
-        if "jec_path" and "jec_stack" in correction_info:
-            events_rdf = correct_jets(events_rdf, correction_info["jec_path"], correction_info["jec_stack"])
-            events_rdf = sort_jets(events_rdf, jet_columns)
-
-        # Vetomaps
-        if "vetomap_path" and "vetomap_set" in correction_info:
-            events_rdf = find_vetojets(events_rdf, correction_info["vetomap_path"], correction_info["vetomap_set"])
+    if args.checkpoint:
+        skim_checkpointed(files, triggers, args, args.step, entry_ranges, branches, runs_files, lumi)
     else:
-        # Define that no jets were vetoed
-        events_rdf = events_rdf.Define("Jet_vetoed", "ROOT::VecOps::RVec<bool>(Jet_pt.size(), false)")
+        skim(files, triggers, args, args.step, entry_ranges, branches, runs_files, lumi)
 
-    # Define energy fraction variables in case not in NanoAOD (added in V14)
-    ef_cols = ["Jet_chEmEF", "Jet_chHEF", "Jet_hfEmEF", "Jet_muEF", "Jet_neEmEF", "Jet_neHEF"]
-    rdf_cols = [str(col) for col in events_rdf.GetColumnNames() if str(col).startswith("Jet_")]
+    if args.incremental:
+        record_shard(new_lumis, [get_output_path(args, ch, args.step) + ".root" for ch in channels],
+                     golden_json, args.golden_json, args)
 
-    for ef in ef_cols:
-        if ef not in rdf_cols:
-            rdf = rdf.Define(ef, "-1.0")
+def skim_processes(args, n_processes):
+    """
+    Skim the input as n_processes steps in parallel worker processes and
+    merge the outputs of the steps of each channel
+    """
+    worker_args = []
+    for i in range(n_processes):
+        worker = copy.copy(args)
+        worker.executor = "threads"
+        worker.nsteps = n_processes
+        worker.step = i
+        worker_args.append(worker)
+    run_processes("skim", "run", worker_args)
 
-    # Initialize the JEC variables
-    print("Initializing TnP variables")
-    events_rdf = init_TnP(events_rdf, args.channel)
-    print("Initializing JEC variables")
-    events_rdf = do_JEC(events_rdf)
+    start = time.time()
+    channels = [ch.strip() for ch in args.channel.split(",")] if args.channel else [args.channel]
+    for channel in channels:
+        parts = [get_output_path(args, channel, i) + ".root" for i in range(n_processes)]
+        parts = [part for part in parts if os.path.exists(part)]
+        merge_outputs(parts, get_output_path(args, channel) + ".root")
+        for part in parts:
+            os.remove(part)
+        print(get_output_path(args, channel) + ".root")
+    print(f"Merged the outputs of {n_processes} workers in {time.time()-start:.1f} s")
+
+def skim_checkpointed(files, triggers, args, step=None, entry_ranges=None, branches=None,
+                      runs_files=None, lumi=None):
+    """
+    Skim groups of args.files_per_unit files as separate units written into
+    a parts directory, recording finished units and unreadable (quarantined)
+    files in a manifest next to the output. On a retry, finished units are
+    skipped. When all units are done they are merged into the usual outputs.
+    """
+    channels = [ch.strip() for ch in args.channel.split(",")] if args.channel else [args.channel]
+    base_path = get_output_path(args, "checkpoint", step)
+    manifest_path = base_path + ".json"
+    parts_dir = base_path + "_parts"
+    os.makedirs(parts_dir, exist_ok=True)
+
+    manifest = read_manifest(manifest_path)
+    if manifest.get("merged") and all(os.path.exists(get_output_path(args, channel, step) + ".root")
+                                      for channel in channels):
+        print(f"All units already finished and merged, see {manifest_path}")
+        return
+    manifest.setdefault("units", {})
+    manifest.setdefault("quarantine", {})
+    if args.retry_quarantined:
+        manifest["quarantine"] = {}
+
+    n = args.files_per_unit
+    pending = [files[i:i + n] for i in range(0, len(files), n)]
+    while pending:
+        # Units are named after their first file, and files of finished
+        # units are skipped
+        done = {f for unit in manifest["units"].values() for f in unit["files"]}
+        unit_files = [f for f in pending.pop(0) if f not in manifest["quarantine"] and f not in done]
+        if not unit_files:
+            continue
+        unit = "unit_" + str(files.index(unit_files[0]))
+
+        # Opening the files before the event loop catches most broken files
+        for file in list(unit_files):
+            error = probe_file(get_url(file, args.is_local))
+            if error:
+                print(f"Quarantining {file}: {error}")
+                manifest["quarantine"][file] = error
+                unit_files.remove(file)
+        write_manifest(manifest_path, manifest)
+        if not unit_files:
+            continue
+
+        unit_args = copy.copy(args)
+        unit_args.out = os.path.join(parts_dir, unit)
+        os.makedirs(unit_args.out, exist_ok=True)
+        try:
+            skim(unit_files, triggers, unit_args, step,
+                 {f: entry_ranges[f] for f in unit_files if f in entry_ranges} if entry_ranges else None,
+                 branches, runs_files, lumi)
+        except Exception as e:
+            shutil.rmtree(unit_args.out, ignore_errors=True)
+            if len(unit_files) > 1:
+                # Find the broken file by retrying the files one by one
+                print(f"{unit} failed, retrying its files separately: {e}")
+                pending = [[f] for f in unit_files] + pending
+            else:
+                print(f"Quarantining {unit_files[0]}: {e}")
+                manifest["quarantine"][unit_files[0]] = str(e)
+                write_manifest(manifest_path, manifest)
+            continue
+
+        manifest["units"][unit] = {"files": unit_files,
+                                   "outputs": [get_output_path(unit_args, channel, step) + ".root"
+                                               for channel in channels]}
+        write_manifest(manifest_path, manifest)
+
+    if not manifest["units"]:
+        raise RuntimeError(f"No unit could be skimmed, see {manifest_path}")
+
+    # Merge the finished units into the usual outputs
+    units = sorted(manifest["units"].values(), key=lambda unit: files.index(unit["files"][0])
+                   if unit["files"][0] in files else len(files))
+    for i, channel in enumerate(channels):
+        output = get_output_path(args, channel, step) + ".root"
+        merge_outputs([unit["outputs"][i] for unit in units], output)
+        # Every unit carries the luminosity of all files, which would be
+        # summed by the merge
+        if lumi is not None:
+            write_metadata(output, {"int_lumi": float(lumi[2])})
+        print(f"Merged {len(units)} units into {output}")
+
+    if manifest["quarantine"]:
+        print(f"{len(manifest['quarantine'])} files quarantined, see {manifest_path}:")
+        for file, error in manifest["quarantine"].items():
+            print(f"  {file}: {error}")
+
+    manifest["merged"] = True
+    write_manifest(manifest_path, manifest)
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def get_file_lumis(file, args, infos=None):
+    """
+    (run, ls) pairs of file, from the catalog or its LuminosityBlocks tree
+    """
+    if infos:
+        return {(int(run), ls) for run, ranges in infos[file]["lumis"].items()
+                for first, last in ranges for ls in range(first, last + 1)}
+    data = ROOT.RDataFrame("LuminosityBlocks", get_url(file, args.is_local)) \
+            .AsNumpy(["run", "luminosityBlock"])
+    return set(zip(data["run"].tolist(), data["luminosityBlock"].tolist()))
+
+def get_selected_lumis(files, args, infos=None, runs_files=None, all_files=None):
+    """
+    Golden (run, ls) pairs of the input files, from the catalog or the
+    LuminosityBlocks trees. Files split between steps count for the step
+    reading their first entries, like their Runs tree. With all_files, the
+    input of all steps, a lumisection split between files of different
+    steps only counts for the step with its first file, so that the
+    luminosities of the steps add up. Without the catalog this reads the
+    LuminosityBlocks trees of the files of the other steps as well.
+    """
+    mask = load_lumi_mask(args.golden_json)
+    files = [f for f in files if runs_files is None or f in runs_files]
 
+    lumis = get_step_lumis(all_files or files, files, lambda f: get_file_lumis(f, args, infos))
 
-    # Filter based on triggers and one jet
-    # Check that the triggers are in the file
-    cols = events_rdf.GetColumnNames()
-    for trigger in triggers:
-        if trigger not in cols and "&&" not in trigger:
-            print(f"Trigger {trigger} not in the file") 
-            events_rdf = events_rdf.Define(trigger, "0")
+    return {(run, ls) for run, ls in lumis if mask.accept(run, ls)}
 
-    if len(triggers) == 0:
-        trg_filter = "1"
-    else:
-        trg_filter = " || ".join(triggers)
-    flag_filter = " && ".join(get_Flags())
-    events_rdf = (events_rdf.Filter(trg_filter, trg_filter)
-            .Filter(flag_filter, flag_filter)
-            )
+def get_selected_lumi(files, args, infos=None, runs_files=None, all_files=None):
+    """
+    (min_run, max_run, int_lumi) of the golden lumisections of the input
+    files, with the luminosity in /fb from the lumi index
+    """
+    lumis = get_selected_lumis(files, args, infos, runs_files, all_files)
+    index = LumiIndex(args.lumi_index)
+    int_lumi, n_missing = index.get_lumi(lumis)
+    index.close()
+    if n_missing:
+        print(f"WARNING: {n_missing}/{len(lumis)} lumisections missing from {args.lumi_index}")
 
-    # Define a weight column
-    if args.is_mc:
-        xsec = weight_info["xsec"].get(args.mc_tag)
-        if xsec:
-            print(f"Reweight with xsec={xsec}")
-            events_rdf = (events_rdf.Define("weight", f"{xsec}*genWeight"))
-        else:
-            events_rdf = (events_rdf.Define("weight", "genWeight"))
+    if args.run_range:
+        min_run, max_run = (int(run) for run in args.run_range.split(","))
+    elif lumis:
+        min_run, max_run = min(run for run, _ in lumis), max(run for run, _ in lumis)
     else:
-        events_rdf = (events_rdf.Define("weight", "1.0"))
+        min_run, max_run = 0, 1
+    print(f"Lumi index: {len(lumis)} golden lumisections in runs {min_run}-{max_run}, "
+          f"{int_lumi:.6f} /fb")
+    return min_run, max_run, int_lumi
 
-    # Define Pileup_ columns for data
-    if not args.is_mc:
-        events_rdf = (events_rdf.Define("Pileup_gpudensity", "0.0")
-                    .Define("Pileup_nPU", "0")
-                    .Define("Pileup_nTrueInt", "0.0")
-                    .Define("Pileup_pthatmax", "0.0")
-                    .Define("Pileup_sumEOOT", "0.0")
-                    .Define("Pileup_sumLOOT", "0.0")
-        )
-
-    # Set name of the output file
+def get_url(file, is_local):
+    if is_local:
+        return file
+    return f"root://xrootd-cms.infn.it//{file}"
+
+def get_output_path(args, channel, step=None):
     step_str = ""
     if step is not None:
         step_str = f"_{step}"
+
     if args.run_range:
         run_range = args.run_range.split(",")
-        assert(len(run_range) == 2)
-
-        print(f"Run range: ({run_range[0]}, {run_range[1]})");
         run_range_str = f"runs{run_range[0]}to{run_range[1]}"
-
-        subprocess.run(["brilcalc", "lumi", "--normtag",
-            "/cvmfs/cms-bril.cern.ch/cms-lumi-pog/Normtags/normtag_BRIL.json",
-            "-u", "/fb", "--begin", f"{run_range[0]}", "--end", f"{run_range[1]}",
-            "-i", args.golden_json, "-o", "lumi.csv"])
-
-        df = pd.read_csv("lumi.csv", comment='#', names=["run:fill", "time", "nls",
-            "ncms", "delivered(/fb)", "recorded(/fb)"])
-        int_lumi = np.sum(df["recorded(/fb)"].to_numpy())
-        print(f"Running on {int_lumi} 1/fb integrated luminosity")
-
-        events_rdf = events_rdf.Define("min_run", f"{run_range[0]}")
-        events_rdf = events_rdf.Define("max_run", f"{run_range[1]}")
-        events_rdf = events_rdf.Define("int_lumi", f"{int_lumi}")
-        output_path = os.path.join(args.out, f"J4PSkim_{run_range_str}_{args.channel}{step_str}")
+        return os.path.join(args.out, f"J4PSkim_{run_range_str}_{channel}{step_str}")
     elif args.mc_tag:
-        output_path = os.path.join(args.out, f"J4PSkim_{args.mc_tag}_{args.channel}{step_str}")
-        events_rdf = events_rdf.Define("min_run", "0")
-        events_rdf = events_rdf.Define("max_run", "1")
-        events_rdf = events_rdf.Define("int_lumi", "1.")
+        return os.path.join(args.out, f"J4PSkim_{args.mc_tag}_{channel}{step_str}")
     else:
-        output_path = os.path.join(args.out, f"J4PSkim_{args.channel}{step_str}")
-        events_rdf = events_rdf.Define("min_run", "0")
-        events_rdf = events_rdf.Define("max_run", "1")
-        events_rdf = events_rdf.Define("int_lumi", "1.")
+        return os.path.join(args.out, f"J4PSkim_{channel}{step_str}")
 
+def get_output_columns(rdf, triggers, trigger_mask=False):
     # Include defined columns
-    columns = [str(col) for col in events_rdf.GetDefinedColumnNames() if not str(col).endswith("_temp") and not str(col).startswith("Jet_")]
+    columns = [str(col) for col in rdf.GetDefinedColumnNames() if not str(col).endswith("_temp") and not str(col).startswith("Jet_")]
 
     # Include pileup
-    columns.extend([str(col) for col in events_rdf.GetColumnNames() if (str(col).startswith("Pileup_") \
+    columns.extend([str(col) for col in rdf.GetColumnNames() if (str(col).startswith("Pileup_") \
                     or str(col).startswith("Rho_") or str(col).startswith("PV_")) and not str(col).endswith("_temp")])
     
     # Include MET
-    columns.extend([str(col) for col in events_rdf.GetColumnNames() if (str(col).startswith("RawPFMET") \
+    columns.extend([str(col) for col in rdf.GetColumnNames() if (str(col).startswith("RawPFMET") \
                     or str(col).startswith("RawPuppiMET") or str(col).startswith("PuppiMET") or str(col).startswith("PFMET") \
                     or str(col).startswith("CorrT1METJet") or str(col).startswith("RawPFMET")) and not str(col).endswith("_temp")])
 
-    # Include run info
-    columns.extend(["weight", "run", "luminosityBlock", "event", "int_lumi", "min_run", "max_run"])
+    # Include run info, the luminosity and run range are stored as metadata
+    columns.extend(["run", "luminosityBlock", "event"])
 
-    # Include triggers
-    columns.extend([trig for trig in triggers if trig in events_rdf.GetColumnNames()])
+    # Include triggers, or only their bitmask
+    if trigger_mask:
+        columns = [col for col in columns if col not in triggers]
+    else:
+        columns.extend([trig for trig in triggers if trig in rdf.GetColumnNames()])
 
     # Check for duplicates
     columns = list(set(columns))
     columns.sort()
 
-    print(f"Writing output for {output_path}.root")
-    start = time.time()
-    events_rdf.Snapshot("Events", output_path+"_events.root", columns)
-    runs_rdf.Snapshot("Runs", output_path+"_runs.root")
-    print(f"snapshot finished in {time.time()-start} s for {output_path}.root")
-
-    start = time.time()
-    subprocess.run(["hadd", "-f", "-k", output_path+".root",
-    output_path+"_events.root", output_path+"_runs.root"])
-    os.remove(output_path+"_events.root")
-    os.remove(output_path+"_runs.root")
-    print(f"hadd finished in {time.time()-start} s for {output_path}.root")
-
-    print(output_path+".root")
-
-    # Get a report of the processing
-    report = events_rdf.Report()
+    return columns
 
+def write_cutflow(report, output_path, counters=None):
     begin = report.begin()
     end = report.end()
     allEntries = 0 if begin == end else begin.__deref__().GetAll()
@@ -427,6 +550,14 @@ def skim(files, triggers, args, step=None):
 
         it.__preinc__()
 
+    # Counters which are not filters, ie. the number of reordered events
+    for name, n_pass, n_all in counters or []:
+        n_pass, n_all = int(n_pass.GetValue()), n_all.GetValue()
+        cuts.append({name: {"pass": n_pass, "all": n_all,
+                "eff": 100.0 * float(n_pass) / float(n_all) if n_all > 0 else 0.0,
+                "cumulativeEff": 100.0 * float(n_pass) / float(allEntries) \
+                    if allEntries > 0 else 0.0}})
+
     # Create four histograms with alphanumeric bins
     pass_hist = ROOT.TH1D("pass", "pass", len(cuts), 0, len(cuts))
     pass_hist.SetCanExtend(ROOT.TH1.kAllAxes)
@@ -450,7 +581,7 @@ def skim(files, triggers, args, step=None):
     eff_hist.SetError(np.zeros(len(cuts), dtype=np.float64))
     cum_eff_hist.SetError(np.zeros(len(cuts), dtype=np.float64))
 
-    # Save the histograms to test.root
+    # Save the histograms to the output file
     f = ROOT.TFile(output_path+".root", "UPDATE")
     pass_hist.Write()
     all_hist.Write()
@@ -458,3 +589,250 @@ def skim(files, triggers, args, step=None):
     cum_eff_hist.Write()
     f.Close()
 
+def skim(files, triggers, args, step=None, entry_ranges=None, branches=None, runs_files=None,
+         lumi=None):
+    # Channels sharing the same input are skimmed in a single event loop
+    channels = [ch.strip() for ch in args.channel.split(",")] if args.channel else [args.channel]
+
+    # Load the files. The Runs tree of a file split between steps is only
+    # written by the step with its first entries (runs_files)
+    events_chain = ROOT.TChain("Events")
+    runs_chain = ROOT.TChain("Runs")
+
+    for file in files:
+        with_runs = runs_files is None or file in runs_files
+        if not args.is_local:
+            try:
+                events_chain.Add(get_url(file, args.is_local))
+                if with_runs:
+                    runs_chain.Add(get_url(file, args.is_local))
+            except Exception as e:
+                print(f"Skipping problematic run: {e}")
+        else:
+            events_chain.Add(file)
+            if with_runs:
+                runs_chain.Add(file)
+
+    # Only read the given entry ranges of the files
+    if entry_ranges:
+        events_chain.SetEntryList(make_entry_list({get_url(file, args.is_local): entry_ranges.get(file)
+                                                   for file in files}))
+
+    events_rdf = ROOT.RDataFrame(events_chain)
+    root_rdf = events_rdf
+    runs_rdf = ROOT.RDataFrame(runs_chain) if runs_chain.GetNtrees() > 0 else None
+
+    if args.progress_bar:
+        ROOT.RDF.Experimental.AddProgressBar(events_rdf)
+
+    if args.golden_json:
+        events_rdf = filter_json(events_rdf, args.golden_json)
+
+    events_rdf = events_rdf.Filter("nJet > 0", "nJet > 0")
+
+    # Apply corrections
+    if args.correction_json:
+        import json
+        import correctionlib
+        correctionlib.register_pyroot_binding()
+
+        with open(args.correction_json) as f:
+            correction_info = json.load(f)
+
+        correction_info = correction_info[args.correction_key]
+
+        events_rdf = apply_jet_corrections(events_rdf, correction_info, jet_columns, args.jet_kernel,
+                                           args.vetomap_mode, args.jec_cache_size, args.propagate_met)
+    else:
+        events_rdf = correct_jetId(events_rdf)
+
+        # Define that no jets were vetoed
+        events_rdf = events_rdf.Define("Jet_vetoed", "ROOT::VecOps::RVec<bool>(Jet_pt.size(), false)")
+
+    # Count the events in which the JECs changed the jet order
+    counters = []
+    if "Jet_reordered_temp" in events_rdf.GetColumnNames():
+        counters.append(("Jets reordered by pT", events_rdf.Sum("Jet_reordered_temp"),
+                         events_rdf.Count()))
+
+    # Input branches of all files from the catalog, or of the first file
+    if branches is None:
+        branches = {str(col) for col in events_rdf.GetColumnNames()}
+
+    # Define energy fraction variables in case not in NanoAOD (added in V14)
+    ef_cols = ["Jet_chEmEF", "Jet_chHEF", "Jet_hfEmEF", "Jet_muEF", "Jet_neEmEF", "Jet_neHEF"]
+
+    for ef in ef_cols:
+        if ef not in branches:
+            events_rdf = events_rdf.Define(ef, "-1.0")
+
+    # Check that the triggers are in the file. A trigger missing from only
+    # some of the files is overridden, as the chain can not read it
+    cols = [str(col) for col in events_rdf.GetColumnNames()]
+    for trigger in triggers:
+        if trigger not in branches and "&&" not in trigger:
+            print(f"Trigger {trigger} not in the file") 
+            if trigger in cols:
+                events_rdf = events_rdf.Redefine(trigger, "false")
+            else:
+                events_rdf = events_rdf.Define(trigger, "0")
+
+    if len(triggers) == 0:
+        trg_filter = "1"
+    elif args.trigger_mask:
+        # Pack the triggers into a single column, bit i for triggers[i]
+        events_rdf = events_rdf.Define("trigger_mask", get_trigger_mask(triggers))
+        trg_filter = "trigger_mask != 0"
+    else:
+        trg_filter = " || ".join(triggers)
+    flag_filter = " && ".join(get_Flags())
+
+    # Define a weight column for MC, data has a constant weight of 1
+    # stored in the metadata instead
+    if args.is_mc:
+        xsec = weight_info["xsec"].get(args.mc_tag)
+        if xsec:
+            print(f"Reweight with xsec={xsec}")
+            events_rdf = (events_rdf.Define("weight", f"{xsec}*genWeight"))
+        else:
+            events_rdf = (events_rdf.Define("weight", "genWeight"))
+
+    # The luminosity of the exact golden lumisections adds up when outputs
+    # are merged, the one of a whole run range from brilcalc does not
+    additive_lumi = True
+    if lumi is not None:
+        min_run, max_run, int_lumi = lumi
+        print(f"Running on {int_lumi} 1/fb integrated luminosity")
+    elif args.run_range and args.dry_run:
+        min_run, max_run = (int(r) for r in args.run_range.split(","))
+        int_lumi = 0.
+        additive_lumi = False
+    elif args.run_range:
+        run_range = args.run_range.split(",")
+        assert(len(run_range) == 2)
+
+        print(f"Run range: ({run_range[0]}, {run_range[1]})");
+
+        # Without a lumi index, ask brilcalc for the whole run range
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lumi_csv = os.path.join(tmp_dir, "lumi.csv")
+            subprocess.run(["brilcalc", "lumi", "--normtag",
+                "/cvmfs/cms-bril.cern.ch/cms-lumi-pog/Normtags/normtag_BRIL.json",
+                "-u", "/fb", "--begin", f"{run_range[0]}", "--end", f"{run_range[1]}",
+                "-i", args.golden_json, "-o", lumi_csv])
+
+            df = pd.read_csv(lumi_csv, comment='#', names=["run:fill", "time", "nls",
+                "ncms", "delivered(/fb)", "recorded(/fb)"])
+        int_lumi = float(np.sum(df["recorded(/fb)"].to_numpy()))
+        print(f"Running on {int_lumi} 1/fb integrated luminosity")
+
+        min_run, max_run = int(run_range[0]), int(run_range[1])
+        additive_lumi = False
+    else:
+        min_run, max_run, int_lumi = 0, 1, 1.
+        additive_lumi = False
+
+    metadata = {"int_lumi": float(int_lumi), "min_run": int(min_run), "max_run": int(max_run)}
+    if not args.is_mc:
+        metadata["weight"] = 1.0
+    if args.trigger_mask:
+        metadata["trigger_bits"] = json.dumps(triggers)
+
+    # Branch the corrected events into one sub-graph per channel
+    outputs = []
+    for channel in channels:
+        # Initialize the JEC variables
+        print(f"Initializing TnP variables for {channel}")
+        channel_rdf = init_TnP(events_rdf, channel)
+        print(f"Initializing JEC variables for {channel}")
+        channel_rdf = do_JEC(channel_rdf)
+
+        # Filter based on triggers and flags
+        channel_rdf = (channel_rdf.Filter(trg_filter, trg_filter)
+                .Filter(flag_filter, flag_filter)
+                )
+
+        output_path = get_output_path(args, channel, step)
+        columns = get_output_columns(channel_rdf, triggers, args.trigger_mask)
+        outputs.append((output_path, channel_rdf, columns))
+
+    if args.dry_run:
+        plan_skim(args, files, root_rdf, outputs, runs_rdf, counters, triggers, branches,
+                  entry_ranges, channels)
+        return
+
+    write_output(outputs, runs_rdf, counters, metadata, additive_lumi)
+
+    if args.correction_json and args.jec_cache_size > 0:
+        print_jec_cache_report()
+
+def plan_skim(args, files, root_rdf, outputs, runs_rdf, counters, triggers, branches,
+              entry_ranges, channels):
+    """
+    Write the cost estimate of the booked skim instead of running it. The
+    branches read are the input branches named in the expressions of the
+    skim and the selections of the channels, or written to the outputs.
+    """
+    modules = ["skim.py", "skimming_utils.py"] + [f"selections/{channel}.py"
+                                                  for channel in channels if channel]
+    identifiers = get_source_identifiers(modules) | set(triggers) | set(get_Flags()) \
+            | set(jet_columns)
+    for _, _, columns in outputs:
+        identifiers.update(str(column) for column in columns)
+    read = branches & identifiers
+
+    urls = [get_url(file, args.is_local) for file in files]
+    ranges = {get_url(file, args.is_local): entry_ranges[file]
+              for file in files if entry_ranges.get(file)} if entry_ranges else None
+    inputs = [make_input(urls, read, 1, ranges)]
+    if runs_rdf is not None:
+        inputs.append(make_input([], [], 1))
+
+    # The Snapshot and Report of every output are booked by write_output
+    graph = get_graph_counts(root_rdf)
+    graph["actions"] += 2 * len(outputs)
+    report = make_report("skim", inputs, graph, n_slots=get_n_slots(args.nThreads),
+                         outputs=[output_path + ".root" for output_path, _, _ in outputs])
+    write_report(report, args.dry_run)
+
+def write_output(outputs, runs_rdf, counters=None, metadata=None, additive_lumi=True):
+    """
+    Write the Events tree, the Runs tree and the cutflow histograms of each
+    (output_path, rdf, columns) in outputs directly into output_path.root.
+    counters are (name, pass, all) results of the shared graph added to
+    every cutflow. Without runs_rdf no Runs tree is written. The constants
+    in metadata are written as TParameters, see metadata.write_metadata.
+    """
+    snapshot_options = ROOT.RDF.RSnapshotOptions()
+    snapshot_options.fLazy = True
+
+    # Events of all outputs are written in a single event loop
+    handles = []
+    reports = []
+    for output_path, rdf, columns in outputs:
+        print(f"Writing output for {output_path}.root")
+        handles.append(rdf.Snapshot("Events", output_path+".root", columns, snapshot_options))
+        reports.append(rdf.Report())
+
+    start = time.time()
+    ROOT.RDF.RunGraphs(handles)
+    print(f"Events snapshot finished in {time.time()-start} s for {len(outputs)} output(s)")
+
+    # Runs are appended after the Events loop, as two snapshots running
+    # concurrently can not safely write into the same file
+    snapshot_options.fMode = "UPDATE"
+    if runs_rdf is not None:
+        handles = [runs_rdf.Snapshot("Runs", output_path+".root", "", snapshot_options)
+                   for output_path, _, _ in outputs]
+
+        start = time.time()
+        ROOT.RDF.RunGraphs(handles)
+        print(f"Runs snapshot finished in {time.time()-start} s for {len(outputs)} output(s)")
+
+    start = time.time()
+    for (output_path, _, _), report in zip(outputs, reports):
+        write_cutflow(report, output_path, counters)
+        if metadata:
+            write_metadata(output_path+".root", metadata, additive_lumi)
+        print(output_path+".root")
+    print(f"cutflow finished in {time.time()-start} s for {len(outputs)} output(s)")
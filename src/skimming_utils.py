@@ -1,113 +1,37 @@
 import ROOT
+import re
+import numpy as np
 
-def correct_jetId(rdf):
-    ROOT.gInterpreter.Declare("""
-    #ifndef JETID_FIX
-    #define JETID_FIX
-
-    
-ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<int>& Jet_jetId, const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF) {
-    ROOT::VecOps::RVec<unsigned int> Jet_passJetId(Jet_eta.size(), 0);
-    
-    for (size_t i = 0; i < Jet_eta.size(); ++i) {
-        bool passTight = false;
-        bool passTightLepVeto = false;
-        
-        if (abs(Jet_eta[i]) <= 2.7)
-            passTight = Jet_jetId[i] & (1 << 1);
-        else if (abs(Jet_eta[i]) > 2.7 && abs(Jet_eta[i]) <= 3.0)
-            passTight = (Jet_jetId[i] & (1 << 1)) && (Jet_neHEF[i] < 0.99);
-        else if (abs(Jet_eta[i]) > 3.0)
-            passTight = (Jet_jetId[i] & (1 << 1)) && (Jet_neEmEF[i] < 0.4);
-        
-        if (passTight) {
-            passTightLepVeto = (abs(Jet_eta[i]) > 2.7) ? passTight : (passTight && (Jet_muEF[i] < 0.8) && (Jet_chEmEF[i] < 0.8));
-            Jet_passJetId[i] = passTightLepVeto ? 6 : 2;
-        }
-    }
-    return Jet_passJetId;
-}
-
-ROOT::VecOps::RVec<unsigned int> fix_jetId(const ROOT::VecOps::RVec<float>& Jet_eta, const ROOT::VecOps::RVec<float>& Jet_neHEF, const ROOT::VecOps::RVec<float>& Jet_neEmEF, const ROOT::VecOps::RVec<int>& Jet_chMultiplicity, const ROOT::VecOps::RVec<int>& Jet_neMultiplicity, const ROOT::VecOps::RVec<float>& Jet_chHEF, const ROOT::VecOps::RVec<float>& Jet_muEF, const ROOT::VecOps::RVec<float>& Jet_chEmEF) {
-    ROOT::VecOps::RVec<unsigned int> Jet_passJetId(Jet_eta.size(), 0);
-    
-    for (size_t i = 0; i < Jet_eta.size(); ++i) {
-        bool passTight = false;
-        bool passTightLepVeto = false;
-        
-        if (abs(Jet_eta[i]) <= 2.6)
-            passTight = (Jet_neHEF[i] < 0.99) && (Jet_neEmEF[i] < 0.9) && (Jet_chMultiplicity[i] + Jet_neMultiplicity[i] > 1) && (Jet_chHEF[i] > 0.01) && (Jet_chMultiplicity[i] > 0);
-        else if (abs(Jet_eta[i]) > 2.6 && abs(Jet_eta[i]) <= 2.7)
-            passTight = (Jet_neHEF[i] < 0.90) && (Jet_neEmEF[i] < 0.99);
-        else if (abs(Jet_eta[i]) > 2.7 && abs(Jet_eta[i]) <= 3.0)
-            passTight = (Jet_neHEF[i] < 0.99);
-        else if (abs(Jet_eta[i]) > 3.0)
-            passTight = (Jet_neMultiplicity[i] >= 2) && (Jet_neEmEF[i] < 0.4);
-        
-        if (passTight) {
-            passTightLepVeto = (abs(Jet_eta[i]) > 2.7) ? passTight : (passTight && (Jet_muEF[i] < 0.8) && (Jet_chEmEF[i] < 0.8));
-            Jet_passJetId[i] = passTightLepVeto ? 6 : 2;
-        }
-    }
-    return Jet_passJetId;
-}
-#endif
-    """)
+from kernels import load_kernels
 
+def get_jetId_input(rdf):
     jetcols = [str(col) for col in rdf.GetColumnNames() if str(col).startswith("Jet_")]
 
     if "Jet_chMultiplicity" in jetcols:
-        id_input = "Jet_eta,Jet_neHEF,Jet_neEmEF,Jet_chMultiplicity,Jet_neMultiplicity,Jet_chHEF,Jet_muEF,Jet_chEmEF"
+        return "Jet_eta,Jet_neHEF,Jet_neEmEF,Jet_chMultiplicity,Jet_neMultiplicity,Jet_chHEF,Jet_muEF,Jet_chEmEF"
     else:
-        id_input = "Jet_jetId,Jet_eta,Jet_neHEF,Jet_neEmEF,Jet_muEF,Jet_chEmEF"
-
-    rdf = rdf.Redefine("Jet_jetId", f"fix_jetId({id_input})")
-
-    return rdf
-
-def correct_jets(rdf, cfile, cstack, ccols="Jet_rawPt,Jet_eta,Rho_fixedGridRhoFastjetAll,Jet_area,Jet_phi"):
-    ROOT.gInterpreter.Declare(
-f"""
-#ifndef JET_CORRECTIONS
-#define JET_CORRECTIONS
-
-#include <string>
-#include "correction.h"
+        return "Jet_jetId,Jet_eta,Jet_neHEF,Jet_neEmEF,Jet_muEF,Jet_chEmEF"
 
-auto cset = correction::CorrectionSet::from_file("{cfile}");
-auto cstack = (cset->compound()).at("{cstack}");
-#endif
-"""
-    )
-
-    ROOT.gInterpreter.Declare(
-"""
-#ifndef GET_CORRECTION
-#define GET_CORRECTION
-const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area) {
-    ROOT::VecOps::RVec<float> correction_factors;
-
-    for (size_t i = 0; i < pt.size(); i++) {
-        correction_factors.push_back(cstack->evaluate({area[i], eta[i], pt[i], rho}));
-    }
+def correct_jetId(rdf):
+    load_kernels("kernels")
 
-    return correction_factors;
-}
+    rdf = rdf.Redefine("Jet_jetId", f"fix_jetId({get_jetId_input(rdf)})")
 
-const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>& pt, const ROOT::VecOps::RVec<float>& eta, float rho, const ROOT::VecOps::RVec<float>& area, const ROOT::VecOps::RVec<float>& phi) {
-    ROOT::VecOps::RVec<float> correction_factors;
+    return rdf
 
-    for (size_t i = 0; i < pt.size(); i++) {
-        correction_factors.push_back(cstack->evaluate({area[i], eta[i], phi[i], pt[i], rho}));
-    }
+def declare_jec(cfile, cstack):
+    load_kernels("corrections")
+    ROOT.init_jec(cfile, cstack)
 
-    return correction_factors;
-}
-#endif
-""")
+def correct_jets(rdf, cfile, cstack, ccols="Jet_rawPt,Jet_eta,Rho_fixedGridRhoFastjetAll,Jet_area,Jet_phi",
+                 cache_size=0, propagate_met=False):
+    declare_jec(cfile, cstack)
+    ROOT.jec_cache_config.capacity = cache_size
+    if cache_size > 0:
+        print(f"Caching JECs in {cache_size} entries per thread")
 
     rdf = (rdf.Define("Jet_rawPt", "(1.0 - Jet_rawFactor) * Jet_pt")
-            .Define("Jet_correctionFactor", f"get_correction({ccols})")
+            .Define("Jet_correctionFactor", f"get_correction_batched({ccols})")
             .Redefine("Jet_pt", "Jet_pt * Jet_correctionFactor")
             .Redefine("Jet_mass", "(1.0 - Jet_rawFactor) * Jet_mass * Jet_correctionFactor")
             .Redefine("Jet_rawFactor", "1.0-1.0/Jet_correctionFactor")
@@ -117,97 +41,422 @@ const ROOT::VecOps::RVec<float> get_correction( const ROOT::VecOps::RVec<float>&
             .Redefine("CorrectedJet_temp", "ROOT::VecOps::Sum(CorrectedJet_temp, ROOT::Math::Polar2DVectorF())")
             .Define("PuppiMET_temp", "ROOT::Math::Polar2DVectorF(PuppiMET_pt, PuppiMET_phi)")
             .Define("T1MET_temp", "PuppiMET_temp + UncorrectedJet_temp - CorrectedJet_temp") # -RC?
-            .Redefine("PuppiMET_pt", "float(PuppiMET_temp.R())")
-            .Redefine("PuppiMET_phi", "float(PuppiMET_temp.Phi())")
+    )
+    met = "T1MET_temp" if propagate_met else "PuppiMET_temp"
+    rdf = (rdf.Redefine("PuppiMET_pt", f"float({met}.R())")
+            .Redefine("PuppiMET_phi", f"float({met}.Phi())")
     )
 
     return rdf
 
-def find_vetojets(rdf, vfile, vset, vcols=["Jet_eta", "Jet_phi"]):
-    ROOT.gInterpreter.Declare(
-f"""
-#ifndef VETO_JETS
-#define VETO_JETS
+def print_jec_cache_report():
+    report = ROOT.jec_cache_report()
+    lookups = report.hits + report.misses
+    hit_rate = report.hits / lookups if lookups > 0 else 0.0
+    print(f"JEC cache: {lookups} lookups, hit rate {100.0 * hit_rate:.2f} %, "
+          f"max relative deviation {report.max_deviation:.2e} in {report.checked} checked hits")
+    return {"lookups": lookups, "hit_rate": hit_rate, "max_deviation": report.max_deviation,
+            "checked": report.checked}
+
+def declare_vetomap(vfile, vset):
+    load_kernels("corrections")
+    ROOT.init_vetomap(vfile, vset)
+
+def get_vetomap_axes(vfile, vset, vtype="jetvetomap"):
+    """
+    Read the eta and phi bin edges and the flattened bin contents of the
+    vtype map in the vset correction of a correctionlib vetomap file.
+    """
+    from correctionlib.highlevel import model_auto, open_auto
+
+    model = model_auto(open_auto(vfile))
+    node = next(c for c in model.corrections if c.name == vset).data
+    if node.nodetype == "category":
+        node = next(item.value for item in node.content if item.key == vtype)
+    if node.nodetype != "multibinning" or list(node.inputs) != ["eta", "phi"]:
+        raise ValueError(f"Unsupported vetomap layout in {vset}: {node.nodetype}")
+
+    axes = []
+    for edges in node.edges:
+        if isinstance(edges, list):
+            axes.append((np.array(edges, dtype=np.float64), False))
+        else:
+            axes.append((np.linspace(edges.low, edges.high, edges.n + 1), True))
+
+    content = np.array(node.content, dtype=np.float64)
+    if len(content) != (len(axes[0][0]) - 1) * (len(axes[1][0]) - 1):
+        raise ValueError(f"Vetomap {vset} has non-numeric bin contents")
+
+    return axes[0], axes[1], content
+
+def validate_vetomap_bitmap(veval, vtype="jetvetomap", n_points=500):
+    """
+    Compare the bitmap against correctionlib on a dense eta x phi grid.
+    Returns the number of grid points that disagree.
+    """
+    eta = np.linspace(-5.131, 5.131, n_points, dtype=np.float32)
+    phi = np.linspace(-3.14159, 3.14159, n_points, dtype=np.float32)
+    eta, phi = [x.flatten() for x in np.meshgrid(eta, phi)]
+
+    expected = veval.evaluate(vtype, eta, phi) > 0.0
+    bitmap = np.array(ROOT.get_veto_bitmap(ROOT.VecOps.AsRVec(eta), ROOT.VecOps.AsRVec(phi)),
+                      dtype=bool)
+
+    return int(np.count_nonzero(expected != bitmap))
+
+# Vetomap file, set and type in the process-global veto_bitmap
+vetomap_key = None
+
+def init_vetomap_bitmap(vfile, vset, vtype="jetvetomap"):
+    """
+    Fill veto_bitmap from the vetomap file and validate it against
+    correctionlib. Returns False if the bitmap can not be used.
+    """
+    global vetomap_key
+    import correctionlib
+
+    load_kernels("kernels")
+    if ROOT.veto_bitmap.size() > 0 and vetomap_key == (vfile, vset, vtype):
+        return True
+    vetomap_key = None
+
+    try:
+        (eta_edges, eta_uniform), (phi_edges, phi_uniform), content = get_vetomap_axes(vfile, vset, vtype)
+    except Exception as e:
+        print(f"Could not build vetomap bitmap: {e}")
+        return False
+
+    ROOT.veto_bitmap.init(ROOT.std.vector["double"](eta_edges.tolist()), eta_uniform,
+                          ROOT.std.vector["double"](phi_edges.tolist()), phi_uniform,
+                          ROOT.std.vector["unsigned char"]((content > 0.0).astype(int).tolist()))
+
+    veval = correctionlib.CorrectionSet.from_file(vfile)[vset]
+    mismatches = validate_vetomap_bitmap(veval, vtype)
+    if mismatches > 0:
+        print(f"Vetomap bitmap differs from correctionlib in {mismatches} grid points")
+        return False
+
+    print(f"Vetomap bitmap with {len(eta_edges)-1}x{len(phi_edges)-1} bins validated")
+    vetomap_key = (vfile, vset, vtype)
+    return True
+
+def find_vetojets(rdf, vfile, vset, vcols=["Jet_eta", "Jet_phi"], mode="bitmap"):
+    if mode == "bitmap" and init_vetomap_bitmap(vfile, vset):
+        return rdf.Define("Jet_vetoed", f"get_veto_bitmap({','.join(vcols)})")
+
+    print("Using correctionlib for vetomaps")
+    declare_vetomap(vfile, vset)
+    rdf = (rdf.Define("Jet_vetoed", f"get_veto({','.join(vcols)})"))
 
-#include <string>
-#include "correction.h"
+    return rdf
 
-auto vset = correction::CorrectionSet::from_file("{vfile}");
-auto veval = vset->at("{vset}");
-#endif
-"""
+def correct_jets_fused(rdf, cfile, cstack, jet_columns, vfile=None, vset=None, vetomap_mode="bitmap",
+                       cache_size=0, propagate_met=False):
+    """
+    Jet ID fix, JECs, pT sorting and vetomaps, and with propagate_met the
+    type-1 propagation of the JECs to the PuppiMET, in a single kernel
+    (correct_jets_fused in cpp/corrections.cxx). Gives the same columns as
+    correct_jetId, correct_jets, sort_jets and find_vetojets.
+    """
+    declare_jec(cfile, cstack)
+    ROOT.jec_cache_config.capacity = cache_size
+    if cache_size > 0:
+        print(f"Caching JECs in {cache_size} entries per thread")
+
+    veto_mode = "kNoVeto"
+    if vfile and vset:
+        if vetomap_mode == "bitmap" and init_vetomap_bitmap(vfile, vset):
+            veto_mode = "kVetoBitmap"
+        else:
+            print("Using correctionlib for vetomaps")
+            declare_vetomap(vfile, vset)
+            veto_mode = "kVetoCorrectionlib"
+
+    rdf = (rdf.Define("Jet_corrected_temp", f"correct_jets_fused(fix_jetId({get_jetId_input(rdf)}), \
+                Jet_pt, Jet_eta, Jet_phi, Jet_mass, Jet_rawFactor, Jet_area, \
+                Rho_fixedGridRhoFastjetAll, PuppiMET_pt, PuppiMET_phi, {str(propagate_met).lower()}, \
+                {veto_mode})")
+            .Define("Jet_order_temp", "Jet_corrected_temp.order")
+            .Define("Jet_reordered_temp", "int(!Jet_order_temp.empty())")
     )
 
-    ROOT.gInterpreter.Declare(
-"""
-#ifndef GET_VETO
-#define GET_VETO
-
-ROOT::VecOps::RVec<bool> get_veto( const ROOT::VecOps::RVec<float>& eta, 
-                                   const ROOT::VecOps::RVec<float>& phi, 
-                                   std::string type="jetvetomap") {
-    ROOT::VecOps::RVec<bool> veto_flags;
-
-    for (size_t i = 0; i < eta.size(); i++) {
-        if (abs(eta[i]) > 5.131 || abs(phi[i]) > 3.14159) {
-            veto_flags.push_back(true);
-            continue;
-        } 
-        float veto = veval->evaluate({type, eta[i], phi[i]});
-        veto_flags.push_back(veto > 0.0);
-    }
-
-    return veto_flags;
-}
-#endif
-"""
+    # Columns computed by the kernel, the rest is only reordered
+    kernel_columns = {"Jet_pt": "pt", "Jet_eta": "eta", "Jet_phi": "phi", "Jet_mass": "mass",
+                      "Jet_rawFactor": "rawFactor", "Jet_jetId": "jetId"}
+    columns = [str(col) for col in rdf.GetColumnNames()]
+    for col in jet_columns:
+        if col in kernel_columns:
+            rdf = rdf.Redefine(col, f"Jet_corrected_temp.{kernel_columns[col]}")
+        elif col in columns:
+            rdf = rdf.Redefine(col, f"apply_jet_order({col}, Jet_order_temp)")
+
+    rdf = (rdf.Define("Jet_rawPt", "Jet_corrected_temp.rawPt")
+            .Define("Jet_correctionFactor", "Jet_corrected_temp.correctionFactor")
+            .Define("Jet_vetoed", "Jet_corrected_temp.vetoed")
     )
+    if propagate_met:
+        rdf = (rdf.Redefine("PuppiMET_pt", "Jet_corrected_temp.met_pt")
+                .Redefine("PuppiMET_phi", "Jet_corrected_temp.met_phi")
+        )
 
-    rdf = (rdf.Define("Jet_vetoed", f"get_veto({','.join(vcols)})"))
+    return rdf
+
+def apply_jet_corrections(rdf, correction_info, jet_columns, kernel="chain", vetomap_mode="bitmap",
+                          cache_size=0, propagate_met=False):
+    """
+    Jet ID fix, JECs, pT sorting and vetomaps defined by an entry of the
+    correction JSON, either as a chain of RDF columns or with the fused
+    kernel. With propagate_met the PuppiMET is replaced by the type-1
+    corrected one.
+    """
+    has_jec = "jec_path" in correction_info and "jec_stack" in correction_info
+    has_vetomap = "vetomap_path" in correction_info and "vetomap_set" in correction_info
+
+    if kernel == "fused" and has_jec:
+        return correct_jets_fused(rdf, correction_info["jec_path"], correction_info["jec_stack"],
+                                  jet_columns, correction_info.get("vetomap_path"),
+                                  correction_info.get("vetomap_set"), vetomap_mode, cache_size,
+                                  propagate_met)
+
+    rdf = correct_jetId(rdf)
+
+    # JECs
+    if has_jec:
+        rdf = correct_jets(rdf, correction_info["jec_path"], correction_info["jec_stack"],
+                           cache_size=cache_size, propagate_met=propagate_met)
+        rdf = sort_jets(rdf, jet_columns)
+
+    # Vetomaps
+    if has_vetomap:
+        rdf = find_vetojets(rdf, correction_info["vetomap_path"], correction_info["vetomap_set"],
+                            mode=vetomap_mode)
+    else:
+        rdf = rdf.Define("Jet_vetoed", "ROOT::VecOps::RVec<bool>(Jet_pt.size(), false)")
 
     return rdf
 
+def get_lumi_ranges(json_file):
+    """
+    Read a golden JSON into a sorted list of runs and, for each run,
+    a sorted list of non-overlapping (first, last) lumisection ranges.
+    """
+    import json
+
+    with open(json_file) as f:
+        golden = json.load(f)
+
+    lumi_ranges = {}
+    for run in sorted(golden, key=int):
+        merged = []
+        for first, last in sorted(golden[run]):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        lumi_ranges[int(run)] = [tuple(r) for r in merged]
+
+    return lumi_ranges
+
+def init_lumi_mask(mask, lumi_ranges):
+    # Runs have to be added in ascending order
+    for run, ranges in lumi_ranges.items():
+        firsts = ROOT.std.vector["unsigned int"]([r[0] for r in ranges])
+        lasts = ROOT.std.vector["unsigned int"]([r[1] for r in ranges])
+        mask.add_run(run, firsts, lasts)
+    return mask
+
+# Golden JSON in the process-global lumi_mask
+lumi_mask_path = None
+
+def load_lumi_mask(json_file):
+    """
+    Fill the process-global lumi_mask from json_file, replacing a mask of
+    another golden JSON. Graphs booked with the previous mask see the new
+    one, so load a different JSON only once they have run.
+    """
+    global lumi_mask_path
+    load_kernels("kernels")
+    if ROOT.lumi_mask.nRuns() == 0 or lumi_mask_path != json_file:
+        if ROOT.lumi_mask.nRuns() > 0:
+            print(f"Replacing the lumi mask of {lumi_mask_path} with {json_file}")
+            ROOT.lumi_mask.clear()
+        print("Initializing JSON file")
+        init_lumi_mask(ROOT.lumi_mask, get_lumi_ranges(json_file))
+        lumi_mask_path = json_file
+    return ROOT.lumi_mask
 
 def filter_json(rdf, filter_json):
-    ROOT.gInterpreter.Declare(
-"""
-#ifndef JSONFILTER
-#define JSONFILTER
-
-#include <iostream>
-#include <nlohmann/json.hpp>
-#include <fstream>
-#include <string>
-
-using json = nlohmann::json;
-
-json filter_json;
-
-void init_json(std::string jsonFile) {
-    std::cout << "Initializing JSON file" << std::endl;
-    std::ifstream f(jsonFile);
-    filter_json = json::parse(f);
-}
-
-bool isGoodLumi(int run, int lumi) {
-   for (auto& lumiRange : filter_json[std::to_string(run)]) {
-       if (lumi >= lumiRange[0] && lumi <= lumiRange[1]) {
-           return true;
-       }
-   }
-
-    return false;
-}
-
-#endif
-"""
-    )
-    ROOT.init_json(filter_json)
+    mask = load_lumi_mask(filter_json)
     print("Applying golden JSON cut")
     print(f"JSON file: {filter_json}")
+    print(f"{mask.nRuns()} runs, {mask.nRanges()} lumisection ranges")
     rdf = (rdf.Filter("isGoodLumi(run, luminosityBlock)", "JSON filter"))
     return rdf
 
+def get_run_from_path(file):
+    """
+    Run number encoded in a prompt data store path, ie.
+    /store/data/Run2024H/JetMET0/NANOAOD/PromptReco-v1/000/385/836/00000/x.root
+    """
+    match = re.search(r"/(\d{3})/(\d{3})/(\d{3})/\d{5}/[^/]+\.root$", file)
+    if not match:
+        return None
+    return int("".join(match.groups()))
+
+def get_golden_clusters(tree, good, entries=None):
+    """
+    Merge the clusters of tree containing at least one good entry into
+    [begin, end) entry ranges. good is indexed by entry number, or given in
+    the order of the entry numbers entries, ie. the rdfentry_ of a
+    multithreaded AsNumpy, which follows the order the clusters were
+    processed in.
+    """
+    if entries is not None:
+        good = good[np.argsort(entries, kind="stable")]
+    n_entries = tree.GetEntries()
+    ranges = []
+    it = tree.GetClusterIterator(0)
+    begin = it()
+    while begin < n_entries:
+        end = min(it.GetNextEntry(), n_entries)
+        if good[begin:end].any():
+            if ranges and ranges[-1][1] == begin:
+                ranges[-1][1] = end
+            else:
+                ranges.append([begin, end])
+        begin = it()
+    return [tuple(r) for r in ranges]
+
+def plan_golden_files(files, urls, json_file, read_lumis=False, infos=None):
+    """
+    Drop input files without any golden lumisections before the event loop.
+
+    Files from runs missing in the golden JSON are dropped based on the run
+    number in their store path. If read_lumis is set, the LuminosityBlocks
+    tree of the remaining files is read as well: files without golden
+    lumisections are dropped and for partially good files only the clusters
+    containing golden lumisections are kept.
+
+    With infos (file -> catalog metadata) the lumisection coverage is taken
+    from the catalog, and only partially good files are opened.
+
+    Returns the kept files and a dict of file -> [(begin, end), ...] entry
+    ranges to read. Files missing from the dict are read completely.
+    """
+    mask = load_lumi_mask(json_file)
+
+    kept = []
+    entry_ranges = {}
+    dropped_runs = 0
+    dropped_lumis = 0
+    n_partial = 0
+    bytes_saved = 0
+    for file, url in zip(files, urls):
+        run = get_run_from_path(file)
+        if run is not None and not mask.hasRun(run):
+            dropped_runs += 1
+            continue
+
+        if not read_lumis:
+            kept.append(file)
+            continue
+
+        info = infos.get(file) if infos else None
+        if info:
+            lumi_good = [mask.accept(int(run), lumi) for run, ranges in info["lumis"].items()
+                         for first, last in ranges for lumi in range(first, last + 1)]
+            if not any(lumi_good):
+                dropped_lumis += 1
+                bytes_saved += info["size"]
+                continue
+            if all(lumi_good):
+                kept.append(file)
+                entry_ranges[file] = [(0, info["entries"])]
+                continue
+
+        f = ROOT.TFile.Open(url)
+        if not f or f.IsZombie():
+            print(f"Could not open {url} for planning, keeping it")
+            kept.append(file)
+            continue
+
+        if not info:
+            lumi_good = [mask.accept(lumi.run, lumi.luminosityBlock)
+                         for lumi in f.Get("LuminosityBlocks")]
+            if not any(lumi_good):
+                dropped_lumis += 1
+                bytes_saved += f.GetSize()
+                f.Close()
+                continue
+
+        kept.append(file)
+        events = f.Get("Events")
+        if all(lumi_good):
+            entry_ranges[file] = [(0, events.GetEntries())]
+        else:
+            # The skim has enabled implicit multithreading by now, so the
+            # flags come back in the order the clusters were processed
+            good = (ROOT.RDataFrame(events).Define("entry_temp", "rdfentry_")
+                    .Define("good_temp", "isGoodLumi(run, luminosityBlock)")
+                    .AsNumpy(["entry_temp", "good_temp"]))
+            entry_ranges[file] = get_golden_clusters(events, good["good_temp"], good["entry_temp"])
+            read = sum(end - begin for begin, end in entry_ranges[file])
+            bytes_saved += int(f.GetSize() * (1.0 - read / max(events.GetEntries(), 1)))
+            n_partial += 1
+        f.Close()
+
+    print(f"Golden JSON planning: kept {len(kept)}/{len(files)} files, "
+          f"dropped {dropped_runs} files from uncertified runs and "
+          f"{dropped_lumis} files without golden lumisections, "
+          f"{n_partial} files read partially")
+    if read_lumis:
+        print(f"Golden JSON planning: skipping {bytes_saved / 1024**2:.1f} MB "
+              f"(not counting files dropped by run number)")
+
+    return kept, entry_ranges
+
+def intersect_ranges(a, b):
+    """
+    Intersection of two sorted lists of [begin, end) entry ranges, where
+    None stands for the whole file.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    ranges = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        begin, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if begin < end:
+            ranges.append((begin, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return ranges
+
+def make_entry_list(entry_ranges, tree_name="Events"):
+    """
+    Build a TEntryList reading only the given [begin, end) entry ranges of
+    file in entry_ranges (url -> ranges). Files with ranges None are read
+    completely.
+    """
+    elist = ROOT.TEntryList("entry_ranges", "entry_ranges")
+    for url, ranges in entry_ranges.items():
+        sublist = ROOT.TEntryList("", "", tree_name, url)
+        if ranges is None:
+            f = ROOT.TFile.Open(url)
+            if not f or f.IsZombie():
+                print(f"Could not open {url}, skipping it")
+                continue
+            ranges = [(0, f.Get(tree_name).GetEntries())]
+            f.Close()
+        for begin, end in ranges:
+            sublist.EnterRange(begin, end)
+        elist.AddSubList(sublist)
+    return elist
+
 def get_Flags(campaign=None):
     # TODO: Implement campaign-specific flags
     flags = [
@@ -224,8 +473,12 @@ def get_Flags(campaign=None):
     return flags
 
 def sort_jets(rdf, jet_columns):
-    # Sort jets by pt
-    rdf = rdf.Define("Jet_pt_index", "ROOT::VecOps::Reverse(ROOT::VecOps::Argsort(Jet_pt))")
+    # Sort jets by pt. Usually the JECs do not change the order, in which
+    # case the columns are passed through as they are.
+    load_kernels("kernels")
+    rdf = (rdf.Define("Jet_order_temp", "get_jet_order(Jet_pt)")
+            .Define("Jet_reordered_temp", "int(!Jet_order_temp.empty())")
+    )
     for col in jet_columns:
-        rdf = rdf.Redefine(f"{col}", f"ROOT::VecOps::Take({col}, Jet_pt_index)")
+        rdf = rdf.Redefine(f"{col}", f"apply_jet_order({col}, Jet_order_temp)")
     return rdf
\ No newline at end of file
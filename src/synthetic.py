@@ -0,0 +1,242 @@
+import ROOT
+import json
+import os
+import re
+import numpy as np
+
+from kernels import load_kernels
+from processing_utils import file_read_lines, get_bins
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRIGGER_LISTS = ["JME_triggers_skim.txt", "EGM_triggers_skim.txt", "ZJET_triggers_skim.txt"]
+
+FIRST_RUN = 385000
+CORRECTION_KEY = "Synthetic"
+JEC_STACK = "Synthetic_V1_DATA_L1L2L3Res_AK4PFPuppi"
+VETOMAP_SET = "Synthetic_V1"
+
+# NanoAOD branch -> SyntheticEvent member
+event_columns = {
+    "Jet_pt": "jet_pt", "Jet_eta": "jet_eta", "Jet_phi": "jet_phi", "Jet_mass": "jet_mass",
+    "Jet_rawFactor": "jet_rawFactor", "Jet_area": "jet_area", "Jet_chEmEF": "jet_chEmEF",
+    "Jet_chHEF": "jet_chHEF", "Jet_neEmEF": "jet_neEmEF", "Jet_neHEF": "jet_neHEF",
+    "Jet_hfEmEF": "jet_hfEmEF", "Jet_hfHEF": "jet_hfHEF", "Jet_muEF": "jet_muEF",
+    "Jet_btagPNetQvG": "jet_btagPNetQvG", "Jet_jetId": "jet_jetId",
+    "Jet_nConstituents": "jet_nConstituents", "Jet_nElectrons": "jet_nElectrons",
+    "Jet_nMuons": "jet_nMuons", "Jet_chMultiplicity": "jet_chMultiplicity",
+    "Jet_neMultiplicity": "jet_neMultiplicity",
+    "Muon_pt": "muon_pt", "Muon_eta": "muon_eta", "Muon_phi": "muon_phi", "Muon_mass": "muon_mass",
+    "Muon_pfRelIso03_all": "muon_pfRelIso03_all", "Muon_charge": "muon_charge",
+    "Muon_tightId": "muon_tightId",
+    "Photon_pt": "photon_pt", "Photon_eta": "photon_eta", "Photon_phi": "photon_phi",
+    "Photon_hoe": "photon_hoe", "Photon_r9": "photon_r9", "Photon_cutBased": "photon_cutBased",
+    "Photon_jetIdx": "photon_jetIdx",
+    "Rho_fixedGridRhoFastjetAll": "rho", "PuppiMET_pt": "met_pt", "PuppiMET_phi": "met_phi",
+    "RawPuppiMET_pt": "raw_met_pt", "RawPuppiMET_phi": "raw_met_phi", "PV_npvs": "npvs",
+}
+
+def get_triggers():
+    triggers = []
+    for trigger_list in TRIGGER_LISTS:
+        for trigger in file_read_lines(os.path.join(REPO_DIR, "data", "triggerlists", trigger_list)):
+            if trigger not in triggers:
+                triggers.append(trigger)
+    return triggers
+
+def get_trigger_expression(trigger):
+    """
+    Emulate a trigger path from the leading objects of the event
+    """
+    threshold = re.search(r"(\d+)", trigger)
+    threshold = threshold.group(1) if threshold else "0"
+    if trigger == "HLT_ZeroBias":
+        return "ev_temp.random < 0.01"
+    elif trigger.startswith("HLT_PFJetFwd"):
+        return f"ev_temp.lead_fwd_jet_pt > {threshold}"
+    elif trigger.startswith("HLT_DiPFJetAve"):
+        return f"ev_temp.dijet_ave > {threshold}"
+    elif trigger.startswith("HLT_PFJet"):
+        return f"ev_temp.lead_jet_pt > {threshold}"
+    elif trigger.startswith("HLT_Photon"):
+        return f"ev_temp.lead_photon_pt > {threshold}"
+    elif trigger.startswith("HLT_Mu") or trigger.startswith("HLT_IsoMu"):
+        return f"ev_temp.n_muons >= 2 && ev_temp.lead_muon_pt > {threshold}"
+    return "false"
+
+def get_store_path(out, run, i):
+    """
+    Prompt data like store path, so that the run can be read from the path
+    """
+    return os.path.join(out, "store", "data", "Run2024S", "Synthetic", "NANOAOD", "PromptReco-v1",
+                        f"{run // 1000000:03d}", f"{run // 1000 % 1000:03d}", f"{run % 1000:03d}",
+                        "00000", f"synthetic_{i}.root")
+
+def write_file(path, run, lumis_per_run, events_per_lumi, first_event, args, triggers):
+    from skimming_utils import get_Flags
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    n_events = lumis_per_run * events_per_lumi
+
+    rdf = (ROOT.RDataFrame(n_events)
+            .Define("ev_temp", f"make_synthetic_event({args.seed}, {first_event} + rdfentry_, \
+                    {args.mean_jets}, {args.photon_fraction}, {args.z_fraction})")
+            .Define("run", f"(unsigned int){run}")
+            .Define("luminosityBlock", f"(unsigned int)(1 + rdfentry_ / {events_per_lumi})")
+            .Define("event", f"(unsigned long long)({first_event} + rdfentry_)")
+            .Define("nJet", "(int)ev_temp.jet_pt.size()")
+            .Define("nMuon", "(int)ev_temp.muon_pt.size()")
+            .Define("nPhoton", "(int)ev_temp.photon_pt.size()")
+    )
+    for column, member in event_columns.items():
+        rdf = rdf.Define(column, f"ev_temp.{member}")
+    for flag in get_Flags():
+        rdf = rdf.Define(flag, "ev_temp.flags")
+    for trigger in triggers:
+        rdf = rdf.Define(trigger, f"bool({get_trigger_expression(trigger)})")
+
+    columns = ["run", "luminosityBlock", "event", "nJet", "nMuon", "nPhoton"] + \
+            list(event_columns) + get_Flags() + triggers
+    rdf.Snapshot("Events", path, columns)
+
+    snapshot_options = ROOT.RDF.RSnapshotOptions()
+    snapshot_options.fMode = "UPDATE"
+    (ROOT.RDataFrame(1).Define("run", f"(unsigned int){run}")
+            .Snapshot("Runs", path, ["run"], snapshot_options))
+    (ROOT.RDataFrame(lumis_per_run).Define("run", f"(unsigned int){run}")
+            .Define("luminosityBlock", "(unsigned int)(1 + rdfentry_)")
+            .Snapshot("LuminosityBlocks", path, ["run", "luminosityBlock"], snapshot_options))
+
+def write_golden_json(path, runs, lumis_per_run, bad_lumi_fraction, rng):
+    """
+    Certify all runs but the last one, with randomly removed lumisections
+    """
+    golden = {}
+    for run in runs[:-1]:
+        good = rng.random(lumis_per_run) >= bad_lumi_fraction
+        ranges = []
+        for lumi in np.flatnonzero(good) + 1:
+            if ranges and ranges[-1][1] == lumi - 1:
+                ranges[-1][1] = int(lumi)
+            else:
+                ranges.append([int(lumi), int(lumi)])
+        golden[str(run)] = ranges
+
+    with open(path, "w") as f:
+        json.dump(golden, f)
+
+def formula(expression, variables):
+    return {"nodetype": "formula", "expression": expression, "parser": "TFormula",
+            "variables": variables}
+
+def variable(name, type="real"):
+    return {"name": name, "type": type}
+
+def write_jec(path, rng):
+    """
+    correctionlib compound L1L2L3Res stack with the inputs of the real ones
+    """
+    eta_edges = get_bins()["eta"]["bins"].tolist()
+    n_eta = len(eta_edges) - 1
+    corrections = [
+        {"name": f"{JEC_STACK}_L1FastJet", "version": 1,
+         "inputs": [variable("JetA"), variable("JetEta"), variable("JetPt"), variable("Rho")],
+         "output": variable("correction"),
+         "data": formula("max(0.5,1-0.3*x*(y-1.5)/z)", ["JetA", "Rho", "JetPt"])},
+        {"name": f"{JEC_STACK}_L2Relative", "version": 1,
+         "inputs": [variable("JetEta"), variable("JetPt")],
+         "output": variable("correction"),
+         "data": {"nodetype": "binning", "input": "JetEta", "edges": eta_edges, "flow": "clamp",
+                  "content": [formula(f"{a:.4f}+{b:.4f}/log10(max(x,10.0))", ["JetPt"])
+                              for a, b in zip(rng.uniform(0.95, 1.15, n_eta),
+                                              rng.uniform(0.0, 0.2, n_eta))]}},
+        {"name": f"{JEC_STACK}_L2L3Residual", "version": 1,
+         "inputs": [variable("JetEta"), variable("JetPt")],
+         "output": variable("correction"),
+         "data": {"nodetype": "binning", "input": "JetEta", "edges": eta_edges, "flow": "clamp",
+                  "content": rng.uniform(0.98, 1.02, n_eta).tolist()}},
+    ]
+    compound = {"name": JEC_STACK,
+                "inputs": [variable("JetA"), variable("JetEta"), variable("JetPhi"),
+                           variable("JetPt"), variable("Rho")],
+                "output": variable("correction"),
+                "inputs_update": ["JetPt"], "input_op": "*", "output_op": "*",
+                "stack": [c["name"] for c in corrections]}
+
+    with open(path, "w") as f:
+        json.dump({"schema_version": 2, "corrections": corrections,
+                   "compound_corrections": [compound]}, f)
+
+def write_vetomap(path, rng, veto_fraction=0.02):
+    """
+    Vetomap with non-uniform eta and uniform phi bins, like the real ones
+    """
+    eta_edges = get_bins()["eta"]["bins"].tolist()
+    n_phi = 72
+    content = np.where(rng.random((len(eta_edges) - 1) * n_phi) < veto_fraction, 100.0, 0.0)
+    vetomap = {"nodetype": "multibinning", "inputs": ["eta", "phi"], "flow": "clamp",
+               "edges": [eta_edges, {"n": n_phi, "low": -np.pi, "high": np.pi}],
+               "content": content.tolist()}
+    correction = {"name": VETOMAP_SET, "version": 1,
+                  "inputs": [variable("type", "string"), variable("eta"), variable("phi")],
+                  "output": variable("vetomap"),
+                  "data": {"nodetype": "category", "input": "type",
+                           "content": [{"key": "jetvetomap", "value": vetomap}]}}
+
+    with open(path, "w") as f:
+        json.dump({"schema_version": 2, "corrections": [correction]}, f)
+
+def generate(args):
+    """
+    Write synthetic NanoAOD files, one per run, with a matching golden
+    JSON, JECs, vetomap and correction JSON into args.out. Returns a dict
+    with the paths of the written files.
+    """
+    load_kernels("synthetic")
+    os.makedirs(args.out, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    triggers = get_triggers()
+
+    runs = [FIRST_RUN + i for i in range(args.n_runs)]
+    files = []
+    for i, run in enumerate(runs):
+        path = get_store_path(args.out, run, i)
+        write_file(path, run, args.lumis_per_run, args.events_per_lumi,
+                   i * args.lumis_per_run * args.events_per_lumi, args, triggers)
+        files.append(path)
+        print(f"Wrote {path}")
+
+    paths = {
+        "files": files,
+        "filelist": os.path.join(args.out, "files.txt"),
+        "golden_json": os.path.join(args.out, "golden.json"),
+        "jec": os.path.join(args.out, "jec.json"),
+        "vetomap": os.path.join(args.out, "vetomap.json"),
+        "correction_json": os.path.join(args.out, "corrections.json"),
+        "correction_key": CORRECTION_KEY,
+        "n_events": len(runs) * args.lumis_per_run * args.events_per_lumi,
+    }
+    with open(paths["filelist"], "w") as f:
+        f.write("\n".join(files) + "\n")
+    write_golden_json(paths["golden_json"], runs, args.lumis_per_run, args.bad_lumi_fraction, rng)
+    write_jec(paths["jec"], rng)
+    write_vetomap(paths["vetomap"], rng)
+    with open(paths["correction_json"], "w") as f:
+        json.dump({CORRECTION_KEY: {
+            "jec_path": paths["jec"],
+            "jec_stack": JEC_STACK,
+            "jec_cols": "Jet_rawPt,Jet_eta,Rho_fixedGridRhoFastjetAll,Jet_area,Jet_phi",
+            "vetomap_path": paths["vetomap"],
+            "vetomap_set": VETOMAP_SET,
+        }}, f, indent=4)
+    with open(os.path.join(args.out, "synthetic.json"), "w") as f:
+        json.dump(paths, f, indent=4)
+
+    return paths
+
+def run(args):
+    # Shut up ROOT
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+    paths = generate(args)
+    print(f"Generated {paths['n_events']} events in {len(paths['files'])} files, "
+          f"see {os.path.join(args.out, 'synthetic.json')}")
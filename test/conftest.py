@@ -0,0 +1,12 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# The tested functions do not call ROOT, so the modules importing it can be
+# tested without a ROOT installation
+try:
+    import ROOT
+except ImportError:
+    sys.modules["ROOT"] = types.ModuleType("ROOT")
@@ -1,5 +1,13 @@
 #!/bin/bash
 
+# Unit tests of the pure Python logic, they do not need ROOT
+python3 -m pytest -q test
+RET=$?
+if [ $RET -ne 0 ]; then
+  echo "Unit tests failed with exit code $RET"
+  exit $RET
+fi
+
 for test_script in test/*.sh; do
   if [ "$test_script" != "test/run_all_tests.sh" ]; then
     bash "$test_script"
@@ -0,0 +1,28 @@
+import pytest
+
+from catalog import get_run_range, get_step_lumis
+
+LUMIS = {"a": {(1, 1), (1, 2)}, "b": {(1, 2), (1, 3)}, "c": {(1, 3), (2, 1)}}
+
+def test_get_step_lumis():
+    files = sorted(LUMIS)
+    # Lumisections split between the steps count once
+    steps = [["a", "c"], ["b"]]
+    lumis = [get_step_lumis(files, step, LUMIS.get) for step in steps]
+    assert lumis == [{(1, 1), (1, 2), (2, 1)}, {(1, 3)}]
+    assert get_step_lumis(files, files, LUMIS.get) == set.union(*LUMIS.values())
+
+def test_get_step_lumis_reads_up_to_the_step():
+    read = []
+    def get_lumis(file):
+        read.append(file)
+        return LUMIS[file]
+    get_step_lumis(sorted(LUMIS), ["b"], get_lumis)
+    assert read == ["a", "b"]
+
+def test_get_run_range():
+    infos = [{"min_run": 385836, "max_run": 385840}, {"min_run": None, "max_run": None},
+             {"min_run": 385830, "max_run": 385837}]
+    assert get_run_range(infos) == (385830, 385840)
+    with pytest.raises(ValueError, match="None of the 1 catalogued files"):
+        get_run_range(infos[1:2])
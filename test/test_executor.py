@@ -0,0 +1,21 @@
+import pytest
+
+from executor import balance_files, parse_executor
+
+def test_parse_executor():
+    assert parse_executor("threads") == ("threads", None)
+    assert parse_executor("processes:4") == ("processes", 4)
+    for value in ["processes", "processes:0", "processes:x", "pool:2"]:
+        with pytest.raises(ValueError):
+            parse_executor(value)
+
+def test_balance_files():
+    sizes = {"a": 5, "b": 4, "c": 3, "d": 3, "e": 1}
+    groups = balance_files(list(sizes), 2, sizes.get)
+    assert sorted(f for group in groups for f in group) == sorted(sizes)
+    loads = [sum(sizes[f] for f in group) for group in groups]
+    assert max(loads) - min(loads) <= 1
+
+def test_balance_files_fewer_files_than_groups():
+    groups = balance_files(["a", "b"], 4, lambda f: 1)
+    assert sorted(groups) == [["a"], ["b"]]
@@ -0,0 +1,26 @@
+import pytest
+
+from lumi_index import read_brilcalc_csv
+
+HEADER = "#run:fill,ls,time,beamstatus,E(GeV),{delivered},{recorded},avgpu,source\n"
+
+def write_csv(tmp_path, unit):
+    path = tmp_path / "lumi.csv"
+    path.write_text("#Data tag : 24v1 , Norm tag: None\n"
+                    + HEADER.format(delivered=f"delivered({unit})", recorded=f"recorded({unit})")
+                    + "385836:9876,12:12,07/23/24 10:00:00,STABLE BEAMS,6800,2.0,1.5,60.5,HFET\n"
+                    + "#Summary:\n")
+    return path
+
+def test_read_brilcalc_csv_fb(tmp_path):
+    assert read_brilcalc_csv(write_csv(tmp_path, "/fb")) == [(385836, 12, 2.0, 1.5, 60.5)]
+
+def test_read_brilcalc_csv_units(tmp_path):
+    (run, ls, delivered, recorded, avgpu), = read_brilcalc_csv(write_csv(tmp_path, "/ub"))
+    assert (run, ls, avgpu) == (385836, 12, 60.5)
+    assert delivered == pytest.approx(2.0e-9)
+    assert recorded == pytest.approx(1.5e-9)
+
+def test_read_brilcalc_csv_unknown_unit(tmp_path):
+    with pytest.raises(ValueError):
+        read_brilcalc_csv(write_csv(tmp_path, "/xb"))
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from merge import add_histogram, get_binning
+
+class FakeArray:
+    """
+    TArrayD of the variable bin edges
+    """
+    def __init__(self, values=()):
+        self.values = np.array(values, dtype=np.float64)
+
+    def GetSize(self):
+        return len(self.values)
+
+    def GetArray(self):
+        return self.values
+
+class FakeAxis:
+    def __init__(self, nbins, xmin, xmax, edges=()):
+        self.nbins, self.xmin, self.xmax, self.edges = nbins, xmin, xmax, FakeArray(edges)
+
+    def GetNbins(self):
+        return self.nbins
+
+    def GetXmin(self):
+        return self.xmin
+
+    def GetXmax(self):
+        return self.xmax
+
+    def GetXbins(self):
+        return self.edges
+
+class FakeHist:
+    def __init__(self, cls, *axes):
+        self.cls, self.axes = cls, list(axes)
+
+    def ClassName(self):
+        return self.cls
+
+    def GetDimension(self):
+        return len(self.axes)
+
+    def GetXaxis(self):
+        return self.axes[0]
+
+    def GetYaxis(self):
+        return self.axes[1] if len(self.axes) > 1 else FakeAxis(1, 0, 1)
+
+    def GetZaxis(self):
+        return self.axes[2] if len(self.axes) > 2 else FakeAxis(1, 0, 1)
+
+def test_get_binning():
+    hist = FakeHist("TH2D", FakeAxis(3, 0, 3, [0, 1, 2, 3]), FakeAxis(10, 0, 1))
+    assert get_binning(hist) == ["TH2D", (3, 0, 3, (0.0, 1.0, 2.0, 3.0)), (10, 0, 1, ())]
+
+@pytest.mark.parametrize("other", [
+    FakeHist("TH1F", FakeAxis(3, 0, 3, [0, 1, 2, 3])),
+    FakeHist("TH1D", FakeAxis(4, 0, 3, [0, 1, 2, 2.5, 3])),
+    FakeHist("TH1D", FakeAxis(3, 0, 3, [0, 1, 2.5, 3])),
+    FakeHist("TH1D", FakeAxis(3, 0, 3)),
+    FakeHist("TH2D", FakeAxis(3, 0, 3, [0, 1, 2, 3]), FakeAxis(10, 0, 1)),
+])
+def test_add_histogram_binning(other):
+    hist = FakeHist("TH1D", FakeAxis(3, 0, 3, [0, 1, 2, 3]))
+    with pytest.raises(ValueError, match="Binning of h in other.root differs"):
+        add_histogram(hist, other, "h", "other.root")
@@ -0,0 +1,31 @@
+import pytest
+
+from metadata import get_trigger_filter, get_trigger_mask
+
+BITS = ["HLT_ZeroBias", "HLT_PFJet40", "HLT_PFJet80"]
+
+def test_trigger_filter_without_mask():
+    assert get_trigger_filter(["HLT_PFJet40", "HLT_PFJet80"]) == "HLT_PFJet40 || HLT_PFJet80"
+
+def test_trigger_filter_mask():
+    assert get_trigger_filter(["HLT_PFJet40", "HLT_PFJet80"], BITS) == "(trigger_mask & 6ULL) != 0"
+    assert get_trigger_filter(["HLT_ZeroBias"], BITS, "bits") == "(bits & 1ULL) != 0"
+
+def test_trigger_mask():
+    assert get_trigger_mask(["A", "B"]) == "(ULong64_t(bool(A)) << 0) | (ULong64_t(bool(B)) << 1)"
+    with pytest.raises(ValueError):
+        get_trigger_mask([f"T{i}" for i in range(65)])
+
+def test_trigger_filter_regions():
+    region = "HLT_PFJet80 && (Tag_pt >= 90 && Tag_pt < 150) || (Probe_pt >= 90 && Probe_pt < 150)"
+    assert get_trigger_filter([region, "HLT_ZeroBias"], BITS) == \
+            "(((trigger_mask >> 2) & 1) && (Tag_pt >= 90 && Tag_pt < 150) " \
+            "|| (Probe_pt >= 90 && Probe_pt < 150)) || (((trigger_mask >> 0) & 1))"
+
+def test_trigger_filter_missing_path():
+    with pytest.raises(ValueError):
+        get_trigger_filter(["HLT_PFJet60"], BITS)
+    with pytest.raises(ValueError):
+        get_trigger_filter(["HLT_PFJet60 && (Tag_pt >= 70)"], BITS)
+    with pytest.raises(ValueError):
+        get_trigger_filter([], BITS)
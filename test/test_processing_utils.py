@@ -0,0 +1,30 @@
+import pytest
+
+from processing_utils import expand_slices, get_slices
+
+def make_config(**extra):
+    config = {"type": "SlicedProfile1D", "name": "MPF_tag_eta", "x_val": "Tag_eta",
+              "y_val": "MPF", "slice_var": "Tag_pt", "slice_edges": "50, 110, 230, inf"}
+    config.update(extra)
+    return config
+
+def test_get_slices():
+    assert get_slices(make_config()) == [("pt50to110", 50.0, 110.0), ("pt110to230", 110.0, 230.0),
+                                         ("pt230", 230.0, float("inf"))]
+
+def test_get_slices_names():
+    slices = get_slices(make_config(slice_names="low, mid, high"))
+    assert [name for name, _, _ in slices] == ["low", "mid", "high"]
+    with pytest.raises(ValueError):
+        get_slices(make_config(slice_names="low, high"))
+
+def test_expand_slices():
+    expanded = expand_slices({"MPF": make_config(cut="Tag_eta < 1.3"), "Other": {"type": "Histo1D"}})
+    assert list(expanded) == ["MPF_tag_eta_pt50to110", "MPF_tag_eta_pt110to230",
+                              "MPF_tag_eta_pt230", "Other"]
+    first = expanded["MPF_tag_eta_pt50to110"]
+    assert first["type"] == "Profile1D"
+    assert not any(key.startswith("slice_") for key in first)
+    # Slices include their lower edge, like the bins of the Profile2D
+    assert first["cut"] == "(Tag_eta < 1.3) && Tag_pt >= 50.0 && Tag_pt < 110.0"
+    assert expanded["MPF_tag_eta_pt230"]["cut"] == "(Tag_eta < 1.3) && Tag_pt >= 230.0"
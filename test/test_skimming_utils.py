@@ -0,0 +1,87 @@
+import numpy as np
+
+import skimming_utils
+from skimming_utils import get_golden_clusters, get_run_from_path, intersect_ranges, plan_golden_files
+
+def store_path(run, name="x"):
+    run = f"{run:09d}"
+    return f"/store/data/Run2024H/JetMET0/NANOAOD/PromptReco-v1/{run[:3]}/{run[3:6]}/{run[6:]}/00000/{name}.root"
+
+class FakeLumiMask:
+    def __init__(self, lumis):
+        self.lumis = lumis
+
+    def hasRun(self, run):
+        return run in self.lumis
+
+    def accept(self, run, lumi):
+        return lumi in self.lumis.get(run, ())
+
+def test_get_run_from_path():
+    assert get_run_from_path(store_path(385836)) == 385836
+    assert get_run_from_path("/data/local/x.root") is None
+
+def test_plan_golden_files_runs(monkeypatch):
+    monkeypatch.setattr(skimming_utils, "load_lumi_mask",
+                        lambda json_file: FakeLumiMask({385836: range(1, 11)}))
+    files = [store_path(385836), store_path(385837), "/data/local/x.root"]
+    kept, entry_ranges = plan_golden_files(files, files, "golden.json")
+    # Files without a run in their path cannot be dropped without opening them
+    assert kept == [files[0], files[2]]
+    assert entry_ranges == {}
+
+def test_plan_golden_files_catalog(monkeypatch):
+    monkeypatch.setattr(skimming_utils, "load_lumi_mask",
+                        lambda json_file: FakeLumiMask({385836: range(1, 11)}))
+    good, bad, other_run = store_path(385836, "good"), store_path(385836, "bad"), store_path(385837)
+    infos = {good: {"lumis": {"385836": [(1, 5), (8, 10)]}, "entries": 1000, "size": 10},
+             bad: {"lumis": {"385836": [(11, 20)]}, "entries": 500, "size": 20},
+             other_run: {"lumis": {"385837": [(1, 10)]}, "entries": 100, "size": 30}}
+    files = [good, bad, other_run]
+    kept, entry_ranges = plan_golden_files(files, files, "golden.json", read_lumis=True,
+                                           infos=infos)
+    assert kept == [good]
+    assert entry_ranges == {good: [(0, 1000)]}
+
+def test_intersect_ranges():
+    assert intersect_ranges(None, None) is None
+    assert intersect_ranges(None, [(0, 10)]) == [(0, 10)]
+    assert intersect_ranges([(0, 10)], None) == [(0, 10)]
+    assert intersect_ranges([(0, 10), (20, 30)], [(5, 25)]) == [(5, 10), (20, 25)]
+    assert intersect_ranges([(0, 10)], [(10, 20)]) == []
+    assert intersect_ranges([(0, 100)], [(10, 20), (30, 40)]) == [(10, 20), (30, 40)]
+
+class FakeClusterIterator:
+    def __init__(self, starts, n_entries):
+        self.starts, self.n_entries, self.i = starts, n_entries, -1
+
+    def __call__(self):
+        self.i += 1
+        return self.starts[self.i] if self.i < len(self.starts) else self.n_entries
+
+    def GetNextEntry(self):
+        return self.starts[self.i + 1] if self.i + 1 < len(self.starts) else self.n_entries
+
+class FakeTree:
+    def __init__(self, starts, n_entries):
+        self.starts, self.n_entries = starts, n_entries
+
+    def GetEntries(self):
+        return self.n_entries
+
+    def GetClusterIterator(self, entry):
+        return FakeClusterIterator(self.starts, self.n_entries)
+
+def test_get_golden_clusters():
+    tree = FakeTree([0, 10, 20, 30], 40)
+    good = np.zeros(40, dtype=bool)
+    good[[3, 15, 35]] = True
+    assert get_golden_clusters(tree, good) == [(0, 20), (30, 40)]
+
+def test_get_golden_clusters_unordered():
+    # Flags of a multithreaded AsNumpy, with the clusters out of order
+    tree = FakeTree([0, 10, 20, 30], 40)
+    entries = np.concatenate([np.arange(20, 30), np.arange(0, 10), np.arange(30, 40),
+                              np.arange(10, 20)])
+    good = np.isin(entries, [25])
+    assert get_golden_clusters(tree, good, entries) == [(20, 30)]
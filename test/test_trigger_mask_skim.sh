@@ -0,0 +1,86 @@
+#!/bin/bash
+source /cvmfs/sft.cern.ch/lcg/views/LCG_107a/x86_64-el9-gcc14-opt/setup.sh
+
+# Skim synthetic NanoAOD with the HLT branches and with a packed trigger
+# mask, and check that hist --per_trigger fills the same histograms from both
+
+python3 src/main.py synthetic \
+  --out out_synthetic \
+  --n_runs 2 \
+  --lumis_per_run 10
+
+RET=$?
+
+if [ $RET -ne 0 ]; then
+  exit $RET
+fi
+
+for layout in branches mask; do
+  if [ "$layout" == "mask" ]; then
+    MASK="--trigger_mask"
+  else
+    MASK=""
+  fi
+
+  python3 src/main.py skim \
+    --filepath out_synthetic/files.txt \
+    --golden_json out_synthetic/golden.json \
+    --triggerpath data/triggerlists/JME_triggers_skim.txt \
+    --out out_skim_$layout \
+    --channel dijet \
+    --is_local \
+    --nThreads 4 \
+    $MASK
+
+  RET=$?
+
+  if [ $RET -ne 0 ]; then
+    exit $RET
+  fi
+
+  python3 src/main.py hist \
+    -hconf data/histograms/JME_histograms.ini \
+    -fl out_skim_$layout/J4PSkim_dijet.root \
+    --triggerpath data/triggerlists/JME_triggers.txt \
+    --per_trigger \
+    -loc \
+    --nThreads 4 \
+    --out out_hist_$layout \
+    --run_tag $layout
+
+  RET=$?
+
+  if [ $RET -ne 0 ]; then
+    exit $RET
+  fi
+done
+
+python3 - <<EOF
+import ROOT
+
+def get_entries(path):
+    entries = {}
+    f = ROOT.TFile.Open(path)
+    def walk(directory, prefix):
+        for key in directory.GetListOfKeys():
+            obj = key.ReadObj()
+            if obj.InheritsFrom("TDirectory"):
+                walk(obj, prefix + key.GetName() + "/")
+            elif obj.InheritsFrom("TH1"):
+                entries[prefix + key.GetName()] = obj.GetEntries()
+    walk(f, "")
+    f.Close()
+    return entries
+
+branches = get_entries("out_hist_branches/J4PHists_branches.root")
+mask = get_entries("out_hist_mask/J4PHists_mask.root")
+assert branches.keys() == mask.keys(), "Different histograms for the two skim layouts"
+assert sum(branches.values()) > 0, "No entries in the histograms"
+different = [name for name in branches if branches[name] != mask[name]]
+assert not different, f"Different entries for {', '.join(different[:5])}"
+print(f"{len(branches)} histograms agree between the two skim layouts")
+EOF
+
+RET=$?
+
+exit $RET